@@ -0,0 +1,225 @@
+# Copia idéntica en adquisicion, analisis e historial_ui (app/binario.py): cada servicio es su
+# propio contexto de build. Se edita en todas a la vez;
+# analisis/tests/test_copias.py falla si difieren.
+
+import struct
+from datetime import datetime, timezone
+from functools import reduce
+from operator import or_
+
+import numpy as np
+
+# Formato binario compacto y opcional para muestras y diagnósticos (el JSON
+# sigue siendo el default). Un cuerpo es:
+#
+#   cabecera  <4sBHI: magia, tipo, bytes de la tabla de textos, n registros
+#   textos    ids (y estados / razones) en UTF-8 separados por "\n"
+#   registros n registros de ancho fijo (DTYPES[tipo]), little-endian
+#
+# Los registros guardan índices a la tabla de textos (cada machine_id se
+# manda una vez por cuerpo) y el ts como epoch en milisegundos. Se leen con
+# np.frombuffer sobre el cuerpo del request, sin copiar.
+TIPO_CONTENIDO = "application/x-actuadores"
+
+MAGIA = b"ACT1"
+CABECERA = struct.Struct("<4sBHI")
+
+MUESTRAS, DIAGNOSTICOS = 0, 1
+
+DTYPES = {
+    MUESTRAS: np.dtype([
+        ("ts_ms", "<i8"), ("maquina", "<u2"), ("actuador", "<u2"),
+        ("motor_temp_c", "<f8"), ("motor_rpm", "<f8"), ("motor_vibration_rms", "<f8"),
+    ]),
+    # razones: bit i = textos[i] (el codificador pone las razones primero)
+    DIAGNOSTICOS: np.dtype([
+        ("ts_ms", "<i8"), ("maquina", "<u2"), ("actuador", "<u2"), ("estado", "<u2"), ("razones", "<u4"),
+        ("temp_mean", "<f8"), ("temp_std", "<f8"), ("rpm_mean", "<f8"), ("rpm_std", "<f8"), ("vib_rms", "<f8"),
+    ]),
+}
+
+METRICAS_MUESTRA = ("motor_temp_c", "motor_rpm", "motor_vibration_rms")
+METRICAS_DIAGNOSTICO = ("temp_mean", "temp_std", "rpm_mean", "rpm_std", "vib_rms")
+
+MAX_RAZONES = 32
+
+
+def es_binario(content_type) -> bool:
+    return (content_type or "").split(";")[0].strip().lower() == TIPO_CONTENIDO
+
+
+def ts_a_ms(texto: str) -> int:
+    """
+    ts ISO-8601 -> epoch en ms (sin zona se asume UTC). Lanza ValueError.
+    """
+    t = datetime.fromisoformat(texto)
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=timezone.utc)
+    return round(t.timestamp() * 1000)
+
+
+def ms_a_ts(ms: int) -> str:
+    # Mismo formato que el CSV; milisegundos sólo si los hay
+    t = datetime.fromtimestamp(ms / 1000, timezone.utc)
+    if ms % 1000:
+        return t.strftime("%Y-%m-%dT%H:%M:%S.") + f"{ms % 1000:03d}Z"
+    return t.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class _Textos:
+    def __init__(self, primeros=()):
+        self.lista = list(primeros)
+        self.indice = {t: i for i, t in enumerate(self.lista)}
+
+    def __call__(self, texto: str) -> int:
+        i = self.indice.get(texto)
+        if i is None:
+            if "\n" in texto:
+                raise ValueError(f"texto con salto de línea: {texto!r}")
+            i = self.indice[texto] = len(self.lista)
+            self.lista.append(texto)
+        return i
+
+    def bytes(self) -> bytes:
+        datos = "\n".join(self.lista).encode("utf-8")
+        if len(datos) > 0xFFFF:
+            raise ValueError("tabla de textos demasiado grande para un cuerpo")
+        return datos
+
+
+def _ts_ms(valores: list) -> list:
+    # Un lote comparte pocos ts distintos: se convierte cada uno una vez
+    cache = {}
+    return [cache[t] if t in cache else cache.setdefault(t, ts_a_ms(t)) for t in valores]
+
+
+def _cuerpo(tipo: int, textos: _Textos, registros: np.ndarray) -> bytes:
+    datos = textos.bytes()
+    return CABECERA.pack(MAGIA, tipo, len(datos), len(registros)) + datos + registros.tobytes()
+
+
+def codificar_muestras(muestras: list) -> bytes:
+    """
+    Lista de muestras (dicts como en JSON) -> cuerpo binario. Lanza
+    ValueError si algún ts no es ISO-8601 (quien envía cae a JSON).
+    """
+    claves = ("ts", "machine_id", "actuator_id") + METRICAS_MUESTRA
+    return codificar_columnas_muestras({k: [m[k] for m in muestras] for k in claves})
+
+
+def codificar_columnas_muestras(columnas: dict) -> bytes:
+    """
+    Muestras en columnas (una lista por campo, como columnas_muestras) ->
+    cuerpo binario, sin pasar por un dict por fila.
+    """
+    textos = _Textos()
+    regs = np.empty(len(columnas["ts"]), dtype=DTYPES[MUESTRAS])
+    regs["ts_ms"] = _ts_ms(columnas["ts"])
+    regs["maquina"] = [textos(m) for m in columnas["machine_id"]]
+    regs["actuador"] = [textos(a) for a in columnas["actuator_id"]]
+    for c in METRICAS_MUESTRA:
+        regs[c] = columnas[c]
+    return _cuerpo(MUESTRAS, textos, regs)
+
+
+def codificar_diagnosticos(diagnosticos: list) -> bytes:
+    razones = sorted({r for d in diagnosticos for r in d["reasons"]})
+    if len(razones) > MAX_RAZONES:
+        raise ValueError(f"más de {MAX_RAZONES} razones distintas en un cuerpo")
+    textos = _Textos(razones)
+    regs = np.empty(len(diagnosticos), dtype=DTYPES[DIAGNOSTICOS])
+    regs["ts_ms"] = _ts_ms([d["ts"] for d in diagnosticos])
+    regs["maquina"] = [textos(d["machine_id"]) for d in diagnosticos]
+    regs["actuador"] = [textos(d["actuator_id"]) for d in diagnosticos]
+    regs["estado"] = [textos(d["state"]) for d in diagnosticos]
+    # OR y no suma: una razón repetida no debe caer en otro bit
+    regs["razones"] = [reduce(or_, (1 << textos.indice[r] for r in d["reasons"]), 0) for d in diagnosticos]
+    for c in METRICAS_DIAGNOSTICO:
+        regs[c] = [float(d["metrics"].get(c, 0)) for d in diagnosticos]
+    return _cuerpo(DIAGNOSTICOS, textos, regs)
+
+
+def decodificar(cuerpo: bytes, tipo: int):
+    """
+    Cuerpo binario -> (textos, registros). registros es una vista numpy
+    sobre `cuerpo` (sin copia). Valida todo de una vez, por columnas:
+    tamaños, índices a la tabla de textos y números finitos. Lanza
+    ValueError con el detalle.
+    """
+    if len(cuerpo) < CABECERA.size:
+        raise ValueError("cuerpo binario truncado")
+    magia, tipo_cuerpo, largo, n = CABECERA.unpack_from(cuerpo)
+    if magia != MAGIA:
+        raise ValueError("cuerpo binario con magia desconocida")
+    if tipo_cuerpo != tipo:
+        raise ValueError(f"cuerpo binario de tipo {tipo_cuerpo}, se esperaba {tipo}")
+    dtype = DTYPES[tipo]
+    inicio = CABECERA.size + largo
+    if len(cuerpo) != inicio + n * dtype.itemsize:
+        raise ValueError(f"cuerpo binario de {len(cuerpo)} bytes no calza con {n} registros")
+
+    try:
+        textos = bytes(cuerpo[CABECERA.size:inicio]).decode("utf-8").split("\n") if largo else []
+    except UnicodeDecodeError as e:
+        raise ValueError(f"tabla de textos inválida: {e}")
+    regs = np.frombuffer(cuerpo, dtype=dtype, count=n, offset=inicio)
+    if not n:
+        return textos, regs
+
+    indices = ("maquina", "actuador", "estado") if tipo == DIAGNOSTICOS else ("maquina", "actuador")
+    for c in indices:
+        if int(regs[c].max()) >= len(textos):
+            raise ValueError(f"{c} fuera de la tabla de textos")
+    metricas = METRICAS_DIAGNOSTICO if tipo == DIAGNOSTICOS else METRICAS_MUESTRA
+    for c in metricas:
+        if not np.isfinite(regs[c]).all():
+            raise ValueError(f"{c} con valores no finitos")
+    if tipo == DIAGNOSTICOS and len(textos) < MAX_RAZONES and (regs["razones"] >> len(textos)).any():
+        raise ValueError("razones fuera de la tabla de textos")
+    return textos, regs
+
+
+def _ts(regs: np.ndarray) -> list:
+    # Un lote comparte pocos ts distintos: se formatea cada uno una vez
+    unicos, inversa = np.unique(regs["ts_ms"], return_inverse=True)
+    return np.array([ms_a_ts(int(ms)) for ms in unicos], dtype=object)[inversa].tolist()
+
+
+def columnas_muestras(textos: list, regs: np.ndarray) -> dict:
+    """
+    Registros -> columnas como listas de Python (ts ISO, ids como texto).
+    """
+    tabla = np.array(textos, dtype=object)
+    columnas = {
+        "ts": _ts(regs),
+        "machine_id": tabla[regs["maquina"]].tolist(),
+        "actuator_id": tabla[regs["actuador"]].tolist(),
+    }
+    for c in METRICAS_MUESTRA:
+        columnas[c] = regs[c].tolist()
+    return columnas
+
+
+def columnas_diagnosticos(textos: list, regs: np.ndarray) -> dict:
+    tabla = np.array(textos, dtype=object)
+    unicas, inversa = np.unique(regs["razones"], return_inverse=True)
+    listas = [[textos[i] for i in range(min(len(textos), MAX_RAZONES)) if int(m) >> i & 1] for m in unicas]
+    columnas = {
+        "ts": _ts(regs),
+        "machine_id": tabla[regs["maquina"]].tolist(),
+        "actuator_id": tabla[regs["actuador"]].tolist(),
+        "state": tabla[regs["estado"]].tolist(),
+        "reasons": [listas[i] for i in inversa.tolist()],
+    }
+    for c in METRICAS_DIAGNOSTICO:
+        columnas[c] = regs[c].tolist()
+    return columnas
+
+
+def muestras(textos: list, regs: np.ndarray) -> list:
+    """
+    Registros -> lista de muestras (dicts con la misma forma que el JSON).
+    """
+    c = columnas_muestras(textos, regs)
+    claves = ("ts", "machine_id", "actuator_id") + METRICAS_MUESTRA
+    return [dict(zip(claves, fila)) for fila in zip(*(c[k] for k in claves))]
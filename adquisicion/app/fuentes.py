@@ -0,0 +1,404 @@
+import asyncio
+import glob
+import os
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+from app import metricas
+from app.lector import abrir, parsear_ts, COLUMNAS_TEXTO, COLUMNAS_NUM
+from app.spool import SpoolLleno
+
+# Orden de columnas esperado en fuentes de texto sin encabezado (socket / stdin)
+COLUMNAS = COLUMNAS_TEXTO + COLUMNAS_NUM
+
+
+def parsear_linea(linea: str, columnas=COLUMNAS):
+    campos = linea.strip().split(",")
+    if len(campos) != len(columnas):
+        return None
+    m = dict(zip(columnas, campos))
+    try:
+        for c in COLUMNAS_NUM:
+            m[c] = float(m[c])
+    except ValueError:
+        return None
+    return m
+
+
+H_SPOOL = metricas.histograma("adquisicion_spool_agregar_seconds", "Escritura de un lote al spool (incluye espera del pool)")
+
+
+class Fuente(ABC):
+    """
+    Una fuente de muestras con su propio ritmo, pausa y contadores.
+    Corre como tarea asyncio; lo bloqueante (parseo, escritura al spool) va
+    al pool de hilos acotado del planificador, nunca un hilo propio por fuente.
+    Los lotes se escriben en el spool durable; el envío HTTP lo hace el
+    drenado del spool, así una caída río abajo no frena ni pierde lecturas.
+    El lote se arma en columnas (una lista por campo de COLUMNAS), igual que
+    los bloques del lector, y así va al spool.
+    """
+
+    tipo = "fuente"
+
+    def __init__(self, id: str, config: dict):
+        self.id = id
+        self.config = config
+        self.corriendo = False
+        self.pausado = False
+        self.terminado = False
+        self.error = None
+        self.encolado_total = 0
+        self.perdido_total = 0
+        self.filas_leidas = 0
+        self.progreso = None
+        self.filas_por_seg = 0.0
+        self.filas_por_seg_media = 0.0
+        self.tarea = None
+        self._lote = {c: [] for c in COLUMNAS}
+        self._n_lote = 0
+        self._inicio_lote = 0.0
+        self._inicio = self._t = time.monotonic()
+        self._n = 0
+
+    def estado(self) -> dict:
+        return {
+            "id": self.id,
+            "tipo": self.tipo,
+            "corriendo": self.corriendo,
+            "pausado": self.pausado,
+            "terminado": self.terminado,
+            "error": self.error,
+            "config": self.config,
+            "encolado_total": self.encolado_total,
+            "perdido_total": self.perdido_total,
+            "filas_leidas": self.filas_leidas,
+            "progreso": self.progreso,
+            "filas_por_seg": self.filas_por_seg,
+            "filas_por_seg_media": self.filas_por_seg_media,
+        }
+
+    async def correr(self, plan):
+        self.corriendo = True
+        self._inicio = self._t = time.monotonic()
+        try:
+            await self.ejecutar(plan)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self.error = str(e)
+            print(f"[adquisicion] Fuente {self.id} falló: {e}")
+        finally:
+            await self.vaciar(plan)
+            self._medir()
+            self.corriendo = False
+            self.pausado = False
+
+    @abstractmethod
+    async def ejecutar(self, plan):
+        """
+        Produce muestras con agregar / agregar_columnas mientras corriendo.
+        """
+
+    async def esperar_reanudar(self, plan):
+        if self.pausado:
+            await self.vaciar(plan)
+        while self.pausado and self.corriendo:
+            await asyncio.sleep(0.2)
+
+    async def agregar(self, plan, muestra: dict, intervalo: float = 0.0):
+        """
+        Acumula la muestra; envía el lote al llegar a config["lote"] o cuando
+        la siguiente fila superaría LOTE_MAX_SEG de espera.
+        """
+        if not self._n_lote:
+            self._inicio_lote = time.monotonic()
+        for c in COLUMNAS:
+            self._lote[c].append(muestra[c])
+        self._n_lote += 1
+
+        espera = time.monotonic() + intervalo - self._inicio_lote
+        if self._n_lote >= self.config["lote"] or espera >= plan.lote_max_seg:
+            await self.vaciar(plan)
+
+    async def agregar_columnas(self, plan, columnas: dict, i: int, n: int, intervalo: float = 0.0):
+        """
+        Como agregar, para las filas [i, n) de columnas ya armadas (p. ej. un
+        bloque del lector): se copian por slices, cortando en lotes de
+        config["lote"], sin armar un dict por fila.
+        """
+        while i < n:
+            if not self._n_lote:
+                self._inicio_lote = time.monotonic()
+            j = min(n, i + self.config["lote"] - self._n_lote)
+            for c in COLUMNAS:
+                self._lote[c].extend(columnas[c][i:j])
+            self._n_lote += j - i
+            i = j
+            espera = time.monotonic() + intervalo - self._inicio_lote
+            if self._n_lote >= self.config["lote"] or espera >= plan.lote_max_seg:
+                await self.vaciar(plan)
+
+    async def vaciar(self, plan):
+        if not self._n_lote:
+            return
+        lote, n = self._lote, self._n_lote
+        self._lote, self._n_lote = {c: [] for c in COLUMNAS}, 0
+        while True:
+            try:
+                t0 = time.perf_counter()
+                await plan.en_pool(plan.spool.agregar, lote)
+                H_SPOOL.observar(time.perf_counter() - t0)
+                self.encolado_total += n
+                break
+            except SpoolLleno as e:
+                # Backpressure: la fuente espera a que el drenado libere espacio
+                if not self.corriendo:
+                    self.perdido_total += n
+                    print(f"[adquisicion] {self.id}: se pierden {n} muestras al detener: {e}")
+                    break
+                await asyncio.sleep(0.5)
+        self._medir()
+
+    def _medir(self):
+        ahora = time.monotonic()
+        dt = ahora - self._t
+        if dt >= 1.0:
+            self.filas_por_seg = round((self.encolado_total - self._n) / dt, 1)
+            self._t, self._n = ahora, self.encolado_total
+        total = ahora - self._inicio
+        if total > 0:
+            self.filas_por_seg_media = round(self.encolado_total / total, 1)
+
+
+class FuenteCSV(Fuente):
+    """
+    Un archivo CSV (plano, .gz o .zst). Modo demo (loop infinito) o replay
+    (una pasada) con velocidad y rangos de filas / ts.
+    """
+
+    tipo = "csv"
+
+    async def ejecutar(self, plan):
+        cfg = self.config
+        velocidad = cfg["velocidad"]
+        intervalo = cfg["intervalo_seg"] / velocidad if velocidad > 0 else 0.0
+        fila_desde, fila_hasta = cfg["fila_desde"], cfg["fila_hasta"]
+        ts_desde, ts_hasta = parsear_ts(cfg["ts_desde"]), parsear_ts(cfg["ts_hasta"])
+
+        lector = await plan.en_pool(abrir, cfg["ruta"])
+        bytes_total = max(lector.tamano, 1)
+        self.progreso = 0.0
+
+        while self.corriendo:
+            proxima = time.monotonic()
+            # El lector salta directo a fila_desde / ts_desde con su índice disperso
+            bloques = lector.bloques(fila_desde, ts_desde)
+            while self.corriendo:
+                bloque = await plan.en_pool(next, bloques, None)
+                if bloque is None:
+                    break
+                if fila_hasta is not None and bloque.fila0 >= fila_hasta:
+                    break
+
+                # Filas del bloque en [fila_desde, fila_hasta), numeradas por
+                # línea física como el índice del lector
+                a = bloque.indice(fila_desde)
+                b = bloque.indice(fila_hasta) if fila_hasta is not None else bloque.n
+                columnas = bloque.columnas
+                if ts_desde or ts_hasta:
+                    ts_col = columnas["ts"]
+                    elegidas = [k for k in range(a, b) if _en_rango(parsear_ts(ts_col[k]), ts_desde, ts_hasta)]
+                    columnas = {c: [columnas[c][k] for k in elegidas] for c in COLUMNAS}
+                    a, b = 0, len(elegidas)
+                self.filas_leidas += b - a
+
+                if self.pausado:
+                    await self.esperar_reanudar(plan)
+                    proxima = time.monotonic()
+                if not self.corriendo:
+                    break
+
+                if intervalo <= 0:
+                    # Sin límite de velocidad: el bloque entero por slices
+                    await self.agregar_columnas(plan, columnas, a, b)
+                else:
+                    for k in range(a, b):
+                        if self.pausado:
+                            await self.esperar_reanudar(plan)
+                            proxima = time.monotonic()
+                        if not self.corriendo:
+                            break
+
+                        await self.agregar_columnas(plan, columnas, k, k + 1, intervalo)
+
+                        # Ritmo por reloj absoluto para no acumular deriva a velocidades altas
+                        proxima += intervalo
+                        await asyncio.sleep(max(0.0, proxima - time.monotonic()))
+
+                self.progreso = round(bloque.pos / bytes_total, 4)
+                # Cede el loop entre bloques aunque la velocidad sea ilimitada
+                await asyncio.sleep(0)
+
+            if cfg["una_pasada"]:
+                self.progreso = 1.0
+                self.terminado = True
+                break
+            # al terminar el CSV, vuelve a empezar automáticamente (loop demo)
+
+
+def _en_rango(t, desde, hasta) -> bool:
+    return t is not None and not (desde and t < desde) and not (hasta and t > hasta)
+
+
+class FuenteStream(Fuente):
+    """
+    Líneas CSV que llegan por un stream (socket local o stdin), en el orden
+    de COLUMNAS; una línea de encabezado "ts,..." redefine el orden.
+    """
+
+    async def consumir(self, plan, reader: asyncio.StreamReader):
+        columnas = COLUMNAS
+        while self.corriendo:
+            # Sin datos nuevos igual se respeta LOTE_MAX_SEG para el lote pendiente
+            try:
+                linea = await asyncio.wait_for(reader.readline(), timeout=plan.lote_max_seg)
+            except asyncio.TimeoutError:
+                await self.vaciar(plan)
+                continue
+            if not linea:
+                return
+            texto = linea.decode("utf-8", errors="replace").strip()
+            if not texto:
+                continue
+            if texto.startswith("ts,"):
+                columnas = tuple(texto.split(","))
+                continue
+
+            self.filas_leidas += 1
+            muestra = parsear_linea(texto, columnas)
+            if muestra is None:
+                continue
+            if self.pausado:
+                await self.esperar_reanudar(plan)
+            await self.agregar(plan, muestra)
+
+
+class FuenteSocket(FuenteStream):
+    tipo = "socket"
+
+    async def ejecutar(self, plan):
+        async def atender(reader, writer):
+            try:
+                await self.consumir(plan, reader)
+            finally:
+                writer.close()
+
+        servidor = await asyncio.start_server(atender, self.config["host"], self.config["puerto"])
+        async with servidor:
+            while self.corriendo:
+                await asyncio.sleep(0.5)
+
+
+class FuenteStdin(FuenteStream):
+    tipo = "stdin"
+
+    async def ejecutar(self, plan):
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        await self.consumir(plan, reader)
+        self.terminado = True
+
+
+class Planificador:
+    """
+    Corre N fuentes concurrentes en el event loop de la app, compartiendo
+    un pool acotado de hilos para parseo y escritura al spool.
+    """
+
+    def __init__(self, spool, trabajadores: int, lote_max_seg: float):
+        self.spool = spool
+        self.lote_max_seg = lote_max_seg
+        self.pool = ThreadPoolExecutor(max_workers=trabajadores, thread_name_prefix="adquisicion")
+        self.fuentes = {}
+        self.enviado_total = 0
+        self.en_cola = 0          # tareas enviadas al pool que aún no toman un hilo
+        self._lock = threading.Lock()
+
+    def en_pool(self, fn, *args):
+        """
+        Corre fn(*args) en el pool (awaitable), contando en en_cola el tiempo
+        que espera un hilo libre.
+        """
+        def tarea():
+            with self._lock:
+                self.en_cola -= 1
+            return fn(*args)
+
+        with self._lock:
+            self.en_cola += 1
+        return asyncio.get_running_loop().run_in_executor(self.pool, tarea)
+
+    def _id_libre(self, base: str) -> str:
+        id, n = base, 2
+        while id in self.fuentes and self.fuentes[id].corriendo:
+            id, n = f"{base}_{n}", n + 1
+        return id
+
+    def crear(self, config: dict) -> list:
+        """
+        Crea y arranca las fuentes descritas por config; un glob genera una
+        fuente CSV por archivo. Debe llamarse dentro del event loop.
+        """
+        tipo = config["tipo"]
+        if tipo == "csv":
+            rutas = sorted(glob.glob(config["ruta"])) if glob.has_magic(config["ruta"]) else [config["ruta"]]
+            if not rutas:
+                raise ValueError(f"Ningún archivo coincide con {config['ruta']}")
+            nuevas = []
+            for ruta in rutas:
+                if not os.path.exists(ruta):
+                    raise ValueError(f"No existe {ruta}")
+                base = os.path.basename(ruta).split(".")[0]
+                nuevas.append(FuenteCSV(self._id_libre(base), {**config, "ruta": ruta}))
+        elif tipo == "socket":
+            nuevas = [FuenteSocket(self._id_libre(f"socket_{config['puerto']}"), config)]
+        elif tipo == "stdin":
+            nuevas = [FuenteStdin(self._id_libre("stdin"), config)]
+        else:
+            raise ValueError(f"Tipo de fuente desconocido: {tipo}")
+
+        loop = asyncio.get_running_loop()
+        for f in nuevas:
+            self.fuentes[f.id] = f
+            f.corriendo = True
+            f.tarea = loop.create_task(f.correr(self))
+        return nuevas
+
+    def activas(self) -> list:
+        return [f for f in self.fuentes.values() if f.corriendo]
+
+    def detener(self, id: str = None):
+        for f in self.fuentes.values():
+            if id is None or f.id == id:
+                f.corriendo = False
+
+    def pausar(self, pausado: bool, id: str = None):
+        for f in self.activas():
+            if id is None or f.id == id:
+                f.pausado = pausado
+
+    def estado(self) -> dict:
+        activas = self.activas()
+        return {
+            "corriendo": bool(activas),
+            "pausado": bool(activas) and all(f.pausado for f in activas),
+            "enviado_total": self.enviado_total,
+            "filas_por_seg": round(sum(f.filas_por_seg for f in activas), 1),
+            "spool": self.spool.estado(),
+            "fuentes": {id: f.estado() for id, f in self.fuentes.items()},
+        }
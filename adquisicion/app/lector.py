@@ -0,0 +1,312 @@
+import bisect
+import csv
+import gzip
+import io
+import mmap
+import os
+import time
+from datetime import datetime, timezone
+from itertools import repeat
+
+from app import metricas
+
+try:
+    import zstandard
+except ImportError:  # opcional: sólo hace falta para archivos .zst
+    zstandard = None
+
+COLUMNAS_TEXTO = ("ts", "machine_id", "actuator_id")
+COLUMNAS_NUM = ("motor_temp_c", "motor_rpm", "motor_vibration_rms")
+
+BYTES_BLOQUE = 1 << 20       # ~1 MB de texto por bloque columnar
+PASO_INDICE = 4 << 20        # una entrada del índice disperso cada ~4 MB
+
+H_PARSEO = metricas.histograma("adquisicion_csv_parseo_seconds", "Parseo de un bloque CSV (~1 MB) a columnas")
+C_FILAS = metricas.contador("adquisicion_csv_filas_total", "Filas CSV parseadas")
+
+# Índices dispersos ya construidos: (ruta, tamaño, mtime) -> lista de entradas
+_indices = {}
+
+
+def parsear_ts(texto: str):
+    """
+    ts ISO-8601 -> datetime con zona (sin zona se asume UTC); None si no parsea.
+    """
+    try:
+        t = datetime.fromisoformat(texto)
+    except (TypeError, ValueError):
+        return None
+    return t if t.tzinfo else t.replace(tzinfo=timezone.utc)
+
+
+class Bloque:
+    """
+    Líneas consecutivas en formato columnar: una lista por columna.
+
+    Las filas se numeran por línea física (0-based, sin encabezado), igual
+    que el índice disperso: fila0 es el número de la primera línea del
+    bloque y lineas cuántas abarca, aunque alguna esté vacía o mal formada
+    y no llegue a las columnas (n = filas válidas). Si se descartó alguna,
+    numeros tiene el número de línea de cada fila válida. pos es el byte
+    del archivo fuente alcanzado al terminar el bloque.
+    """
+
+    __slots__ = ("fila0", "pos", "n", "lineas", "columnas", "numeros")
+
+    def __init__(self, fila0: int, pos: int, columnas: dict, lineas: int = None, numeros: list = None):
+        self.fila0 = fila0
+        self.pos = pos
+        self.columnas = columnas
+        self.n = len(columnas["ts"])
+        self.lineas = self.n if lineas is None else lineas
+        self.numeros = numeros
+
+    def __getitem__(self, nombre):
+        return self.columnas[nombre]
+
+    def indice(self, fila: int) -> int:
+        """
+        Posición en las columnas de la primera fila válida con número >= fila.
+        """
+        if self.numeros is None:
+            return min(max(fila - self.fila0, 0), self.n)
+        return bisect.bisect_left(self.numeros, fila)
+
+
+class LectorCSV:
+    """
+    Lector rápido de logs de actuadores.
+
+    - Archivos planos: se mapean en memoria (mmap) y se parsean por bloques
+      de ~1 MB directo a columnas, sin un dict por fila. Al abrir por primera
+      vez se arma un índice disperso (byte, fila, ts) que permite saltar a
+      una fila o a un ts sin leer lo anterior (asume el log ordenado por ts).
+    - .gz / .zst: descompresión en streaming; para saltar hay que leer.
+    """
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self.tamano = os.path.getsize(ruta)
+        self.comprimido = ruta.endswith(".gz") or ruta.endswith(".zst")
+        if ruta.endswith(".zst") and zstandard is None:
+            raise RuntimeError("Para leer .zst hay que instalar 'zstandard'")
+
+        f, crudo = self._abrir_texto()
+        with f, crudo:
+            primera = f.readline()
+        self.inicio_datos = len(primera)
+        self.encabezado = primera.decode("utf-8").strip().lstrip("\ufeff")
+        nombres = next(csv.reader([self.encabezado]))
+        faltan = [c for c in COLUMNAS_TEXTO + COLUMNAS_NUM if c not in nombres]
+        if faltan:
+            raise ValueError(f"El CSV no tiene las columnas {faltan}")
+        self.posiciones = {c: nombres.index(c) for c in COLUMNAS_TEXTO + COLUMNAS_NUM}
+        self.n_campos = len(nombres)
+
+    # ------------------------------------------------------------------ apertura
+
+    def _abrir_texto(self):
+        """
+        (stream de texto descomprimido, archivo crudo); el crudo sirve para
+        saber cuánto del archivo fuente se ha consumido.
+        """
+        crudo = open(self.ruta, "rb")
+        if self.ruta.endswith(".gz"):
+            return gzip.GzipFile(fileobj=crudo, mode="rb"), crudo
+        if self.ruta.endswith(".zst"):
+            lector = zstandard.ZstdDecompressor().stream_reader(crudo, closefd=False)
+            return io.BufferedReader(lector, BYTES_BLOQUE), crudo
+        return crudo, crudo
+
+    # ------------------------------------------------------------------ índice
+
+    def indice(self) -> list:
+        """
+        Índice disperso [(byte, fila, ts)], cacheado por (ruta, tamaño, mtime).
+        Sólo para archivos planos.
+        """
+        st = os.stat(self.ruta)
+        clave = (self.ruta, st.st_size, st.st_mtime_ns)
+        if clave not in _indices:
+            _indices[clave] = self._construir_indice()
+        return _indices[clave]
+
+    def _construir_indice(self) -> list:
+        entradas = []
+        if self.tamano <= self.inicio_datos:
+            return entradas
+        with open(self.ruta, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos, fila = self.inicio_datos, 0
+            i_ts = self.posiciones["ts"]
+            while pos < self.tamano:
+                fin = mm.find(b"\n", pos)
+                linea = mm[pos:fin if fin >= 0 else self.tamano].decode("utf-8").strip()
+                campos = linea.split(",")
+                entradas.append((pos, fila, parsear_ts(campos[i_ts]) if len(campos) > i_ts else None))
+
+                # Salta ~PASO_INDICE bytes y cuenta las filas intermedias (en C)
+                destino = mm.find(b"\n", min(pos + PASO_INDICE, self.tamano - 1))
+                if destino < 0:
+                    break
+                fila += mm[pos:destino + 1].count(b"\n")
+                pos = destino + 1
+        return entradas
+
+    def _punto_de_partida(self, fila_desde: int, ts_desde):
+        """
+        (byte, fila) de la entrada del índice más cercana antes del objetivo.
+        """
+        entradas = self.indice()
+        if not entradas:
+            return self.inicio_datos, 0
+        # Se puede saltar todo lo anterior a una entrada si queda antes de la
+        # fila pedida o si su ts es estrictamente menor (puede haber filas con
+        # el mismo ts antes); ambas condiciones son prefijos del archivo.
+        mejor = entradas[0]
+        for e in entradas:
+            antes_de_fila = e[1] <= fila_desde
+            antes_de_ts = ts_desde is not None and e[2] is not None and e[2] < ts_desde
+            if not (antes_de_fila or antes_de_ts):
+                break
+            mejor = e
+        return mejor[0], mejor[1]
+
+    # ------------------------------------------------------------------ parseo
+
+    def _parsear(self, texto: bytes, fila0: int, pos: int) -> Bloque:
+        t0 = time.perf_counter()
+        texto = texto.decode("utf-8").replace("\r", "")
+        n_lineas = texto.count("\n") + (0 if texto.endswith("\n") else 1)
+
+        lineas = texto.split("\n")[:n_lineas]
+
+        # Camino rápido: un solo split de todo el bloque y columnas por
+        # slicing con paso (todo en C). Sólo vale si no hay comillas y cada
+        # línea tiene exactamente n_campos - 1 comas (ni vacías ni con otra
+        # cantidad de campos; el total solo no alcanza: 7 + 5 = 6 + 6).
+        numeros = None
+        comas = set(map(str.count, lineas, repeat(",")))
+        if '"' not in texto and comas == {self.n_campos - 1}:
+            planos = ",".join(lineas).split(",")
+            crudas = [planos[i::self.n_campos] for i in range(self.n_campos)]
+        else:
+            # Línea a línea por "\n" (como el índice), guardando el número de
+            # línea de cada fila válida
+            filas, numeros = [], []
+            for j, linea in enumerate(lineas):
+                campos = next(csv.reader([linea]), [])
+                if len(campos) == self.n_campos:
+                    filas.append(campos)
+                    numeros.append(fila0 + j)
+            crudas = [list(c) for c in zip(*filas)] if filas else [[] for _ in range(self.n_campos)]
+
+        columnas = {c: crudas[self.posiciones[c]] for c in COLUMNAS_TEXTO}
+        try:
+            for c in COLUMNAS_NUM:
+                columnas[c] = list(map(float, crudas[self.posiciones[c]]))
+        except ValueError:
+            columnas, numeros = self._filas_numericas(crudas, numeros, fila0)
+        bloque = Bloque(fila0, pos, columnas, n_lineas, numeros)
+        H_PARSEO.observar(time.perf_counter() - t0)
+        C_FILAS.inc(bloque.n)
+        return bloque
+
+    def _filas_numericas(self, crudas: list, numeros: list, fila0: int):
+        """
+        Camino lento de la conversión a float: fila a fila, descartando (con
+        aviso) las filas con alguna celda no numérica. Retorna (columnas,
+        numeros) con numeros alineado a las filas que quedan.
+        """
+        if numeros is None:
+            numeros = list(range(fila0, fila0 + len(crudas[0])))
+        posiciones = [self.posiciones[c] for c in COLUMNAS_TEXTO + COLUMNAS_NUM]
+        columnas = {c: [] for c in COLUMNAS_TEXTO + COLUMNAS_NUM}
+        quedan = []
+        for k, numero in enumerate(numeros):
+            try:
+                valores = [float(crudas[self.posiciones[c]][k]) for c in COLUMNAS_NUM]
+            except ValueError:
+                print(f"[adquisicion] {self.ruta}: fila {numero} descartada: {[crudas[i][k] for i in posiciones]}")
+                continue
+            for c in COLUMNAS_TEXTO:
+                columnas[c].append(crudas[self.posiciones[c]][k])
+            for c, v in zip(COLUMNAS_NUM, valores):
+                columnas[c].append(v)
+            quedan.append(numero)
+        return columnas, quedan
+
+    def bloques(self, fila_desde: int = 0, ts_desde=None):
+        """
+        Itera Bloques desde la primera fila >= fila_desde (y cerca de ts_desde
+        si se indica; el filtro exacto por ts lo hace quien consume).
+        """
+        if isinstance(ts_desde, str):
+            ts_desde = parsear_ts(ts_desde)
+        if self.comprimido:
+            yield from self._bloques_stream(fila_desde)
+        else:
+            yield from self._bloques_mmap(fila_desde, ts_desde)
+
+    def _bloques_mmap(self, fila_desde: int, ts_desde):
+        if self.tamano <= self.inicio_datos:
+            return
+        pos, fila = self._punto_de_partida(fila_desde, ts_desde)
+        with open(self.ruta, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Avanza fila a fila sólo dentro del tramo entre entradas del índice
+            while fila < fila_desde and pos < self.tamano:
+                fin = mm.find(b"\n", pos)
+                pos = self.tamano if fin < 0 else fin + 1
+                fila += 1
+
+            while pos < self.tamano:
+                fin = mm.find(b"\n", min(pos + BYTES_BLOQUE, self.tamano - 1))
+                fin = self.tamano if fin < 0 else fin + 1
+                texto = mm[pos:fin]
+                bloque = self._parsear(texto, fila, fin)
+                fila += bloque.lineas
+                pos = fin
+                yield bloque
+
+    def _bloques_stream(self, fila_desde: int):
+        fila = 0
+        resto = b""
+        f, crudo = self._abrir_texto()
+        with f, crudo:
+            f.readline()
+            while True:
+                trozo = f.read(BYTES_BLOQUE)
+                if not trozo:
+                    break
+                texto = resto + trozo
+                corte = texto.rfind(b"\n") + 1
+                if corte == 0:
+                    resto = texto
+                    continue
+                texto, resto = texto[:corte], texto[corte:]
+                bloque = self._parsear(texto, fila, crudo.tell())
+                fila += bloque.lineas
+                bloque = _recortar(bloque, fila_desde)
+                if bloque is not None:
+                    yield bloque
+            if resto.strip():
+                bloque = _recortar(self._parsear(resto, fila, self.tamano), fila_desde)
+                if bloque is not None:
+                    yield bloque
+
+
+def _recortar(bloque: Bloque, fila_desde: int):
+    """
+    Descarta del bloque las filas anteriores a fila_desde.
+    """
+    if bloque.fila0 + bloque.lineas <= fila_desde:
+        return None
+    if fila_desde <= bloque.fila0:
+        return bloque
+    corte = bloque.indice(fila_desde)
+    columnas = {c: v[corte:] for c, v in bloque.columnas.items()}
+    numeros = bloque.numeros[corte:] if bloque.numeros is not None else None
+    return Bloque(fila_desde, bloque.pos, columnas, bloque.fila0 + bloque.lineas - fila_desde, numeros)
+
+
+def abrir(ruta: str) -> LectorCSV:
+    return LectorCSV(ruta)
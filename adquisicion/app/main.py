@@ -1,95 +1,266 @@
 import os
-import csv
 import time
-import threading
+import asyncio
 import requests
+from contextlib import asynccontextmanager
+from typing import Optional
 from fastapi import FastAPI, HTTPException
-
-app = FastAPI(title="Servicio de Adquisición")
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+from app import binario, metricas
+from app.lector import parsear_ts
+from app.fuentes import Planificador, COLUMNAS
+from app.spool import Spool, Descartar, entregar_partiendo
 
 ANALYSIS_URL = os.getenv("ANALYSIS_URL", "http://analisis:8002")
-RUTA_CSV = os.getenv("RUTA_CSV", "/datos/actuator_data.csv")
+RUTA_CSV = os.getenv("RUTA_CSV", "/datos/actuator_data.csv")   # admite glob: /datos/*.csv
 INTERVALO_SEG = float(os.getenv("INTERVALO_SEG", "1.0"))
+LOTE_TAMANO = int(os.getenv("LOTE_TAMANO", "100"))      # máx. filas por lote
+LOTE_MAX_SEG = float(os.getenv("LOTE_MAX_SEG", "1.0"))  # máx. espera de una fila en el lote
+TRABAJADORES = int(os.getenv("TRABAJADORES", "8"))      # hilos compartidos para parseo y envío
+SPOOL_DIR = os.getenv("SPOOL_DIR", "/spool")
+SPOOL_MAX_MB = int(os.getenv("SPOOL_MAX_MB", "512"))
+SPOOL_SEGMENTO_MB = int(os.getenv("SPOOL_SEGMENTO_MB", "16"))
+SPOOL_FSYNC_SEG = float(os.getenv("SPOOL_FSYNC_SEG", "0.02"))  # ventana de fsync agrupado
+FORMATO_ENVIO = os.getenv("FORMATO_ENVIO", "json")              # json | binario (ver app/binario.py)
+
+sesion = requests.Session()
 
-estado = {
-    "corriendo": False,
-    "pausado": False,
-    "enviado_total": 0,
-}
+def filas_de(registro) -> list:
+    """
+    Registro del spool -> filas (tuplas en el orden de COLUMNAS). Los
+    registros son columnares; acepta también los viejos (lista de dicts).
+    """
+    if isinstance(registro, dict):
+        return list(zip(*(registro[c] for c in COLUMNAS)))
+    return [tuple(m[c] for c in COLUMNAS) for m in registro]
 
-def enviar_muestra(muestra: dict):
-    r = requests.post(f"{ANALYSIS_URL}/api/v1/ingest", json=muestra, timeout=5)
+def cuerpo_lote(filas: list) -> dict:
+    """
+    Argumentos del POST: binario si FORMATO_ENVIO lo pide y el lote se puede
+    codificar; si no, JSON (p. ej. un ts que no es ISO-8601).
+    """
+    if FORMATO_ENVIO == "binario":
+        try:
+            columnas = dict(zip(COLUMNAS, map(list, zip(*filas))))
+            return {"data": binario.codificar_columnas_muestras(columnas), "headers": {"content-type": binario.TIPO_CONTENIDO}}
+        except (ValueError, TypeError, KeyError):
+            pass
+    return {"json": [dict(zip(COLUMNAS, f)) for f in filas]}
+
+def enviar_lote(filas: list):
+    r = sesion.post(f"{ANALYSIS_URL}/api/v1/ingest/batch", timeout=10, **cuerpo_lote(filas))
     r.raise_for_status()
 
-def reproductor_csv():
+# El spool se crea en el lifespan (abre archivos y crea SPOOL_DIR), no al importar
+planificador = Planificador(None, TRABAJADORES, LOTE_MAX_SEG)
+
+H_ENVIO = metricas.histograma("adquisicion_envio_seconds", "POST de un lote a análisis")
+C_ENVIOS_ERROR = metricas.contador("adquisicion_envios_error_total", "Lotes cuyo envío a análisis falló")
+C_RECHAZADAS = metricas.contador("adquisicion_filas_rechazadas_total", "Filas que análisis rechazó (4xx) y se descartaron")
+EN_VUELO = {"n": 0}   # sólo se toca desde el loop
+
+metricas.medidor("adquisicion_envios_en_vuelo", "Lotes enviándose a análisis", lambda: EN_VUELO["n"])
+metricas.medidor("adquisicion_pool_cola", "Tareas esperando un hilo del pool", lambda: planificador.en_cola)
+metricas.medidor("adquisicion_fuentes_activas", "Fuentes corriendo", lambda: len(planificador.activas()))
+metricas.medidor("adquisicion_enviado_total", "Muestras entregadas a análisis", lambda: planificador.enviado_total, tipo="counter")
+metricas.medidor("adquisicion_spool_registros", "Registros pendientes en el spool", lambda: planificador.spool.registros_pendientes)
+metricas.medidor("adquisicion_spool_bytes", "Bytes pendientes en el spool", lambda: planificador.spool.bytes_pendientes)
+metricas.medidor("adquisicion_spool_lag_seconds", "Antigüedad del registro más viejo del spool", lambda: planificador.spool.estado()["lag_seg"])
+metricas.medidor("adquisicion_spool_reintentos_total", "Reintentos de entrega del spool", lambda: planificador.spool.reintentos_total, tipo="counter")
+metricas.medidor("adquisicion_spool_descartados_total", "Registros descartados por el spool", lambda: planificador.spool.descartados_total, tipo="counter")
+
+
+async def enviar_trozo(lote: list):
     """
-    Lee el CSV y envía filas en loop infinito.
-    Pause detiene temporalmente el envío.
+    POST de un lote (o un trozo) a análisis. 4xx (salvo 408/429) es
+    permanente y se lanza como Descartar.
     """
+    EN_VUELO["n"] += 1
+    t0 = time.perf_counter()
     try:
-        while estado["corriendo"]:
-            with open(RUTA_CSV, newline="", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if not estado["corriendo"]:
-                        break
-
-                    while estado["pausado"] and estado["corriendo"]:
-                        time.sleep(0.2)
-
-                    if not estado["corriendo"]:
-                        break
-
-                    muestra = {
-                        "ts": row["ts"],
-                        "machine_id": row["machine_id"],
-                        "actuator_id": row["actuator_id"],
-                        "motor_temp_c": float(row["motor_temp_c"]),
-                        "motor_rpm": float(row["motor_rpm"]),
-                        "motor_vibration_rms": float(row["motor_vibration_rms"]),
-                    }
-
-                    try:
-                        enviar_muestra(muestra)
-                        estado["enviado_total"] += 1
-                    except Exception as e:
-                        print(f"[adquisicion] Error enviando muestra: {e}")
-
-                    time.sleep(INTERVALO_SEG)
-
-            # al terminar el CSV, vuelve a empezar automáticamente (loop demo)
+        await planificador.en_pool(enviar_lote, lote)
+    except requests.HTTPError as e:
+        C_ENVIOS_ERROR.inc()
+        codigo = e.response.status_code
+        if 400 <= codigo < 500 and codigo not in (408, 429):
+            raise Descartar(f"análisis rechazó el lote ({codigo}): {e.response.text[:200]}")
+        raise
+    except Exception:
+        C_ENVIOS_ERROR.inc()
+        raise
     finally:
-        estado["corriendo"] = False
-        estado["pausado"] = False
+        EN_VUELO["n"] -= 1
+        H_ENVIO.observar(time.perf_counter() - t0)
+    planificador.enviado_total += len(lote)
+
+
+async def entregar(registro):
+    """
+    Envío de un lote del spool a análisis. Si análisis lo rechaza se parte
+    hasta aislar las filas inválidas: sólo esas se descartan. Lo entregado
+    se quita del registro, así un reintento no lo duplica.
+    """
+    def guardar(restantes):
+        if isinstance(registro, dict):
+            for c, valores in zip(COLUMNAS, zip(*restantes) if restantes else [()] * len(COLUMNAS)):
+                registro[c][:] = valores
+        else:
+            registro[:] = [dict(zip(COLUMNAS, f)) for f in restantes]
+
+    rechazadas = await entregar_partiendo(enviar_trozo, filas_de(registro), guardar)
+    for fila, error in rechazadas:
+        print(f"[adquisicion] Fila descartada: {error} | {dict(zip(COLUMNAS, fila))}")
+    C_RECHAZADAS.inc(len(rechazadas))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if planificador.spool is None:
+        planificador.spool = Spool(SPOOL_DIR, SPOOL_MAX_MB << 20, SPOOL_SEGMENTO_MB << 20, SPOOL_FSYNC_SEG)
+    # El drenado del spool corre mientras viva la app (reintenta con backoff)
+    drenado = asyncio.create_task(planificador.spool.drenar(entregar))
+    yield
+    planificador.detener()
+    drenado.cancel()
+
+
+app = FastAPI(title="Servicio de Adquisición", lifespan=lifespan)
+
+
+class FuenteConfig(BaseModel):
+    tipo: str = "csv"                 # csv (archivo o glob) | socket | stdin
+    ruta: Optional[str] = None
+    host: str = "127.0.0.1"
+    puerto: Optional[int] = None
+    velocidad: float = 1.0            # 1 = tiempo real, 10 = x10, 0 = sin límite
+    intervalo_seg: Optional[float] = None
+    una_pasada: bool = False
+    fila_desde: int = 0
+    fila_hasta: Optional[int] = None
+    ts_desde: Optional[str] = None
+    ts_hasta: Optional[str] = None
+    lote: Optional[int] = None
+
+
+def validar_config(c: FuenteConfig) -> dict:
+    if c.tipo not in ("csv", "socket", "stdin"):
+        raise HTTPException(status_code=422, detail=f"tipo desconocido: {c.tipo}")
+    if c.tipo == "socket" and not c.puerto:
+        raise HTTPException(status_code=422, detail="socket requiere puerto")
+    if c.velocidad < 0:
+        raise HTTPException(status_code=422, detail="velocidad debe ser >= 0 (0 = sin límite)")
+    if c.lote is not None and c.lote < 1:
+        raise HTTPException(status_code=422, detail="lote debe ser >= 1")
+    for nombre, valor in (("ts_desde", c.ts_desde), ("ts_hasta", c.ts_hasta)):
+        if valor and parsear_ts(valor) is None:
+            raise HTTPException(status_code=422, detail=f"{nombre} inválido: {valor}")
+
+    config = c.model_dump()
+    config["ruta"] = c.ruta or RUTA_CSV
+    config["intervalo_seg"] = INTERVALO_SEG if c.intervalo_seg is None else c.intervalo_seg
+    config["lote"] = c.lote or LOTE_TAMANO
+    return config
+
+
+def crear_fuentes(config: dict) -> list:
+    try:
+        return planificador.crear(config)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
 
 
 @app.get("/api/v1/health")
-def health():
-    return {"ok": True, "servicio": "adquisicion", **estado}
+async def health():
+    return {"ok": True, "servicio": "adquisicion", **planificador.estado()}
+
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(metricas.exponer(), media_type="text/plain; version=0.0.4")
 
 
 @app.post("/api/v1/control/start")
-def start():
-    if estado["corriendo"]:
+async def start(
+    velocidad: float = 1.0,
+    una_pasada: bool = False,
+    fila_desde: int = 0,
+    fila_hasta: Optional[int] = None,
+    ts_desde: Optional[str] = None,
+    ts_hasta: Optional[str] = None,
+    lote: Optional[int] = None,
+):
+    """
+    Arranca una fuente CSV por cada archivo de RUTA_CSV (puede ser un glob).
+    Sin parámetros: demo en loop a tiempo real (comportamiento original).
+    Replay/backfill: una_pasada=true y velocidad 10 (x10) o 0 (sin límite),
+    opcionalmente acotado por filas [fila_desde, fila_hasta) o por ts.
+    """
+    if planificador.activas():
         return {"ok": True, "msg": "Ya estaba corriendo"}
 
-    estado["corriendo"] = True
-    estado["pausado"] = False
+    config = validar_config(FuenteConfig(
+        velocidad=velocidad, una_pasada=una_pasada, fila_desde=fila_desde, fila_hasta=fila_hasta,
+        ts_desde=ts_desde, ts_hasta=ts_hasta, lote=lote,
+    ))
+    nuevas = crear_fuentes(config)
+
+    msg = "Replay iniciado (una pasada)" if una_pasada else "Demo iniciada (leyendo CSV)"
+    return {"ok": True, "msg": msg, "fuentes": [f.id for f in nuevas], "config": config}
 
-    t = threading.Thread(target=reproductor_csv, daemon=True)
-    t.start()
 
-    return {"ok": True, "msg": "Demo iniciada (leyendo CSV)"}
+@app.post("/api/v1/control/stop")
+async def stop():
+    if not planificador.activas():
+        return {"ok": True, "msg": "No estaba corriendo"}
+    planificador.detener()
+    return {"ok": True, "msg": "Detenido"}
 
 
 @app.post("/api/v1/control/pause")
-def pause_toggle():
+async def pause_toggle():
     """
-    Toggle: si está corriendo, pausa/reanuda.
+    Toggle: si está corriendo, pausa/reanuda (todas las fuentes).
     Sirve como botón único en la UI.
     """
-    if not estado["corriendo"]:
+    if not planificador.activas():
         return {"ok": False, "msg": "No está corriendo. Usa START primero."}
 
-    estado["pausado"] = not estado["pausado"]
-    return {"ok": True, "pausado": estado["pausado"], "msg": "Pausado" if estado["pausado"] else "Reanudado"}
+    pausado = not planificador.estado()["pausado"]
+    planificador.pausar(pausado)
+    return {"ok": True, "pausado": pausado, "msg": "Pausado" if pausado else "Reanudado"}
+
+
+@app.get("/api/v1/sources")
+async def listar_fuentes():
+    return {"items": [f.estado() for f in planificador.fuentes.values()]}
+
+
+@app.post("/api/v1/sources")
+async def agregar_fuente(c: FuenteConfig):
+    nuevas = crear_fuentes(validar_config(c))
+    return {"ok": True, "fuentes": [f.estado() for f in nuevas]}
+
+
+def _fuente(id: str):
+    f = planificador.fuentes.get(id)
+    if f is None:
+        raise HTTPException(status_code=404, detail=f"No existe la fuente {id}")
+    return f
+
+
+@app.post("/api/v1/sources/{id}/pause")
+async def pausar_fuente(id: str):
+    f = _fuente(id)
+    f.pausado = not f.pausado
+    return {"ok": True, "pausado": f.pausado}
+
+
+@app.delete("/api/v1/sources/{id}")
+async def detener_fuente(id: str):
+    f = _fuente(id)
+    f.corriendo = False
+    if not f.tarea.done():
+        await f.tarea
+    del planificador.fuentes[id]
+    return {"ok": True, "fuente": f.estado()}
@@ -0,0 +1,350 @@
+# Copia idéntica en adquisicion y analisis (app/spool.py): cada servicio es su
+# propio contexto de build. Se edita en todas a la vez;
+# analisis/tests/test_copias.py falla si difieren.
+
+import asyncio
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+# Cada registro: largo (u32), crc32 (u32), instante de ingreso (f64) + JSON
+CABECERA = struct.Struct("<IId")
+
+BACKOFF_MIN_SEG = 0.5
+BACKOFF_MAX_SEG = 30.0
+
+# El cursor se persiste por tandas: cada tantos registros entregados, cada
+# tantos segundos o al vaciarse la cola. Tras una caída se reentrega a lo
+# sumo esa tanda (la entrega ya es al-menos-una-vez).
+CURSOR_CADA_REGISTROS = 256
+CURSOR_CADA_SEG = 1.0
+
+
+class SpoolLleno(Exception):
+    """El spool superó su tamaño máximo; el llamador debe frenar (backpressure)."""
+
+
+class Descartar(Exception):
+    """Fallo permanente del envío (p. ej. 4xx); el registro se descarta en vez de reintentar."""
+
+
+async def entregar_partiendo(enviar, filas: list, guardar) -> list:
+    """
+    Entrega `filas` con `await enviar(trozo)`. Si un trozo se rechaza con
+    Descartar se parte en mitades hasta aislar las filas inválidas: sólo
+    esas se pierden y se devuelven como [(fila, error)]. Tras cada trozo
+    resuelto se llama guardar(restantes), así un error transitorio reintenta
+    sólo lo que falta y no duplica lo ya entregado.
+    """
+    trozos = [filas] if filas else []
+    rechazadas = []
+    while trozos:
+        trozo = trozos[0]
+        try:
+            await enviar(trozo)
+        except Descartar as e:
+            if len(trozo) > 1:
+                mitad = len(trozo) // 2
+                trozos[:1] = [trozo[:mitad], trozo[mitad:]]
+                continue
+            rechazadas.append((trozo[0], str(e)))
+        trozos.pop(0)
+        guardar([f for t in trozos for f in t])
+    return rechazadas
+
+
+class Spool:
+    """
+    Cola durable en disco: segmentos append-only con fsync agrupado.
+
+    agregar() escribe el registro y retorna cuando ya está en disco (un solo
+    fsync cubre a todos los que llegaron en la misma ventana de fsync_seg).
+    drenar() lo entrega río abajo en orden, reintentando con backoff
+    exponencial; el cursor de lo ya entregado se persiste por tandas (escritura
+    atómica con fsync), así que tras un reinicio se retoma donde quedó
+    (entrega al-menos-una-vez).
+    """
+
+    def __init__(self, directorio: str, max_bytes: int, segmento_max_bytes: int, fsync_seg: float):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.segmento_max_bytes = segmento_max_bytes
+        self.fsync_seg = fsync_seg
+        os.makedirs(directorio, exist_ok=True)
+
+        self._cond = threading.Condition()
+        segmentos = self._segmentos()
+        cursor = self._leer_cursor()
+        # Siempre se escribe en un segmento nuevo: una cola parcial de un
+        # segmento viejo (caída a mitad de escritura) queda sólo para lectura
+        self._seg = max(segmentos + ([cursor[0]] if cursor else []), default=0) + 1
+        self._f = open(self._ruta(self._seg), "ab")
+        self._escrito = 0
+        self._gen_escrita = 0
+        self._gen_durable = 0
+        self._durable = (self._seg, 0)
+
+        self.cursor = cursor or ((segmentos[0] if segmentos else self._seg), 0)
+        self._cursor_guardado = self.cursor
+        self._lock_cursor = threading.Lock()
+        for seg in segmentos:
+            if seg < self.cursor[0]:
+                os.remove(self._ruta(seg))  # ya entregado antes del reinicio
+        self._lectura = None  # (segmento, archivo abierto)
+        self._t_cabeza = None
+
+        self.bytes_pendientes, self.registros_pendientes = self._contar_pendientes()
+        self.entregados_total = 0
+        self.reintentos_total = 0
+        self.descartados_total = 0
+        self.ultimo_error = None
+
+        threading.Thread(target=self._bucle_fsync, name="spool-fsync", daemon=True).start()
+
+    # ------------------------------------------------------------------ archivos
+
+    def _ruta(self, seg: int) -> str:
+        return os.path.join(self.directorio, f"seg-{seg:08d}.log")
+
+    def _segmentos(self) -> list:
+        return sorted(
+            int(n[4:12]) for n in os.listdir(self.directorio)
+            if n.startswith("seg-") and n.endswith(".log")
+        )
+
+    def _leer_cursor(self):
+        try:
+            with open(os.path.join(self.directorio, "cursor")) as f:
+                seg, off = f.read().split()
+                return int(seg), int(off)
+        except (OSError, ValueError):
+            return None
+
+    def _guardar_cursor(self):
+        """
+        Persiste el cursor si cambió: archivo temporal, fsync y os.replace,
+        así una caída deja el cursor viejo o el nuevo, nunca uno a medias.
+        """
+        with self._lock_cursor:
+            with self._cond:
+                cursor = self.cursor
+            if cursor == self._cursor_guardado:
+                return
+            ruta = os.path.join(self.directorio, "cursor")
+            with open(ruta + ".tmp", "w") as f:
+                f.write(f"{cursor[0]} {cursor[1]}")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(ruta + ".tmp", ruta)
+            fd = os.open(self.directorio, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            self._cursor_guardado = cursor
+
+    def _contar_pendientes(self):
+        total_bytes, total_reg = 0, 0
+        for seg in self._segmentos():
+            if seg < self.cursor[0]:
+                continue
+            with open(self._ruta(seg), "rb") as f:
+                if seg == self.cursor[0]:
+                    f.seek(self.cursor[1])
+                while True:
+                    cab = f.read(CABECERA.size)
+                    if len(cab) < CABECERA.size:
+                        break
+                    largo = CABECERA.unpack(cab)[0]
+                    if len(f.read(largo)) < largo:
+                        break
+                    total_bytes += CABECERA.size + largo
+                    total_reg += 1
+        return total_bytes, total_reg
+
+    # ------------------------------------------------------------------ escritura
+
+    def admitir(self):
+        """
+        Lanza SpoolLleno si el spool está lleno. Un agregar(..., admitido=True)
+        posterior ya no se rechaza por espacio (el tope se puede pasar por lo
+        que esté en vuelo): sirve para fallar antes de efectos que no se
+        deshacen.
+        """
+        with self._cond:
+            if self.bytes_pendientes >= self.max_bytes:
+                raise SpoolLleno(f"spool lleno ({self.bytes_pendientes} bytes pendientes)")
+
+    def agregar(self, registro, esperar_fsync: bool = True, admitido: bool = False):
+        datos = json.dumps(registro, separators=(",", ":")).encode("utf-8")
+        reg = CABECERA.pack(len(datos), zlib.crc32(datos), time.time()) + datos
+
+        with self._cond:
+            if not admitido and self.bytes_pendientes + len(reg) > self.max_bytes:
+                raise SpoolLleno(f"spool lleno ({self.bytes_pendientes} bytes pendientes)")
+            if self._escrito and self._escrito + len(reg) > self.segmento_max_bytes:
+                self._rotar()
+            self._f.write(reg)
+            self._escrito += len(reg)
+            self.bytes_pendientes += len(reg)
+            self.registros_pendientes += 1
+            self._gen_escrita += 1
+            gen = self._gen_escrita
+            self._cond.notify_all()
+
+            if esperar_fsync:
+                while self._gen_durable < gen:
+                    self._cond.wait()
+
+    def _rotar(self):
+        # Con el lock tomado: cierra el segmento actual ya sincronizado
+        self._sincronizar()
+        self._f.close()
+        self._seg += 1
+        self._f = open(self._ruta(self._seg), "ab")
+        self._escrito = 0
+        self._durable = (self._seg, 0)
+
+    def _sincronizar(self):
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._durable = (self._seg, self._escrito)
+        self._gen_durable = self._gen_escrita
+        self._cond.notify_all()
+
+    def _bucle_fsync(self):
+        while True:
+            with self._cond:
+                while self._gen_durable == self._gen_escrita:
+                    self._cond.wait()
+            # Deja que se junten más registros bajo el mismo fsync
+            time.sleep(self.fsync_seg)
+            with self._cond:
+                self._sincronizar()
+
+    # ------------------------------------------------------------------ lectura
+
+    def _archivo_lectura(self, seg: int):
+        if self._lectura is None or self._lectura[0] != seg:
+            if self._lectura is not None:
+                self._lectura[1].close()
+            self._lectura = (seg, open(self._ruta(seg), "rb"))
+        return self._lectura[1]
+
+    def _terminar_segmento(self, seg: int):
+        if self._lectura is not None and self._lectura[0] == seg:
+            self._lectura[1].close()
+            self._lectura = None
+        # Primero el cursor: si la caída llega antes de borrar, el segmento
+        # queda atrás del cursor y se borra al reiniciar
+        self.cursor = (seg + 1, 0)
+        self._guardar_cursor()
+        try:
+            os.remove(self._ruta(seg))
+        except OSError:
+            pass
+
+    def leer_siguiente(self):
+        """
+        (registro, instante, cursor_siguiente, bytes) del próximo registro
+        durable sin entregar, o None si no hay.
+        """
+        while True:
+            with self._cond:
+                seg, off = self.cursor
+                seg_durable, off_durable = self._durable
+            if seg > seg_durable or (seg == seg_durable and off >= off_durable):
+                self._t_cabeza = None
+                return None
+            if not os.path.exists(self._ruta(seg)):
+                self.cursor = (seg + 1, 0)
+                continue
+
+            f = self._archivo_lectura(seg)
+            f.seek(off)
+            cab = f.read(CABECERA.size)
+            datos = b""
+            if len(cab) == CABECERA.size:
+                largo, crc, t = CABECERA.unpack(cab)
+                datos = f.read(largo)
+            if len(cab) < CABECERA.size or len(datos) < largo or zlib.crc32(datos) != crc:
+                # Fin (o cola truncada) de un segmento cerrado: pasa al siguiente
+                if seg < seg_durable:
+                    if len(cab):
+                        print(f"[spool] Segmento {seg} truncado en {off}; se omite el resto")
+                    self._terminar_segmento(seg)
+                    continue
+                self._t_cabeza = None
+                return None
+
+            self._t_cabeza = t
+            return json.loads(datos), t, (seg, off + CABECERA.size + largo), CABECERA.size + largo
+
+    def confirmar(self, cursor_siguiente, tam: int):
+        """
+        Avanza el cursor en memoria; lo persiste _guardar_cursor por tandas.
+        """
+        with self._cond:
+            self.cursor = cursor_siguiente
+            self.bytes_pendientes -= tam
+            self.registros_pendientes -= 1
+
+    async def drenar(self, enviar):
+        """
+        Entrega los registros en orden con `await enviar(registro)`. Un
+        error transitorio reintenta el mismo registro con backoff exponencial;
+        Descartar lo salta.
+        """
+        try:
+            await self._drenar(enviar)
+        finally:
+            self._guardar_cursor()
+
+    async def _drenar(self, enviar):
+        sin_guardar, t_guardado = 0, time.monotonic()
+        while True:
+            item = await asyncio.to_thread(self.leer_siguiente)
+            if item is None:
+                if sin_guardar:
+                    await asyncio.to_thread(self._guardar_cursor)
+                    sin_guardar, t_guardado = 0, time.monotonic()
+                await asyncio.sleep(0.05)
+                continue
+
+            registro, _, siguiente, tam = item
+            espera = BACKOFF_MIN_SEG
+            while True:
+                try:
+                    await enviar(registro)
+                    self.entregados_total += 1
+                    break
+                except Descartar as e:
+                    self.descartados_total += 1
+                    self.ultimo_error = str(e)
+                    print(f"[spool] Registro descartado: {e}")
+                    break
+                except Exception as e:
+                    self.reintentos_total += 1
+                    self.ultimo_error = str(e)
+                    await asyncio.sleep(espera)
+                    espera = min(espera * 2, BACKOFF_MAX_SEG)
+
+            self.confirmar(siguiente, tam)
+            sin_guardar += 1
+            if sin_guardar >= CURSOR_CADA_REGISTROS or time.monotonic() - t_guardado >= CURSOR_CADA_SEG:
+                await asyncio.to_thread(self._guardar_cursor)
+                sin_guardar, t_guardado = 0, time.monotonic()
+
+    def estado(self) -> dict:
+        return {
+            "registros_pendientes": self.registros_pendientes,
+            "bytes_pendientes": self.bytes_pendientes,
+            "lag_seg": round(time.time() - self._t_cabeza, 3) if self._t_cabeza else 0.0,
+            "entregados_total": self.entregados_total,
+            "reintentos_total": self.reintentos_total,
+            "descartados_total": self.descartados_total,
+            "ultimo_error": self.ultimo_error,
+        }
@@ -0,0 +1,43 @@
+import asyncio
+
+from app import main
+from app.spool import Descartar
+
+FILAS = [
+    (f"2026-01-10T00:00:0{i}Z", "arm_01", "base", float(i), 1000.0, 0.1)
+    for i in range(6)
+]
+
+
+def columnar(filas: list) -> dict:
+    return {c: [f[k] for f in filas] for k, c in enumerate(main.COLUMNAS)}
+
+
+def test_filas_de_columnar_y_lista_de_dicts():
+    assert main.filas_de(columnar(FILAS)) == FILAS
+    assert main.filas_de([dict(zip(main.COLUMNAS, f)) for f in FILAS]) == FILAS
+
+
+def test_entregar_descarta_solo_las_filas_rechazadas(monkeypatch):
+    enviadas, caidas = [], {"n": 1}
+
+    async def enviar_trozo(filas):
+        if any(f[3] == 4.0 for f in filas):
+            raise Descartar("análisis rechazó el lote (422)")
+        # Un error transitorio a mitad del partido
+        if caidas["n"] and len(filas) < len(FILAS):
+            caidas["n"] -= 1
+            raise ConnectionError("análisis caído")
+        enviadas.extend(filas)
+
+    monkeypatch.setattr(main, "enviar_trozo", enviar_trozo)
+    registro = columnar(FILAS)
+    # Como el drenado del spool: reintenta el mismo registro tras un error transitorio
+    while True:
+        try:
+            asyncio.run(main.entregar(registro))
+            break
+        except ConnectionError:
+            pass
+    assert sorted(enviadas) == [f for f in FILAS if f[3] != 4.0]
+    assert main.filas_de(registro) == []
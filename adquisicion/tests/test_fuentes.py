@@ -0,0 +1,42 @@
+import asyncio
+
+from app import lector
+from app.fuentes import Planificador
+
+
+class SpoolMemoria:
+    def __init__(self):
+        self.registros = []
+
+    def agregar(self, registro):
+        self.registros.append({c: list(v) for c, v in registro.items()})
+
+    def estado(self):
+        return {}
+
+
+def test_replay_csv_por_rango_de_filas_en_lotes(tmp_path, monkeypatch):
+    monkeypatch.setattr(lector, "BYTES_BLOQUE", 2000)
+    lineas = [f"2026-01-10T00:00:{i % 60:02d}Z,arm_01,base,{i},1000,0.1\n" for i in range(1000)]
+    lineas[150] = "\n"
+    ruta = tmp_path / "r.csv"
+    ruta.write_text("ts,machine_id,actuator_id,motor_temp_c,motor_rpm,motor_vibration_rms\n" + "".join(lineas))
+
+    spool = SpoolMemoria()
+
+    async def correr():
+        plan = Planificador(spool, 2, 1.0)
+        fuente = plan.crear({
+            "tipo": "csv", "ruta": str(ruta), "velocidad": 0, "intervalo_seg": 1.0, "una_pasada": True,
+            "fila_desde": 100, "fila_hasta": 300, "ts_desde": None, "ts_hasta": None, "lote": 50,
+        })[0]
+        await fuente.tarea
+        assert plan.en_cola == 0
+        return fuente
+
+    fuente = asyncio.run(correr())
+    esperadas = [i for i in range(100, 300) if i != 150]
+    assert [int(t) for r in spool.registros for t in r["motor_temp_c"]] == esperadas
+    assert all(len(r["ts"]) <= 50 for r in spool.registros)
+    assert fuente.error is None and fuente.terminado
+    assert fuente.encolado_total == fuente.filas_leidas == len(esperadas)
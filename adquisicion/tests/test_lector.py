@@ -0,0 +1,82 @@
+import gzip
+
+import pytest
+
+from app import lector
+
+ENCABEZADO = "ts,machine_id,actuator_id,motor_temp_c,motor_rpm,motor_vibration_rms\n"
+
+
+def linea(i: int) -> str:
+    return f"2026-01-10T00:{i // 60 % 60:02d}:{i % 60:02d}Z,arm_01,base,{i},1000,0.1\n"
+
+
+def escribir(tmp_path, nombre: str, lineas: list) -> str:
+    ruta = tmp_path / nombre
+    texto = ENCABEZADO + "".join(lineas)
+    if nombre.endswith(".gz"):
+        with gzip.open(ruta, "wt") as f:
+            f.write(texto)
+    else:
+        ruta.write_text(texto)
+    return str(ruta)
+
+
+@pytest.fixture(autouse=True)
+def bloques_chicos(monkeypatch):
+    # Varios bloques y entradas de índice aun con pocos KB
+    monkeypatch.setattr(lector, "BYTES_BLOQUE", 2000)
+    monkeypatch.setattr(lector, "PASO_INDICE", 3000)
+    lector._indices.clear()
+
+
+def temps(ruta: str, **kw) -> list:
+    return [int(t) for b in lector.abrir(ruta).bloques(**kw) for t in b["motor_temp_c"]]
+
+
+def test_salto_por_fila_y_ts_con_el_indice(tmp_path):
+    ruta = escribir(tmp_path, "a.csv", [linea(i) for i in range(2000)])
+    assert len(lector.abrir(ruta).indice()) > 3
+    assert temps(ruta) == list(range(2000))
+    for desde in (1, 777, 1999):
+        assert temps(ruta, fila_desde=desde) == list(range(desde, 2000))
+    # ts_desde sólo acerca el comienzo: nunca salta filas >= ts_desde
+    t = lector.parsear_ts("2026-01-10T00:20:00Z")
+    primeros = temps(ruta, ts_desde=t)
+    assert primeros[-1] == 1999 and primeros[0] <= 1200 and primeros[0] > 0
+
+
+@pytest.mark.parametrize("nombre", ["b.csv", "b.csv.gz"])
+def test_lineas_malas_conservan_la_numeracion(tmp_path, nombre):
+    lineas = [linea(i) for i in range(600)]
+    lineas[3] = "\n"                                                  # vacía
+    lineas[10] = "2026-01-10T00:00:10Z,arm_01,base,10,1000,0.1,extra\n"  # 7 campos
+    lineas[11] = "2026-01-10T00:00:11Z,arm_01,base,11,1000\n"           # 5 campos
+    lineas[400] = "2026-01-10T00:06:40Z,arm_01,base,N/A,1000,0.1\n"     # no numérica
+    ruta = escribir(tmp_path, nombre, lineas)
+    validas = [i for i in range(600) if i not in (3, 10, 11, 400)]
+
+    assert temps(ruta) == validas
+    for desde in (3, 9, 11, 12, 399, 400, 401):
+        assert temps(ruta, fila_desde=desde) == [i for i in validas if i >= desde]
+    for b in lector.abrir(ruta).bloques():
+        for k, t in enumerate(b["motor_temp_c"]):
+            assert b.indice(int(t)) == k
+
+
+def test_gzip_igual_que_plano(tmp_path):
+    lineas = [linea(i) for i in range(1500)]
+    plano, comprimido = escribir(tmp_path, "c.csv", lineas), escribir(tmp_path, "c.csv.gz", lineas)
+    assert lector.abrir(comprimido).comprimido
+    assert temps(comprimido) == temps(plano)
+    assert temps(comprimido, fila_desde=1234) == list(range(1234, 1500))
+
+
+def test_zstd_igual_que_plano(tmp_path):
+    zstandard = pytest.importorskip("zstandard")
+    lineas = [linea(i) for i in range(1500)]
+    plano = escribir(tmp_path, "d.csv", lineas)
+    ruta = tmp_path / "d.csv.zst"
+    ruta.write_bytes(zstandard.ZstdCompressor().compress((ENCABEZADO + "".join(lineas)).encode()))
+    assert temps(str(ruta)) == temps(plano)
+    assert temps(str(ruta), fila_desde=700) == list(range(700, 1500))
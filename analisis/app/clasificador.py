@@ -0,0 +1,100 @@
+import numpy as np
+
+# Umbrales compartidos por la versión escalar y la vectorizada
+TEMP_CRITICA = 70
+TEMP_ALTA = 55
+VIB_CRITICA = 0.65
+VIB_ALTA = 0.30
+RPM_CRITICA_BAJA = 200
+RPM_BAJA = 400
+RPM_CRITICA_ALTA = 2200
+RPM_ALTA = 1800
+
+# Bit i de la máscara = RAZONES[i]. El orden es el mismo en que evaluar_estado
+# agrega las razones, así decodificar por bits ascendentes da la misma lista.
+RAZONES = [
+    "temp_critica",
+    "temp_alta",
+    "vib_critica",
+    "vib_alta",
+    "rpm_critica_baja",
+    "rpm_baja",
+    "rpm_critica_alta",
+    "rpm_alta",
+]
+BIT = {r: 1 << i for i, r in enumerate(RAZONES)}
+MASCARA_CRITICA = sum(b for r, b in BIT.items() if "critica" in r)
+
+ESTADOS = ["normal", "warning", "critical"]
+
+# Lista de razones para cada máscara posible (8 bits)
+RAZONES_POR_MASCARA = [
+    [r for i, r in enumerate(RAZONES) if m & (1 << i)]
+    for m in range(1 << len(RAZONES))
+]
+
+
+def evaluar_estado(temp_c: float, rpm: float, vib: float):
+    razones = []
+
+    # Temperatura
+    if temp_c >= TEMP_CRITICA:
+        razones.append("temp_critica")
+    elif temp_c >= TEMP_ALTA:
+        razones.append("temp_alta")
+
+    # Vibración
+    if vib >= VIB_CRITICA:
+        razones.append("vib_critica")
+    elif vib >= VIB_ALTA:
+        razones.append("vib_alta")
+
+    # RPM
+    if rpm < RPM_CRITICA_BAJA:
+        razones.append("rpm_critica_baja")
+    elif rpm < RPM_BAJA:
+        razones.append("rpm_baja")
+
+    if rpm > RPM_CRITICA_ALTA:
+        razones.append("rpm_critica_alta")
+    elif rpm > RPM_ALTA:
+        razones.append("rpm_alta")
+
+    if any("critica" in r for r in razones):
+        return "critical", razones
+    if razones:
+        return "warning", razones
+    return "normal", razones
+
+
+def evaluar_estado_lote(temp_c, rpm, vib):
+    """
+    Versión vectorizada de evaluar_estado sobre arreglos columnares.
+
+    Retorna (estados, mascaras): estados uint8 con índices en ESTADOS y
+    mascaras uint8 con un bit por razón (ver RAZONES). Para toda entrada,
+    decodificar cada fila da exactamente lo mismo que la versión escalar.
+    """
+    temp_c = np.asarray(temp_c, dtype=np.float64)
+    rpm = np.asarray(rpm, dtype=np.float64)
+    vib = np.asarray(vib, dtype=np.float64)
+
+    mascaras = np.zeros(temp_c.shape, dtype=np.uint8)
+    mascaras |= np.where(temp_c >= TEMP_CRITICA, BIT["temp_critica"],
+                         np.where(temp_c >= TEMP_ALTA, BIT["temp_alta"], 0)).astype(np.uint8)
+    mascaras |= np.where(vib >= VIB_CRITICA, BIT["vib_critica"],
+                         np.where(vib >= VIB_ALTA, BIT["vib_alta"], 0)).astype(np.uint8)
+    mascaras |= np.where(rpm < RPM_CRITICA_BAJA, BIT["rpm_critica_baja"],
+                         np.where(rpm < RPM_BAJA, BIT["rpm_baja"], 0)).astype(np.uint8)
+    mascaras |= np.where(rpm > RPM_CRITICA_ALTA, BIT["rpm_critica_alta"],
+                         np.where(rpm > RPM_ALTA, BIT["rpm_alta"], 0)).astype(np.uint8)
+
+    estados = np.where(mascaras & MASCARA_CRITICA, 2, np.where(mascaras != 0, 1, 0)).astype(np.uint8)
+    return estados, mascaras
+
+
+def decodificar(estado: int, mascara: int):
+    """
+    (código de estado, máscara) -> (state, reasons) como en evaluar_estado.
+    """
+    return ESTADOS[estado], list(RAZONES_POR_MASCARA[mascara])
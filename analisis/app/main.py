@@ -1,104 +1,393 @@
 import os
-import requests
-from fastapi import FastAPI, HTTPException
-
-app = FastAPI(title="Servicio de Análisis")
+import json
+import math
+import time
+import asyncio
+import httpx
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from app import binario, metricas
+from app.ventanas import MotorVentanas
+from app.clasificador import evaluar_estado, evaluar_estado_lote, decodificar
+from app.spool import Spool, SpoolLleno, Descartar, entregar_partiendo
 
 HISTORY_URL = os.getenv("HISTORY_URL", "http://historial_ui:8003")
+MAX_EN_VUELO = int(os.getenv("MAX_EN_VUELO", "64"))              # ingestas simultáneas antes de responder 503
+HTTP_MAX_CONEXIONES = int(os.getenv("HTTP_MAX_CONEXIONES", "20"))  # conexiones keep-alive hacia historial
+VENTANA_N = int(os.getenv("VENTANA_N", "10"))            # máx. muestras por ventana (por actuador)
+VENTANA_SEG = float(os.getenv("VENTANA_SEG", "0"))       # antigüedad máx. en la ventana; 0 = sin límite
+SPOOL_DIR = os.getenv("SPOOL_DIR", "/spool")
+SPOOL_MAX_MB = int(os.getenv("SPOOL_MAX_MB", "512"))
+SPOOL_SEGMENTO_MB = int(os.getenv("SPOOL_SEGMENTO_MB", "16"))
+SPOOL_FSYNC_SEG = float(os.getenv("SPOOL_FSYNC_SEG", "0.02"))  # ventana de fsync agrupado
+FORMATO_HISTORIAL = os.getenv("FORMATO_HISTORIAL", "json")      # json | binario (ver app/binario.py)
+
+# Cliente HTTP compartido (pool keep-alive). Se puede reemplazar el transporte,
+# p. ej. httpx.ASGITransport(app=...) para correr historial en el mismo proceso.
+http = {"cliente": None}
+
+ventanas = MotorVentanas(VENTANA_N, VENTANA_SEG)
+
+# Muestras y diagnósticos se escriben en el spool antes de responder; el
+# drenado los entrega a historial en orden y con reintentos. Se crea en el
+# lifespan (abre archivos y crea SPOOL_DIR), no al importar.
+durable = {"spool": None}
 
-def evaluar_estado(temp_c: float, rpm: float, vib: float):
-    razones = []
+contadores = {
+    "en_vuelo": 0,
+    "rechazados_total": 0,
+}
 
-    # Temperatura
-    if temp_c >= 70:
-        razones.append("temp_critica")
-    elif temp_c >= 55:
-        razones.append("temp_alta")
+H_VALIDACION = metricas.histograma("analisis_validacion_seconds", "Validación de un request de ingesta")
+H_CLASIFICACION = metricas.histograma("analisis_clasificacion_seconds", "Ventanas + clasificación de un request de ingesta")
+H_SPOOL = metricas.histograma("analisis_spool_agregar_seconds", "Escritura al spool con fsync agrupado")
+C_MUESTRAS = metricas.contador("analisis_muestras_total", "Muestras aceptadas")
+C_RECHAZADAS = metricas.contador("analisis_filas_rechazadas_total", "Filas del spool que historial rechazó (4xx) y se descartaron")
 
-    # Vibración
-    if vib >= 0.65:
-        razones.append("vib_critica")
-    elif vib >= 0.30:
-        razones.append("vib_alta")
+metricas.medidor("analisis_en_vuelo", "Ingestas en curso", lambda: contadores["en_vuelo"])
+metricas.medidor("analisis_rechazados_total", "Ingestas rechazadas por saturación (503)", lambda: contadores["rechazados_total"], tipo="counter")
+metricas.medidor("analisis_spool_registros", "Registros pendientes en el spool", lambda: durable["spool"].registros_pendientes)
+metricas.medidor("analisis_spool_bytes", "Bytes pendientes en el spool", lambda: durable["spool"].bytes_pendientes)
+metricas.medidor("analisis_spool_lag_seconds", "Antigüedad del registro más viejo del spool", lambda: durable["spool"].estado()["lag_seg"])
+metricas.medidor("analisis_spool_reintentos_total", "Reintentos de entrega del spool", lambda: durable["spool"].reintentos_total, tipo="counter")
+metricas.medidor("analisis_spool_descartados_total", "Registros descartados por el spool", lambda: durable["spool"].descartados_total, tipo="counter")
 
-    # RPM
-    if rpm < 200:
-        razones.append("rpm_critica_baja")
-    elif rpm < 400:
-        razones.append("rpm_baja")
 
-    if rpm > 2200:
-        razones.append("rpm_critica_alta")
-    elif rpm > 1800:
-        razones.append("rpm_alta")
+def crear_cliente(transport=None) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=HISTORY_URL,
+        timeout=httpx.Timeout(10.0, connect=5.0),
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONEXIONES, max_keepalive_connections=HTTP_MAX_CONEXIONES),
+        transport=transport,
+    )
 
-    if any("critica" in r for r in razones):
-        return "critical", razones
-    if razones:
-        return "warning", razones
-    return "normal", razones
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if http["cliente"] is None:
+        http["cliente"] = crear_cliente()
+    if durable["spool"] is None:
+        durable["spool"] = Spool(SPOOL_DIR, SPOOL_MAX_MB << 20, SPOOL_SEGMENTO_MB << 20, SPOOL_FSYNC_SEG)
+    drenado = asyncio.create_task(durable["spool"].drenar(entregar))
+    yield
+    drenado.cancel()
+    await http["cliente"].aclose()
+    http["cliente"] = None
+
+
+app = FastAPI(title="Servicio de Análisis", lifespan=lifespan)
 
 @app.get("/api/v1/health")
 def health():
-    return {"ok": True, "servicio": "analisis"}
+    return {"ok": True, "servicio": "analisis", "max_en_vuelo": MAX_EN_VUELO, **contadores, "spool": durable["spool"].estado()}
 
 
-@app.post("/api/v1/ingest")
-def ingest(muestra: dict):
-    required = ["ts", "machine_id", "actuator_id", "motor_temp_c", "motor_rpm", "motor_vibration_rms"]
-    missing = [k for k in required if k not in muestra]
-    if missing:
-        raise HTTPException(status_code=422, detail=f"Faltan campos: {missing}")
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(metricas.exponer(), media_type="text/plain; version=0.0.4")
 
+
+@asynccontextmanager
+async def cupo_en_vuelo():
+    """
+    Limita las ingestas concurrentes; sobre el límite se rechaza con 503
+    en vez de encolar sin fin (el cliente reintenta según Retry-After).
+    """
+    if contadores["en_vuelo"] >= MAX_EN_VUELO:
+        contadores["rechazados_total"] += 1
+        raise HTTPException(status_code=503, detail="Análisis saturado, reintenta", headers={"Retry-After": "1"})
+    contadores["en_vuelo"] += 1
     try:
-        ts = str(muestra["ts"])
-        machine_id = str(muestra["machine_id"])
-        actuator_id = str(muestra["actuator_id"])
-        temp_c = float(muestra["motor_temp_c"])
-        rpm = float(muestra["motor_rpm"])
-        vib = float(muestra["motor_vibration_rms"])
-    except Exception as e:
-        raise HTTPException(status_code=422, detail=f"Datos inválidos: {e}")
-
-    # 1) Guardar muestra en historial
-    payload_muestra = {
-        "ts": ts,
-        "machine_id": machine_id,
-        "actuator_id": actuator_id,
-        "motor_temp_c": temp_c,
-        "motor_rpm": rpm,
-        "motor_vibration_rms": vib,
-    }
+        yield
+    finally:
+        contadores["en_vuelo"] -= 1
+
+
+async def _post(ruta: str, payload):
+    if http["cliente"] is None:
+        http["cliente"] = crear_cliente()
+    t0 = time.perf_counter()
+    try:
+        r = await http["cliente"].post(ruta, **cuerpo_para(ruta, payload))
+        r.raise_for_status()
+    except Exception:
+        C_POST_ERROR[ruta].inc()
+        raise
+    finally:
+        H_POST[ruta].observar(time.perf_counter() - t0)
+
 
+DESTINOS = (("muestras", "/api/v1/samples/batch"), ("diagnosticos", "/api/v1/diagnostics/batch"))
+CODIFICAR = {
+    "/api/v1/samples/batch": binario.codificar_muestras,
+    "/api/v1/diagnostics/batch": binario.codificar_diagnosticos,
+}
+
+
+def cuerpo_para(ruta: str, payload) -> dict:
+    """
+    Argumentos del POST: binario si FORMATO_HISTORIAL lo pide y el lote se
+    puede codificar; si no, JSON (p. ej. un ts que no es ISO-8601).
+    """
+    if FORMATO_HISTORIAL == "binario":
+        try:
+            return {"content": CODIFICAR[ruta](payload), "headers": {"content-type": binario.TIPO_CONTENIDO}}
+        except (ValueError, TypeError, KeyError):
+            pass
+    return {"json": payload}
+
+H_POST = {
+    ruta: metricas.histograma("analisis_post_historial_seconds", "POST de un lote a historial", {"destino": parte})
+    for parte, ruta in DESTINOS
+}
+C_POST_ERROR = {
+    ruta: metricas.contador("analisis_post_historial_errores_total", "POST a historial fallidos", {"destino": parte})
+    for parte, ruta in DESTINOS
+}
+
+
+async def _enviar(ruta: str, filas: list):
+    """
+    POST de un trozo; 4xx (salvo 408/429) es permanente y se lanza como Descartar.
+    """
     try:
-        requests.post(f"{HISTORY_URL}/api/v1/samples", json=payload_muestra, timeout=5).raise_for_status()
+        await _post(ruta, filas)
+    except httpx.HTTPStatusError as e:
+        codigo = e.response.status_code
+        if 400 <= codigo < 500 and codigo not in (408, 429):
+            raise Descartar(f"historial rechazó el lote ({codigo}): {e.response.text[:200]}")
+        raise
+
+
+async def _entregar_parte(registro: dict, parte: str, ruta: str):
+    def guardar(restantes):
+        registro[parte] = restantes
+
+    rechazadas = await entregar_partiendo(lambda filas: _enviar(ruta, filas), registro[parte], guardar)
+    registro["hechos"].append(parte)
+    for fila, error in rechazadas:
+        print(f"[analisis] Fila descartada ({parte}): {error} | {fila}")
+    C_RECHAZADAS.inc(len(rechazadas))
+
+
+async def entregar(registro: dict):
+    """
+    Drenado del spool: envía muestras y diagnósticos a historial en paralelo.
+    Lo que ya se guardó se quita del registro (o queda marcado en "hechos")
+    para no duplicarlo al reintentar. Si historial rechaza un lote se parte
+    hasta aislar las filas inválidas; sólo esas se descartan.
+    """
+    pendientes = [(parte, ruta) for parte, ruta in DESTINOS if parte not in registro["hechos"]]
+    resultados = await asyncio.gather(
+        *(_entregar_parte(registro, parte, ruta) for parte, ruta in pendientes),
+        return_exceptions=True,
+    )
+    for res in resultados:
+        if isinstance(res, Exception):
+            raise res
+
+
+def admitir():
+    """
+    Lugar en el spool antes de tocar las ventanas: un 503 por spool lleno
+    no deja efectos, así el reintento del cliente no suma dos veces sus
+    muestras a las ventanas.
+    """
+    try:
+        durable["spool"].admitir()
+    except SpoolLleno as e:
+        raise HTTPException(status_code=503, detail=f"Spool lleno, reintenta: {e}", headers={"Retry-After": "5"})
+
+
+async def encolar(muestras: list, diagnosticos: list):
+    """
+    Escribe el par muestras/diagnósticos en el spool ya admitido por
+    admitir() (retorna tras el fsync).
+    """
+    t0 = time.perf_counter()
+    registro = {"muestras": muestras, "diagnosticos": diagnosticos, "hechos": []}
+    await asyncio.to_thread(durable["spool"].agregar, registro, True, True)
+    H_SPOOL.observar(time.perf_counter() - t0)
+    C_MUESTRAS.inc(len(muestras))
+
+
+CAMPOS_REQUERIDOS = ["ts", "machine_id", "actuator_id", "motor_temp_c", "motor_rpm", "motor_vibration_rms"]
+METRICAS_MUESTRA = ("motor_temp_c", "motor_rpm", "motor_vibration_rms")
+
+
+@lru_cache(maxsize=1 << 16)
+def normalizar_ts(texto: str) -> str:
+    """
+    ts ISO-8601 -> mismo instante en UTC ("...Z"), como lo guarda historial
+    (sin zona se asume UTC). Lanza ValueError si no parsea.
+    """
+    return binario.ms_a_ts(binario.ts_a_ms(texto))
+
+
+def validar_muestra(muestra: dict) -> dict:
+    """
+    Valida y normaliza tipos de una lectura cruda.
+    Lanza ValueError con el detalle si falta algo o no convierte.
+    """
+    if not isinstance(muestra, dict):
+        raise ValueError("Se esperaba un objeto")
+    missing = [k for k in CAMPOS_REQUERIDOS if k not in muestra]
+    if missing:
+        raise ValueError(f"Faltan campos: {missing}")
+
+    if not isinstance(muestra["ts"], str):
+        raise ValueError("ts debe ser texto ISO-8601")
+    try:
+        validada = {
+            "ts": normalizar_ts(muestra["ts"]),
+            "machine_id": str(muestra["machine_id"]),
+            "actuator_id": str(muestra["actuator_id"]),
+            "motor_temp_c": float(muestra["motor_temp_c"]),
+            "motor_rpm": float(muestra["motor_rpm"]),
+            "motor_vibration_rms": float(muestra["motor_vibration_rms"]),
+        }
     except Exception as e:
-        raise HTTPException(status_code=502, detail=f"No pude guardar muestra en historial: {e}")
+        raise ValueError(f"Datos inválidos: {e}")
+    # Lo que historial no aceptaría no entra al spool: mejor un 422 ahora
+    if not all(math.isfinite(validada[c]) for c in METRICAS_MUESTRA):
+        raise ValueError("Datos inválidos: métricas no finitas")
+    return validada
 
-    # 2) Diagnóstico simple por umbrales
-    state, reasons = evaluar_estado(temp_c, rpm, vib)
 
-    # Mantengo nombres "mean/rms" para compatibilidad con UI existente
-    metrics = {
-        "temp_mean": temp_c,
-        "rpm_mean": rpm,
-        "vib_rms": vib,
-        "n_ventana": 1,
-    }
+def construir_diagnostico(m: dict) -> dict:
+    # Se clasifica sobre la ventana del actuador, no sobre la lectura suelta
+    metrics = ventanas.actualizar(m)
+    state, reasons = evaluar_estado(metrics["temp_mean"], metrics["rpm_mean"], metrics["vib_rms"])
 
-    diagnostico = {
-        "ts": ts,
-        "machine_id": machine_id,
-        "actuator_id": actuator_id,
+    return {
+        "ts": m["ts"],
+        "machine_id": m["machine_id"],
+        "actuator_id": m["actuator_id"],
         "state": state,
         "reasons": reasons,
         "metrics": metrics,
     }
 
+
+def construir_diagnosticos(ms: list) -> list:
+    """
+    Versión por lote: actualiza las ventanas fila a fila y clasifica
+    todas las filas en una sola pasada vectorizada.
+    """
+    lista_metricas = [ventanas.actualizar(m) for m in ms]
+    estados, mascaras = evaluar_estado_lote(
+        [x["temp_mean"] for x in lista_metricas],
+        [x["rpm_mean"] for x in lista_metricas],
+        [x["vib_rms"] for x in lista_metricas],
+    )
+
+    diagnosticos = []
+    for m, metrics, e, b in zip(ms, lista_metricas, estados.tolist(), mascaras.tolist()):
+        state, reasons = decodificar(e, b)
+        diagnosticos.append({
+            "ts": m["ts"],
+            "machine_id": m["machine_id"],
+            "actuator_id": m["actuator_id"],
+            "state": state,
+            "reasons": reasons,
+            "metrics": metrics,
+        })
+    return diagnosticos
+
+
+def muestras_del_cuerpo(cuerpo: bytes, content_type, lote: bool) -> list:
+    """
+    Cuerpo de /ingest(/batch) -> lista de muestras validadas. El binario se
+    valida por columnas al decodificar (sin pasar por dicts ni float() por
+    campo); el JSON, fila a fila con validar_muestra. Lanza 422.
+    """
+    if binario.es_binario(content_type):
+        try:
+            muestras = binario.muestras(*binario.decodificar(cuerpo, binario.MUESTRAS))
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        if not lote and len(muestras) != 1:
+            raise HTTPException(status_code=422, detail=f"Se esperaba una muestra, llegaron {len(muestras)}")
+        return muestras
+
     try:
-        requests.post(f"{HISTORY_URL}/api/v1/diagnostics", json=diagnostico, timeout=5).raise_for_status()
-    except Exception as e:
-        raise HTTPException(status_code=502, detail=f"No pude guardar diagnóstico en historial: {e}")
+        datos = json.loads(cuerpo)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"JSON inválido: {e}")
+    if not lote:
+        try:
+            return [validar_muestra(datos)]
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    if not isinstance(datos, list):
+        raise HTTPException(status_code=422, detail="Se esperaba un arreglo de muestras")
+    muestras = []
+    for i, muestra in enumerate(datos):
+        try:
+            muestras.append(validar_muestra(muestra))
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=f"Fila {i}: {e}")
+    return muestras
+
+
+@app.post("/api/v1/ingest")
+async def ingest(request: Request):
+    """
+    Una lectura, en JSON o en el formato binario (content-type
+    application/x-actuadores, ver app/binario.py).
+    """
+    cuerpo = await request.body()
+    async with cupo_en_vuelo():
+        t0 = time.perf_counter()
+        payload_muestra = muestras_del_cuerpo(cuerpo, request.headers.get("content-type"), lote=False)[0]
+        t1 = time.perf_counter()
+        admitir()
+
+        # Diagnóstico simple por umbrales
+        diagnostico = construir_diagnostico(payload_muestra)
+        H_VALIDACION.observar(t1 - t0)
+        H_CLASIFICACION.observar(time.perf_counter() - t1)
+
+        # Queda durable en el spool; el drenado lo lleva a historial
+        await encolar([payload_muestra], [diagnostico])
+
+    return {
+        "accepted": True,
+        "state": diagnostico["state"],
+        "reasons": diagnostico["reasons"],
+        "metrics": diagnostico["metrics"],
+    }
+
+
+@app.post("/api/v1/ingest/batch")
+async def ingest_batch(request: Request):
+    """
+    Igual que /ingest pero para un arreglo de lecturas (o un cuerpo binario
+    con varias). Va al spool como un solo registro: un POST de muestras y
+    uno de diagnósticos hacia historial.
+    """
+    cuerpo = await request.body()
+    async with cupo_en_vuelo():
+        t0 = time.perf_counter()
+        payload_muestras = muestras_del_cuerpo(cuerpo, request.headers.get("content-type"), lote=True)
+        t1 = time.perf_counter()
+        H_VALIDACION.observar(t1 - t0)
+
+        if not payload_muestras:
+            return {"accepted": 0, "items": []}
+        admitir()
 
-    return {"accepted": True, "state": state, "reasons": reasons, "metrics": metrics}
+        diagnosticos = construir_diagnosticos(payload_muestras)
+        H_CLASIFICACION.observar(time.perf_counter() - t1)
+
+        await encolar(payload_muestras, diagnosticos)
+
+    return {
+        "accepted": len(diagnosticos),
+        "items": [
+            {"state": d["state"], "reasons": d["reasons"], "metrics": d["metrics"]}
+            for d in diagnosticos
+        ],
+    }
@@ -0,0 +1,136 @@
+import math
+import time
+from array import array
+from datetime import datetime, timezone
+
+
+def ts_a_segundos(ts: str) -> float:
+    """
+    Convierte el ts ISO-8601 de la muestra a epoch en segundos (sin zona se
+    asume UTC, como en historial). Si no se puede interpretar, usa la hora
+    de llegada.
+    """
+    try:
+        t = datetime.fromisoformat(ts)
+    except (TypeError, ValueError):
+        return time.time()
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=timezone.utc)
+    return t.timestamp()
+
+
+class Ventana:
+    """
+    Ventana deslizante de un actuador sobre un ring buffer de tamaño fijo.
+
+    Mantiene media y varianza (Welford, con remoción) de temp y rpm, y la
+    suma de cuadrados de vibración para el RMS. Cada muestra cuesta O(1)
+    amortizado: entra una y salen las que exceden el tamaño o la antigüedad.
+    """
+
+    __slots__ = (
+        "n_max", "max_seg", "ts", "temp", "rpm", "vib", "inicio", "n", "removidas",
+        "temp_media", "temp_m2", "rpm_media", "rpm_m2", "vib_sc",
+    )
+
+    def __init__(self, n_max: int, max_seg: float = 0.0):
+        self.n_max = n_max
+        self.max_seg = max_seg
+        self.ts = array("d", bytes(8 * n_max))
+        self.temp = array("d", bytes(8 * n_max))
+        self.rpm = array("d", bytes(8 * n_max))
+        self.vib = array("d", bytes(8 * n_max))
+        self.inicio = 0
+        self.n = 0
+        self.removidas = 0
+        self.temp_media = self.temp_m2 = 0.0
+        self.rpm_media = self.rpm_m2 = 0.0
+        self.vib_sc = 0.0
+
+    def agregar(self, t: float, temp: float, rpm: float, vib: float):
+        if self.n == self.n_max:
+            self._quitar_mas_antigua()
+        if self.max_seg > 0:
+            limite = t - self.max_seg
+            while self.n and self.ts[self.inicio] < limite:
+                self._quitar_mas_antigua()
+
+        i = (self.inicio + self.n) % self.n_max
+        self.ts[i], self.temp[i], self.rpm[i], self.vib[i] = t, temp, rpm, vib
+        self.n += 1
+
+        d = temp - self.temp_media
+        self.temp_media += d / self.n
+        self.temp_m2 += d * (temp - self.temp_media)
+
+        d = rpm - self.rpm_media
+        self.rpm_media += d / self.n
+        self.rpm_m2 += d * (rpm - self.rpm_media)
+
+        self.vib_sc += vib * vib
+
+    def _quitar_mas_antigua(self):
+        i = self.inicio
+        temp, rpm, vib = self.temp[i], self.rpm[i], self.vib[i]
+        self.inicio = (i + 1) % self.n_max
+        self.n -= 1
+
+        if self.n == 0:
+            self.temp_media = self.temp_m2 = 0.0
+            self.rpm_media = self.rpm_m2 = 0.0
+            self.vib_sc = 0.0
+            return
+
+        d = temp - self.temp_media
+        self.temp_media -= d / self.n
+        self.temp_m2 -= d * (temp - self.temp_media)
+
+        d = rpm - self.rpm_media
+        self.rpm_media -= d / self.n
+        self.rpm_m2 -= d * (rpm - self.rpm_media)
+
+        self.vib_sc -= vib * vib
+
+        # Cada vuelta completa se recalcula exacto para no acumular error de redondeo
+        self.removidas += 1
+        if self.removidas >= self.n_max:
+            self._recalcular()
+
+    def _recalcular(self):
+        self.removidas = 0
+        idx = [(self.inicio + k) % self.n_max for k in range(self.n)]
+        self.temp_media = sum(self.temp[i] for i in idx) / self.n
+        self.rpm_media = sum(self.rpm[i] for i in idx) / self.n
+        self.temp_m2 = sum((self.temp[i] - self.temp_media) ** 2 for i in idx)
+        self.rpm_m2 = sum((self.rpm[i] - self.rpm_media) ** 2 for i in idx)
+        self.vib_sc = sum(self.vib[i] * self.vib[i] for i in idx)
+
+    def metricas(self) -> dict:
+        n = self.n
+        return {
+            "temp_mean": self.temp_media,
+            "temp_std": math.sqrt(max(self.temp_m2, 0.0) / (n - 1)) if n > 1 else 0.0,
+            "rpm_mean": self.rpm_media,
+            "rpm_std": math.sqrt(max(self.rpm_m2, 0.0) / (n - 1)) if n > 1 else 0.0,
+            "vib_rms": math.sqrt(max(self.vib_sc, 0.0) / n) if n else 0.0,
+            "n_ventana": n,
+        }
+
+
+class MotorVentanas:
+    """
+    Una Ventana por (machine_id, actuator_id); memoria constante por actuador.
+    """
+
+    def __init__(self, n_max: int, max_seg: float = 0.0):
+        self.n_max = max(1, n_max)
+        self.max_seg = max_seg
+        self.ventanas = {}
+
+    def actualizar(self, m: dict) -> dict:
+        clave = (m["machine_id"], m["actuator_id"])
+        v = self.ventanas.get(clave)
+        if v is None:
+            v = self.ventanas[clave] = Ventana(self.n_max, self.max_seg)
+        v.agregar(ts_a_segundos(m["ts"]), m["motor_temp_c"], m["motor_rpm"], m["motor_vibration_rms"])
+        return v.metricas()
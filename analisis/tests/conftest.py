@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# Spool descartable para toda la sesión; app.main lee SPOOL_DIR al importarse
+os.environ.setdefault("SPOOL_DIR", tempfile.mkdtemp(prefix="analisis-spool-"))
@@ -0,0 +1,39 @@
+import math
+
+import numpy as np
+from hypothesis import given, strategies as st
+
+from app.clasificador import (
+    TEMP_ALTA, TEMP_CRITICA, VIB_ALTA, VIB_CRITICA, RPM_CRITICA_BAJA, RPM_BAJA, RPM_ALTA, RPM_CRITICA_ALTA,
+    evaluar_estado, evaluar_estado_lote, decodificar,
+)
+
+
+def bordes(*umbrales):
+    # Cada umbral, sus vecinos de punto flotante y los valores especiales
+    valores = [math.nan, math.inf, -math.inf, 0.0, -0.0]
+    for u in umbrales:
+        valores += [u, math.nextafter(u, -math.inf), math.nextafter(u, math.inf)]
+    return st.one_of(st.sampled_from(valores), st.floats(allow_nan=True, allow_infinity=True))
+
+
+TEMPS = bordes(TEMP_ALTA, TEMP_CRITICA)
+VIBS = bordes(VIB_ALTA, VIB_CRITICA)
+RPMS = bordes(RPM_CRITICA_BAJA, RPM_BAJA, RPM_ALTA, RPM_CRITICA_ALTA)
+
+
+@given(st.lists(st.tuples(TEMPS, RPMS, VIBS), max_size=50))
+def test_lote_igual_a_escalar(filas):
+    temps = [f[0] for f in filas]
+    rpms = [f[1] for f in filas]
+    vibs = [f[2] for f in filas]
+    estados, mascaras = evaluar_estado_lote(temps, rpms, vibs)
+    assert len(estados) == len(mascaras) == len(filas)
+    for fila, e, m in zip(filas, estados.tolist(), mascaras.tolist()):
+        assert decodificar(e, m) == evaluar_estado(*fila)
+
+
+@given(TEMPS, RPMS, VIBS)
+def test_lote_de_una_fila(temp, rpm, vib):
+    estados, mascaras = evaluar_estado_lote(np.array([temp]), np.array([rpm]), np.array([vib]))
+    assert decodificar(int(estados[0]), int(mascaras[0])) == evaluar_estado(temp, rpm, vib)
@@ -0,0 +1,24 @@
+import filecmp
+import os
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SERVICIOS = ("adquisicion", "analisis", "historial_ui")
+
+# Módulos copiados tal cual en cada servicio que los usa
+COMPARTIDOS = {
+    "binario.py": SERVICIOS,
+    "metricas.py": SERVICIOS,
+    "spool.py": ("adquisicion", "analisis"),
+}
+
+
+@pytest.mark.parametrize("modulo", sorted(COMPARTIDOS))
+def test_copias_identicas(modulo):
+    rutas = [os.path.join(RAIZ, s, "app", modulo) for s in COMPARTIDOS[modulo]]
+    presentes = [r for r in rutas if os.path.exists(r)]
+    if len(presentes) < 2:
+        pytest.skip("sólo un servicio en este árbol (p. ej. dentro de su contexto de build)")
+    distintas = [r for r in presentes[1:] if not filecmp.cmp(presentes[0], r, shallow=False)]
+    assert not distintas, f"{modulo} difiere entre {presentes[0]} y {distintas}: aplica el cambio en todas las copias"
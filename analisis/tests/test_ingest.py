@@ -0,0 +1,59 @@
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app import binario, main
+
+
+@pytest.fixture
+def cliente():
+    # Historial de mentira: acepta todo lo que drena el spool
+    main.http["cliente"] = main.crear_cliente(httpx.MockTransport(lambda req: httpx.Response(200, json={})))
+    with TestClient(main.app) as c:
+        yield c
+
+
+def lote(actuador: str, n: int) -> list:
+    return [
+        {"ts": f"2026-01-10T12:00:{i:02d}Z", "machine_id": "arm_test", "actuator_id": actuador,
+         "motor_temp_c": 40.0 + i, "motor_rpm": 1000.0, "motor_vibration_rms": 0.1}
+        for i in range(n)
+    ]
+
+
+def test_spool_lleno_no_toca_las_ventanas(cliente, monkeypatch):
+    r = cliente.post("/api/v1/ingest/batch", json=lote("lleno", 3))
+    assert r.status_code == 200 and r.json()["items"][-1]["metrics"]["n_ventana"] == 3
+
+    # Spool lleno: 503 con Retry-After y el cliente reintenta el mismo lote
+    monkeypatch.setattr(main.durable["spool"], "max_bytes", 0)
+    for _ in range(3):
+        r = cliente.post("/api/v1/ingest/batch", json=lote("lleno", 2))
+        assert r.status_code == 503 and "retry-after" in r.headers
+        r = cliente.post("/api/v1/ingest", json=lote("lleno", 1)[0])
+        assert r.status_code == 503
+    monkeypatch.undo()
+
+    r = cliente.post("/api/v1/ingest", json=lote("lleno", 1)[0])
+    assert r.status_code == 200 and r.json()["metrics"]["n_ventana"] == 4
+
+
+def test_ingest_acepta_binario(cliente):
+    cabecera = {"content-type": binario.TIPO_CONTENIDO}
+    muestras = lote("binario", 4)
+
+    r = cliente.post("/api/v1/ingest", content=binario.codificar_muestras(muestras[:1]), headers=cabecera)
+    assert r.status_code == 200 and r.json()["metrics"]["n_ventana"] == 1
+    r = cliente.post("/api/v1/ingest/batch", content=binario.codificar_muestras(muestras[1:]), headers=cabecera)
+    assert r.status_code == 200 and r.json()["accepted"] == 3
+    assert [i["metrics"]["n_ventana"] for i in r.json()["items"]] == [2, 3, 4]
+
+    # Igual que por JSON: mismas métricas para las mismas lecturas
+    json_ = cliente.post("/api/v1/ingest/batch", json=lote("json", 4)).json()["items"]
+    assert [i["metrics"] for i in json_][1:] == [i["metrics"] for i in r.json()["items"]]
+
+    # Varias muestras en /ingest o un cuerpo truncado: 422
+    r = cliente.post("/api/v1/ingest", content=binario.codificar_muestras(muestras), headers=cabecera)
+    assert r.status_code == 422
+    r = cliente.post("/api/v1/ingest/batch", content=binario.codificar_muestras(muestras)[:-3], headers=cabecera)
+    assert r.status_code == 422
@@ -0,0 +1,47 @@
+import asyncio
+
+from app.spool import Descartar, entregar_partiendo
+
+
+def entregar(filas, invalidas, caidas=()):
+    """
+    Entrega como el drenado del spool: ante un error transitorio reintenta
+    con lo que guardar() dejó pendiente. `caidas`: filas cuyo primer envío
+    falla con un error transitorio.
+    """
+    enviados, caidas = [], set(caidas)
+    pendientes = list(filas)
+
+    async def enviar(trozo):
+        if caidas & set(trozo):
+            caidas.difference_update(trozo)
+            raise ConnectionError("historial caído")
+        if invalidas & set(trozo):
+            raise Descartar("422")
+        enviados.extend(trozo)
+
+    def guardar(restantes):
+        pendientes[:] = restantes
+
+    while True:
+        try:
+            return asyncio.run(entregar_partiendo(enviar, list(pendientes), guardar)), enviados
+        except ConnectionError:
+            continue
+
+
+def test_solo_se_descartan_las_filas_invalidas():
+    rechazadas, enviados = entregar(range(10), {3, 7})
+    assert [f for f, _ in rechazadas] == [3, 7]
+    assert enviados == [0, 1, 2, 4, 5, 6, 8, 9]
+
+
+def test_lote_valido_va_entero():
+    rechazadas, enviados = entregar(range(5), set())
+    assert rechazadas == [] and enviados == [0, 1, 2, 3, 4]
+
+
+def test_reintento_no_duplica_lo_entregado():
+    rechazadas, enviados = entregar(range(8), {1}, caidas={6})
+    assert [f for f, _ in rechazadas] == [1]
+    assert enviados == [0, 2, 3, 4, 5, 6, 7]
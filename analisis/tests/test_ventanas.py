@@ -0,0 +1,15 @@
+import time
+
+from app.ventanas import ts_a_segundos
+
+
+def test_ts_sin_zona_es_utc(monkeypatch):
+    # Con una zona local distinta de UTC el resultado no debe cambiar
+    monkeypatch.setenv("TZ", "America/Santiago")
+    time.tzset()
+    try:
+        assert ts_a_segundos("2026-01-10T12:00:00") == ts_a_segundos("2026-01-10T12:00:00Z") == 1768046400.0
+        assert ts_a_segundos("2026-01-10T09:00:00-03:00") == 1768046400.0
+    finally:
+        monkeypatch.delenv("TZ")
+        time.tzset()
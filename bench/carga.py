@@ -0,0 +1,505 @@
+"""
+Generador de carga y benchmark de punta a punta.
+
+Levanta historial_ui y analisis con uvicorn en este equipo (base y spools
+en un directorio temporal), sintetiza muestras como las de
+datos/actuator_data.csv para N máquinas x M actuadores y mide:
+
+- ingesta: muestras/s sostenidas y latencia p50/p99 de /api/v1/ingest(/batch)
+  de analisis, y el tiempo hasta que todo quedó confirmado en historial;
+- por cada punto de llenado (1M y 10M filas por defecto): tamaño de la base,
+  bytes por fila y latencia de las consultas que hace el dashboard.
+
+El resultado va a un JSON (línea base). Con --comparar se contrasta contra
+una línea base anterior y se sale con código 1 si algo empeoró más que la
+tolerancia.
+
+Uso (desde la raíz del repo, con las dependencias de analisis e historial):
+
+    python bench/carga.py --maquinas 10 --actuadores 3 --tasa 5000 --duracion 30
+    python bench/carga.py --puntos 1000000 --salida bench/base.json
+    python bench/carga.py --comparar bench/base.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+# El codificador binario de analisis (mismo archivo en los tres servicios)
+sys.path.insert(0, str(RAIZ / "analisis"))
+from app import binario  # noqa: E402
+
+ACTUADORES = ["base", "hombro", "codo", "muneca", "pinza", "giro"]
+TS_INICIO = datetime(2026, 1, 10, tzinfo=timezone.utc).timestamp()
+
+LOTE_LLENADO = 2000          # filas por POST al llenar historial directo
+CLIENTES_LLENADO = 4
+
+
+# =========================
+# Datos sintéticos
+# =========================
+class Generador:
+    """
+    Una muestra por actuador y paso (1 s de ts por defecto), en el mismo
+    orden que el CSV de ejemplo. Paseo aleatorio alrededor de valores
+    normales con excursiones raras para que haya warnings y críticos.
+    """
+
+    def __init__(self, maquinas: int, actuadores: int, paso_seg: float = 1.0, semilla: int = 1):
+        self.series = [
+            (f"arm_{m:02d}", ACTUADORES[a % len(ACTUADORES)] + ("" if a < len(ACTUADORES) else f"_{a}"))
+            for m in range(1, maquinas + 1) for a in range(actuadores)
+        ]
+        self.paso_seg = paso_seg
+        self.t = TS_INICIO
+        self._azar = random.Random(semilla)
+        self._estado = {s: [45.0, 1150.0, 0.18] for s in self.series}
+        self._i = 0
+
+    def siguientes(self, n: int) -> list:
+        azar, muestras = self._azar, []
+        for _ in range(n):
+            if self._i == len(self.series):
+                self._i = 0
+                self.t += self.paso_seg
+            machine_id, actuator_id = self.series[self._i]
+            self._i += 1
+            v = self._estado[(machine_id, actuator_id)]
+            v[0] += 0.1 * (45.0 - v[0]) + azar.gauss(0, 0.6)
+            v[1] += 0.1 * (1150.0 - v[1]) + azar.gauss(0, 20)
+            v[2] += 0.1 * (0.18 - v[2]) + azar.gauss(0, 0.01)
+            temp, vib = v[0], abs(v[2])
+            if azar.random() < 0.002:
+                temp += azar.choice((15, 30))
+                vib += azar.choice((0.2, 0.6))
+            muestras.append({
+                "ts": self.ts(),
+                "machine_id": machine_id,
+                "actuator_id": actuator_id,
+                "motor_temp_c": round(temp, 1),
+                "motor_rpm": round(v[1]),
+                "motor_vibration_rms": round(vib, 3),
+            })
+        return muestras
+
+    def ts(self) -> str:
+        return datetime.fromtimestamp(self.t, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def diagnostico_de(m: dict) -> dict:
+    # Para llenar historial sin pasar por analisis: misma forma, umbrales simples
+    razones = []
+    if m["motor_temp_c"] >= 55:
+        razones.append("temp_alta")
+    if m["motor_vibration_rms"] >= 0.30:
+        razones.append("vib_alta")
+    return {
+        "ts": m["ts"],
+        "machine_id": m["machine_id"],
+        "actuator_id": m["actuator_id"],
+        "state": "warning" if razones else "normal",
+        "reasons": razones,
+        "metrics": {
+            "temp_mean": m["motor_temp_c"], "temp_std": 0.5,
+            "rpm_mean": m["motor_rpm"], "rpm_std": 10.0,
+            "vib_rms": m["motor_vibration_rms"],
+        },
+    }
+
+
+# =========================
+# Servicios
+# =========================
+def puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def levantar(servicio: str, modulo: str, puerto: int, env: dict, log) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", modulo, "--host", "127.0.0.1", "--port", str(puerto), "--log-level", "warning"],
+        cwd=RAIZ / servicio, env={**os.environ, **env}, stdout=log, stderr=subprocess.STDOUT,
+    )
+
+
+def esperar_listo(url: str, proceso: subprocess.Popen, timeout: float = 60):
+    fin = time.monotonic() + timeout
+    while time.monotonic() < fin:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"{url} terminó al arrancar (código {proceso.returncode})")
+        try:
+            if httpx.get(f"{url}/api/v1/health", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} no respondió en {timeout} s")
+
+
+def tamano_db(directorio: Path) -> int:
+    # Base + WAL + SHM: lo que ocupa en disco en este momento
+    return sum(p.stat().st_size for p in directorio.glob("app.db*"))
+
+
+def filas_historial(url: str, tabla: str = "muestras") -> int:
+    texto = httpx.get(f"{url}/metrics", timeout=10).text
+    clave = f'historial_filas_total{{tabla="{tabla}"}} '
+    for linea in texto.splitlines():
+        if linea.startswith(clave):
+            return int(float(linea[len(clave):]))
+    return 0
+
+
+# =========================
+# Estadística
+# =========================
+def percentil(valores: list, p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, max(0, math.ceil(p / 100 * len(ordenados)) - 1))]
+
+
+def resumen_ms(latencias: list) -> dict:
+    return {
+        "n": len(latencias),
+        "p50_ms": round(percentil(latencias, 50) * 1000, 3),
+        "p99_ms": round(percentil(latencias, 99) * 1000, 3),
+        "max_ms": round(max(latencias, default=0) * 1000, 3),
+    }
+
+
+# =========================
+# Fases
+# =========================
+def cuerpo(datos, formato: str, codificar) -> dict:
+    if formato == "binario":
+        return {"content": codificar(datos), "headers": {"content-type": binario.TIPO_CONTENIDO}}
+    return {"json": datos}
+
+
+async def fase_ingesta(url: str, gen: Generador, tasa: float, duracion: float, lote: int, clientes: int,
+                       formato: str) -> dict:
+    """
+    Carga abierta contra analisis: el lote k sale en t0 + k*lote/tasa (tasa 0
+    = tan rápido como se pueda). La latencia se mide desde la hora
+    programada, así una cola en el servidor no se esconde (coordinated
+    omission).
+    """
+    ruta = "/api/v1/ingest" if lote == 1 else "/api/v1/ingest/batch"
+    latencias, enviados = [], {"ok": 0, "rechazados": 0, "errores": 0, "k": 0}
+    limites = httpx.Limits(max_connections=clientes, max_keepalive_connections=clientes)
+    t0 = time.perf_counter()
+    fin = t0 + duracion
+
+    async with httpx.AsyncClient(base_url=url, timeout=30, limits=limites) as cliente:
+        async def trabajador():
+            while True:
+                k = enviados["k"]
+                enviados["k"] += 1
+                programado = t0 + k * lote / tasa if tasa > 0 else time.perf_counter()
+                if programado >= fin:
+                    return
+                espera = programado - time.perf_counter()
+                if espera > 0:
+                    await asyncio.sleep(espera)
+                muestras = gen.siguientes(lote)
+                try:
+                    datos = muestras if lote > 1 or formato == "binario" else muestras[0]
+                    r = await cliente.post(ruta, **cuerpo(datos, formato, binario.codificar_muestras))
+                except httpx.HTTPError:
+                    enviados["errores"] += 1
+                    continue
+                latencias.append(time.perf_counter() - programado)
+                if r.status_code == 200:
+                    enviados["ok"] += lote
+                elif r.status_code == 503:
+                    enviados["rechazados"] += lote
+                else:
+                    enviados["errores"] += 1
+
+        await asyncio.gather(*(trabajador() for _ in range(clientes)))
+    segundos = time.perf_counter() - t0
+
+    return {
+        "ruta": ruta,
+        "segundos": round(segundos, 3),
+        "muestras_aceptadas": enviados["ok"],
+        "muestras_rechazadas_503": enviados["rechazados"],
+        "errores": enviados["errores"],
+        "muestras_por_seg": round(enviados["ok"] / segundos, 1),
+        "latencia": resumen_ms(latencias),
+    }
+
+
+def esperar_drenado(url_historial: str, esperadas: int, t0: float, timeout: float) -> dict:
+    fin = time.monotonic() + timeout
+    filas = 0
+    while time.monotonic() < fin:
+        filas = filas_historial(url_historial)
+        if filas >= esperadas:
+            break
+        time.sleep(0.2)
+    segundos = time.perf_counter() - t0
+    return {
+        "filas_confirmadas": filas,
+        "completo": filas >= esperadas,
+        "segundos_hasta_historial": round(segundos, 3),
+        "muestras_por_seg_punta_a_punta": round(filas / segundos, 1) if segundos > 0 else 0.0,
+    }
+
+
+async def llenar(url: str, gen: Generador, filas: int, diag_ratio: float, formato: str) -> dict:
+    """
+    Llena historial directo (sin analisis) hasta `filas` muestras más, con
+    diag_ratio diagnósticos por muestra (1.0 = como el pipeline).
+    """
+    pendientes = {"n": filas}
+    limites = httpx.Limits(max_connections=CLIENTES_LLENADO, max_keepalive_connections=CLIENTES_LLENADO)
+    t0 = time.perf_counter()
+
+    async with httpx.AsyncClient(base_url=url, timeout=120, limits=limites) as cliente:
+        async def trabajador():
+            while pendientes["n"] > 0:
+                n = min(LOTE_LLENADO, pendientes["n"])
+                pendientes["n"] -= n
+                muestras = gen.siguientes(n)
+                pedidos = [cliente.post("/api/v1/samples/batch", **cuerpo(muestras, formato, binario.codificar_muestras))]
+                cada = round(1 / diag_ratio) if diag_ratio > 0 else 0
+                if cada:
+                    diagnosticos = [diagnostico_de(m) for m in muestras[::cada]]
+                    pedidos.append(cliente.post(
+                        "/api/v1/diagnostics/batch", **cuerpo(diagnosticos, formato, binario.codificar_diagnosticos)
+                    ))
+                for r in await asyncio.gather(*pedidos):
+                    r.raise_for_status()
+
+        await asyncio.gather(*(trabajador() for _ in range(CLIENTES_LLENADO)))
+    segundos = time.perf_counter() - t0
+    return {"segundos": round(segundos, 3), "filas_por_seg": round(filas / segundos, 1)}
+
+
+def consultas_dashboard(gen: Generador) -> dict:
+    """
+    Lo que pide un refresco del dashboard (ver app/ui.py), para una máquina
+    y actuador al azar. Valores: (ruta, params) o función que los arma.
+    """
+    hasta = gen.t
+    iso = lambda t: datetime.fromtimestamp(t, timezone.utc).isoformat()
+
+    def con_actuador(extra):
+        def armar(azar):
+            machine_id, actuator_id = azar.choice(gen.series)
+            return {"machine_id": machine_id, "actuator_id": actuator_id, **extra}
+        return armar
+
+    return {
+        "latest_bulk": ("/api/v1/latest/bulk", lambda azar: {"machine_id": azar.choice(gen.series)[0]}),
+        "samples_ultimas": ("/api/v1/samples", con_actuador({"limite": 120})),
+        "diagnostics_ultimos": ("/api/v1/diagnostics", con_actuador({"limite": 80})),
+        "samples_lttb_1h": ("/api/v1/samples", con_actuador({"desde": iso(hasta - 3600), "hasta": iso(hasta), "lttb_puntos": 400})),
+        "samples_lttb_24h": ("/api/v1/samples", con_actuador({"desde": iso(hasta - 86400), "hasta": iso(hasta), "lttb_puntos": 400})),
+        "samples_bucket_1m_24h": ("/api/v1/samples", con_actuador({"desde": iso(hasta - 86400), "hasta": iso(hasta), "bucket": "1m"})),
+        "samples_cursor": ("/api/v1/samples", con_actuador({"since_ts": iso(hasta - 60), "limite": 500})),
+        "samples_incidente_5m": ("/api/v1/samples", con_actuador({"desde": iso(hasta - 3600), "hasta": iso(hasta - 3300), "limite": 1000})),
+        "samples_frame_ultimas": ("/api/v1/samples/frame", lambda azar: {"machine_id": azar.choice(gen.series)[0], "desde": iso(hasta - 120), "hasta": iso(hasta), "bucket": "1s"}),
+        "samples_frame_24h": ("/api/v1/samples/frame", lambda azar: {"machine_id": azar.choice(gen.series)[0], "desde": iso(hasta - 86400), "hasta": iso(hasta), "puntos": 400}),
+        "fleet_status": ("/api/v1/fleet/status", lambda azar: {}),
+    }
+
+
+def medir_consultas(url: str, gen: Generador, repeticiones: int) -> dict:
+    azar = random.Random(7)
+    resultado = {}
+    with httpx.Client(base_url=url, timeout=60) as cliente:
+        for nombre, (ruta, armar) in consultas_dashboard(gen).items():
+            latencias = []
+            for _ in range(repeticiones):
+                params = armar(azar)
+                t0 = time.perf_counter()
+                r = cliente.get(ruta, params=params)
+                latencias.append(time.perf_counter() - t0)
+                r.raise_for_status()
+            resultado[nombre] = resumen_ms(latencias)
+    return resultado
+
+
+# =========================
+# Línea base
+# =========================
+def commit_actual() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocido"
+
+
+def metricas_comparables(resultado: dict) -> dict:
+    """
+    {nombre: (valor, mayor_es_mejor)} de las cifras que conviene vigilar.
+    """
+    cifras = {}
+    ingesta = resultado.get("ingesta")
+    if ingesta:
+        cifras["ingesta.muestras_por_seg"] = (ingesta["muestras_por_seg"], True)
+        cifras["ingesta.p50_ms"] = (ingesta["latencia"]["p50_ms"], False)
+        cifras["ingesta.p99_ms"] = (ingesta["latencia"]["p99_ms"], False)
+        cifras["ingesta.punta_a_punta_por_seg"] = (ingesta["drenado"]["muestras_por_seg_punta_a_punta"], True)
+    for punto in resultado.get("puntos", []):
+        base = f"{punto['filas']}"
+        cifras[f"{base}.bytes_por_fila"] = (punto["bytes_por_fila"], False)
+        cifras[f"{base}.llenado_filas_por_seg"] = (punto["llenado"]["filas_por_seg"], True)
+        for nombre, lat in punto["consultas"].items():
+            cifras[f"{base}.{nombre}.p99_ms"] = (lat["p99_ms"], False)
+    return cifras
+
+
+def comparar(actual: dict, base: dict, tolerancia: float) -> list:
+    """
+    Líneas de la comparación; las regresiones empiezan con "!".
+    """
+    lineas = []
+    previas = metricas_comparables(base)
+    for nombre, (valor, mayor_mejor) in metricas_comparables(actual).items():
+        if nombre not in previas or not previas[nombre][0]:
+            continue
+        anterior = previas[nombre][0]
+        cambio = (valor - anterior) / anterior
+        peor = -cambio if mayor_mejor else cambio
+        marca = "!" if peor > tolerancia else " "
+        lineas.append(f"{marca} {nombre}: {anterior} -> {valor} ({cambio:+.1%})")
+    return lineas
+
+
+# =========================
+# Main
+# =========================
+def argumentos():
+    p = argparse.ArgumentParser(description="Benchmark de punta a punta: analisis + historial_ui")
+    p.add_argument("--maquinas", type=int, default=10)
+    p.add_argument("--actuadores", type=int, default=3)
+    p.add_argument("--tasa", type=float, default=5000, help="muestras/s ofrecidas a analisis (0 = sin límite)")
+    p.add_argument("--duracion", type=float, default=30, help="segundos de la fase de ingesta (0 = saltarla)")
+    p.add_argument("--lote", type=int, default=100, help="muestras por POST a analisis (1 = /ingest)")
+    p.add_argument("--clientes", type=int, default=16, help="POST concurrentes a analisis")
+    p.add_argument("--formato", choices=("json", "binario"), default="json",
+                   help="formato de todos los POST (cliente -> analisis -> historial)")
+    p.add_argument("--puntos", default="1000000,10000000", help="filas de muestras en las que medir consultas")
+    p.add_argument("--diag-ratio", type=float, default=1.0, help="diagnósticos por muestra al llenar")
+    p.add_argument("--repeticiones", type=int, default=50, help="veces que se repite cada consulta")
+    p.add_argument("--dir", help="directorio de trabajo; se conserva (por defecto uno temporal que se borra)")
+    p.add_argument("--salida", help="JSON de resultados (por defecto bench/resultados/<commit>.json)")
+    p.add_argument("--comparar", help="línea base JSON contra la cual comparar")
+    p.add_argument("--tolerancia", type=float, default=0.10, help="empeoramiento tolerado al comparar")
+    return p.parse_args()
+
+
+def main():
+    args = argumentos()
+    trabajo = Path(args.dir or tempfile.mkdtemp(prefix="bench-"))
+    trabajo.mkdir(parents=True, exist_ok=True)
+    puntos = sorted(int(p) for p in args.puntos.split(",") if p.strip())
+    gen = Generador(args.maquinas, args.actuadores)
+
+    p_hist, p_anal = puerto_libre(), puerto_libre()
+    url_hist, url_anal = f"http://127.0.0.1:{p_hist}", f"http://127.0.0.1:{p_anal}"
+    log = open(trabajo / "servicios.log", "ab")
+    procesos = []
+    try:
+        procesos.append(levantar("historial_ui", "app.api:app", p_hist, {
+            "RUTA_DB": str(trabajo / "app.db"),
+            "EXPORT_DIR": str(trabajo / "export"),
+            "LATIDO_STALE_SEG": "0",   # sin diagnósticos de silencio entre fases
+        }, log))
+        esperar_listo(url_hist, procesos[-1])
+        procesos.append(levantar("analisis", "app.main:app", p_anal, {
+            "HISTORY_URL": url_hist,
+            "SPOOL_DIR": str(trabajo / "spool"),
+            "FORMATO_HISTORIAL": args.formato,
+        }, log))
+        esperar_listo(url_anal, procesos[-1])
+        print(f"[bench] servicios arriba en {trabajo} (historial :{p_hist}, analisis :{p_anal})")
+
+        resultado = {
+            "commit": commit_actual(),
+            "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "config": vars(args),
+            "series": len(gen.series),
+        }
+
+        if args.duracion > 0:
+            print(f"[bench] ingesta: {args.tasa:g} muestras/s durante {args.duracion:g} s, lotes de {args.lote}")
+            t0 = time.perf_counter()
+            ingesta = asyncio.run(fase_ingesta(
+                url_anal, gen, args.tasa, args.duracion, args.lote, args.clientes, args.formato
+            ))
+            ingesta["drenado"] = esperar_drenado(url_hist, ingesta["muestras_aceptadas"], t0, timeout=300)
+            ingesta["db_bytes"] = tamano_db(trabajo)
+            resultado["ingesta"] = ingesta
+            print(f"[bench] {json.dumps(ingesta)}")
+
+        resultado["puntos"] = []
+        for objetivo in puntos:
+            actuales = filas_historial(url_hist)
+            if objetivo > actuales:
+                print(f"[bench] llenando historial hasta {objetivo} muestras ({objetivo - actuales} más)")
+                llenado = asyncio.run(llenar(url_hist, gen, objetivo - actuales, args.diag_ratio, args.formato))
+            else:
+                llenado = {"segundos": 0.0, "filas_por_seg": 0.0}
+            filas = filas_historial(url_hist)
+            db_bytes = tamano_db(trabajo)
+            punto = {
+                "filas": objetivo,
+                "filas_muestras": filas,
+                "filas_diagnosticos": filas_historial(url_hist, "diagnosticos"),
+                "db_bytes": db_bytes,
+                "bytes_por_fila": round(db_bytes / max(filas, 1), 1),
+                "llenado": llenado,
+                "consultas": medir_consultas(url_hist, gen, args.repeticiones),
+            }
+            resultado["puntos"].append(punto)
+            print(f"[bench] {json.dumps(punto)}")
+    finally:
+        for p in reversed(procesos):
+            p.terminate()
+        for p in procesos:
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+        log.close()
+        if not args.dir:
+            shutil.rmtree(trabajo, ignore_errors=True)
+
+    salida = Path(args.salida) if args.salida else RAIZ / "bench" / "resultados" / f"{resultado['commit']}.json"
+    salida.parent.mkdir(parents=True, exist_ok=True)
+    salida.write_text(json.dumps(resultado, indent=2, ensure_ascii=False) + "\n")
+    print(f"[bench] resultados en {salida}")
+
+    if args.comparar:
+        lineas = comparar(resultado, json.loads(Path(args.comparar).read_text()), args.tolerancia)
+        print("\n".join(lineas))
+        if any(l.startswith("!") for l in lineas):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
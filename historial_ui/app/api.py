@@ -1,12 +1,100 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
-from typing import List, Optional
-from app.db import obtener_conexion
+import asyncio
+import os
+import re
+import time
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, BeforeValidator, TypeAdapter, ValidationError
+from typing import Annotated, List, Optional
+from app.db import inicializar_db, cerrar_db, lectura, insertar, internar, catalogo
+from app import binario, eventos, exportar, ids, latidos, metricas, particiones, ultimos
+from app.series import (
+    METRICAS, EPOCH_TS, EPOCH_MIN, EPOCH_MAX, parsear_bucket, ts_a_epoch, epoch_a_ts, ts_a_ms, ms_a_ts, rango_ms, lttb,
+)
+from app.rollups import (
+    SQL_UPSERT_ROLLUP_MUESTRAS, SQL_UPSERT_ROLLUP_DIAGNOSTICOS, SQL_ROLLUP_MUESTRAS, SQL_ROLLUP_DIAGNOSTICOS,
+    filas_rollup_muestras, filas_rollup_diagnosticos, resolucion_para, reagrupar_muestras,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Esquema, pool de lectura y escritor se crean una sola vez
+    inicializar_db()
+    cargar_ultimos()
+    detener_latidos = iniciar_latidos()
+    yield
+    detener_latidos.set()
+    cerrar_db()
+
+
+# Rutas de ingesta con histograma propio (validación + inserción + commit)
+RUTAS_INGESTA = ("/api/v1/samples", "/api/v1/samples/batch", "/api/v1/diagnostics", "/api/v1/diagnostics/batch")
+
+H_INGESTA = {
+    ruta: metricas.histograma("historial_ingesta_seconds", "Duración de los POST de ingesta", {"ruta": ruta})
+    for ruta in RUTAS_INGESTA
+}
+C_FILAS = {
+    tabla: metricas.contador("historial_filas_total", "Filas confirmadas en la base", {"tabla": tabla})
+    for tabla in ("muestras", "diagnosticos")
+}
+EN_VUELO = {"n": 0}
+
+metricas.medidor("historial_http_en_vuelo", "Requests HTTP en curso", lambda: EN_VUELO["n"])
+metricas.medidor("historial_stream_suscriptores", "Clientes conectados al stream", lambda: eventos.estado()["suscriptores"])
+for _estado_latido in (latidos.VIVO, latidos.STALE, latidos.OFFLINE):
+    metricas.medidor(
+        "historial_actuadores", "Actuadores por estado de latido",
+        lambda e=_estado_latido: latidos.latidos.resumen()[e], {"estado": _estado_latido},
+    )
+
+
+class MedirRequests:
+    """
+    Middleware ASGI mínimo: cuenta requests en vuelo y mide la duración de
+    los POST de ingesta. Sin BaseHTTPMiddleware para no sumar una tarea por
+    request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        h = H_INGESTA.get(scope["path"]) if scope["method"] == "POST" else None
+        EN_VUELO["n"] += 1
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            EN_VUELO["n"] -= 1
+            if h is not None:
+                h.observar(time.perf_counter() - t0)
+
+
+app = FastAPI(title="Servicio de Historial (API)", lifespan=lifespan)
+app.add_middleware(MedirRequests)
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", "/data/export")   # raíz para exportaciones Parquet a disco
+SSE_LATIDO_SEG = float(os.getenv("SSE_LATIDO_SEG", "15"))   # comentario keep-alive si no hay eventos
+POLL_MAX_SEG = float(os.getenv("POLL_MAX_SEG", "60"))       # tope de espera del long-poll
+
+def validar_ts(valor) -> int:
+    if not isinstance(valor, str):
+        raise ValueError("ts debe ser texto ISO-8601")
+    return ts_a_ms(valor)
+
+
+# El ts llega como texto ISO-8601 y queda normalizado a epoch ms al validar
+TsMs = Annotated[int, BeforeValidator(validar_ts)]
 
-app = FastAPI(title="Servicio de Historial (API)")
 
 class Muestra(BaseModel):
-    ts: str
+    ts: TsMs
     machine_id: str
     actuator_id: str
     motor_temp_c: float
@@ -15,7 +103,7 @@ class Muestra(BaseModel):
 
 
 class Diagnostico(BaseModel):
-    ts: str
+    ts: TsMs
     machine_id: str
     actuator_id: str
     state: str
@@ -25,24 +113,195 @@ class Diagnostico(BaseModel):
 
 @app.get("/api/v1/health")
 def health():
-    return {"ok": True, "servicio": "historial_ui"}
+    return {
+        "ok": True,
+        "servicio": "historial_ui",
+        "particiones": catalogo().resumen(),
+        "stream": eventos.estado(),
+        "latidos": latidos.latidos.resumen(),
+    }
 
-@app.post("/api/v1/samples")
-def guardar_muestra(m: Muestra):
-    con = obtener_conexion()
-    con.execute(
-        "INSERT INTO muestras (ts, machine_id, actuator_id, motor_temp_c, motor_rpm, motor_vibration_rms) VALUES (?,?,?,?,?,?)",
-        (m.ts, m.machine_id, m.actuator_id, m.motor_temp_c, m.motor_rpm, m.motor_vibration_rms)
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(metricas.exponer(), media_type="text/plain; version=0.0.4")
+
+# Las tablas crudas están particionadas por día: {tabla} es cada partición
+# (ver app/particiones.py) y las lecturas traen el id global primero para
+# poder combinar particiones en orden. Las filas guardan enteros (ts en
+# epoch ms, ids de app/ids.py): los parámetros se traducen con claves() y
+# los resultados con *_desde_fila.
+SQL_INSERT_MUESTRA = (
+    "INSERT INTO {tabla} (id, ts, machine_id, actuator_id, motor_temp_c, motor_rpm, motor_vibration_rms) "
+    "VALUES (?,?,?,?,?,?,?)"
+)
+
+SQL_INSERT_DIAGNOSTICO = (
+    "INSERT INTO {tabla} (id, ts, machine_id, actuator_id, estado, razones, temp_mean, temp_std, rpm_mean, rpm_std, vib_rms) "
+    "VALUES (?,?,?,?,?,?,?,?,?,?,?)"
+)
+
+SQL_ULTIMOS_DIAGNOSTICOS = (
+    "SELECT id, ts, machine_id, actuator_id, estado, razones, temp_mean, temp_std, rpm_mean, rpm_std, vib_rms "
+    "FROM {tabla} WHERE id IN (SELECT MAX(id) FROM {tabla} GROUP BY machine_id, actuator_id)"
+)
+
+SQL_DIAGNOSTICOS = (
+    "SELECT id, ts, machine_id, actuator_id, estado, razones, temp_mean, temp_std, rpm_mean, rpm_std, vib_rms "
+    "FROM {tabla} WHERE machine_id=? AND actuator_id=? ORDER BY id DESC LIMIT ?"
+)
+
+SQL_MUESTRAS = (
+    "SELECT id, ts, machine_id, actuator_id, motor_temp_c, motor_rpm, motor_vibration_rms "
+    "FROM {tabla} WHERE machine_id=? AND actuator_id=? ORDER BY id DESC LIMIT ?"
+)
+
+# Rangos de tiempo: por el índice (machine_id, actuator_id, ts) y en orden
+# de ts, no de llegada (los datos atrasados o re-enviados caen en su lugar)
+SQL_MUESTRAS_RANGO = (
+    "SELECT id, ts, machine_id, actuator_id, motor_temp_c, motor_rpm, motor_vibration_rms "
+    "FROM {tabla} WHERE machine_id=? AND actuator_id=? AND ts BETWEEN ? AND ? "
+    "ORDER BY ts DESC, id DESC LIMIT ?"
+)
+
+SQL_DIAGNOSTICOS_RANGO = (
+    "SELECT id, ts, machine_id, actuator_id, estado, razones, temp_mean, temp_std, rpm_mean, rpm_std, vib_rms "
+    "FROM {tabla} WHERE machine_id=? AND actuator_id=? AND ts BETWEEN ? AND ? "
+    "ORDER BY ts DESC, id DESC LIMIT ?"
+)
+
+# Buckets que no son múltiplo de 1 min (los demás salen de las tablas de
+# rollup), en la misma forma que SQL_ROLLUP_MUESTRAS: cubeta, n, ts e id de
+# la última fila (mayor ts, luego mayor id) y por métrica suma, m2, min,
+# max y último. m2 se calcula desplazado por un valor del propio bucket (el
+# último): sin restar cuadrados grandes, y 0 exacto si la serie es
+# constante. Con pocos actuadores el planificador preferiría recorrer la
+# tabla para agrupar, por eso se fija el índice por ts.
+SQL_MUESTRAS_BUCKET = (
+    f"WITH f AS ("
+    f" SELECT {EPOCH_TS} / ? AS cubeta, ts, id, motor_temp_c AS t, motor_rpm AS r, motor_vibration_rms AS v"
+    f" FROM {{tabla}} INDEXED BY idx_{{tabla}}_maq_act_ts"
+    f" WHERE machine_id=? AND actuator_id=? AND ts BETWEEN ? AND ?), "
+    f"w AS ("
+    f" SELECT f.*, ROW_NUMBER() OVER c AS orden,"
+    f" FIRST_VALUE(t) OVER c AS kt, FIRST_VALUE(r) OVER c AS kr, FIRST_VALUE(v) OVER c AS kv"
+    f" FROM f WINDOW c AS (PARTITION BY cubeta ORDER BY ts DESC, id DESC"
+    f" ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)) "
+    f"SELECT cubeta, COUNT(*), MAX(CASE WHEN orden = 1 THEN ts END), MAX(CASE WHEN orden = 1 THEN id END), "
+    + ", ".join(
+        f"SUM({x}), SUM(({x} - k{x}) * ({x} - k{x})) - SUM({x} - k{x}) * SUM({x} - k{x}) / COUNT(*), "
+        f"MIN({x}), MAX({x}), MAX(CASE WHEN orden = 1 THEN {x} END)"
+        for x in "trv"
     )
+    + " FROM w GROUP BY cubeta"
+)
 
-    con.commit()
-    con.close()
-    return {"stored": True}
+# Lecturas por cursor: sólo lo nuevo de un actuador, por el índice
+# (machine_id, actuator_id, id). Sin INDEXED BY, con un solo actuador el
+# planificador prefiere el rango de rowid, que con varios recorre a todos.
+SQL_MUESTRAS_CURSOR = (
+    f"SELECT id, ts, machine_id, actuator_id, motor_temp_c, motor_rpm, motor_vibration_rms "
+    f"FROM {{tabla}} INDEXED BY idx_{{tabla}}_maq_act_id "
+    f"WHERE machine_id=? AND actuator_id=? AND ts >= ? AND id > ? AND id <= ? ORDER BY id LIMIT ?"
+)
+
+SQL_DIAGNOSTICOS_CURSOR = (
+    f"SELECT id, ts, machine_id, actuator_id, estado, razones, temp_mean, temp_std, rpm_mean, rpm_std, vib_rms "
+    f"FROM {{tabla}} INDEXED BY idx_{{tabla}}_maq_act_id "
+    f"WHERE machine_id=? AND actuator_id=? AND ts >= ? AND id > ? AND id <= ? ORDER BY id LIMIT ?"
+)
+
+SQL_MUESTRAS_SERIE = (
+    "SELECT id, ts, motor_temp_c, motor_rpm, motor_vibration_rms "
+    "FROM {tabla} WHERE machine_id=? AND actuator_id=? AND ts BETWEEN ? AND ? "
+    "ORDER BY ts, id"
+)
+
+# Consultas de lectura del dashboard: deben resolverse por índice, nunca con
+# SCAN. Se revisan sobre las tablas originales; las particiones tienen el
+# mismo esquema e índice.
+# Lecturas que deben resolverse con índices: base de la partición (None =
+# tabla de rollups, sin {tabla}), SQL y parámetros de ejemplo. Lo revisa
+# tests/test_planes.py contra una partición diaria con datos.
+CONSULTAS_INDEXADAS = {
+    "diagnostics": ("diagnosticos", SQL_DIAGNOSTICOS, (1, 1, 1)),
+    "samples": ("muestras", SQL_MUESTRAS, (1, 1, 1)),
+    "samples_rango": ("muestras", SQL_MUESTRAS_RANGO, (1, 1, 0, 1, 1)),
+    "diagnostics_rango": ("diagnosticos", SQL_DIAGNOSTICOS_RANGO, (1, 1, 0, 1, 1)),
+    "samples_bucket": ("muestras", SQL_MUESTRAS_BUCKET, (60, 1, 1, 0, 1)),
+    "samples_serie": ("muestras", SQL_MUESTRAS_SERIE, (1, 1, 0, 1)),
+    "samples_cursor": ("muestras", SQL_MUESTRAS_CURSOR, (1, 1, 0, 0, 1, 1)),
+    "diagnostics_cursor": ("diagnosticos", SQL_DIAGNOSTICOS_CURSOR, (1, 1, 0, 0, 1, 1)),
+    "samples_rollup": (None, SQL_ROLLUP_MUESTRAS, (1, 1, 60, 0, 1)),
+    "diagnostics_rollup": (None, SQL_ROLLUP_DIAGNOSTICOS, (1, 1, 60, 0, 1)),
+}
+
+
+def cargar_ultimos():
+    """
+    Precarga el cache de /latest con el último diagnóstico de cada actuador.
+    """
+    with lectura() as con:
+        rows = particiones.todas(con, catalogo(), "diagnosticos", SQL_ULTIMOS_DIAGNOSTICOS, ())
+    # El mismo actuador puede aparecer en varias particiones: gana el mayor id
+    por_actuador = {}
+    for r in sorted(rows, key=lambda r: r[0]):
+        por_actuador[(r[2], r[3])] = r
+    ultimos.reemplazar([{"id": r[0], **diagnostico_desde_fila(r[1:])} for r in por_actuador.values()])
+
+
+def claves(machine_id: str, actuator_id: str) -> tuple:
+    """
+    (id de máquina, id de actuador) para las consultas. Un nombre nunca
+    visto da ids.NINGUNO: la consulta corre igual y no trae filas.
+    """
+    inicializar_db()
+    return ids.maquinas.id(machine_id), ids.actuadores.id(actuator_id)
 
-@app.post("/api/v1/diagnostics")
-def guardar_diagnostico(d: Diagnostico):
-    con = obtener_conexion()
-    razones = ",".join(d.reasons)
+
+def texto_ts(ms) -> Optional[str]:
+    return ms_a_ts(ms) if ms is not None else None
+
+
+def diagnostico_desde_fila(row) -> dict:
+    ts, mid, aid, estado, razones, temp_mean, temp_std, rpm_mean, rpm_std, vib_rms = row
+    return {
+        "ts": texto_ts(ts),
+        "machine_id": ids.maquinas.nombre(mid),
+        "actuator_id": ids.actuadores.nombre(aid),
+        "state": ids.estados.nombre(estado),
+        "reasons": ids.razones.lista(razones or 0),
+        "metrics": {
+            "temp_mean": temp_mean,
+            "temp_std": temp_std,
+            "rpm_mean": rpm_mean,
+            "rpm_std": rpm_std,
+            "vib_rms": vib_rms
+        }
+    }
+
+
+def muestra_desde_fila(row) -> dict:
+    id, ts, mid, aid, t, rpm, v = row
+    return {
+        "id": id,
+        "ts": texto_ts(ts),
+        "machine_id": ids.maquinas.nombre(mid),
+        "actuator_id": ids.actuadores.nombre(aid),
+        "motor_temp_c": t,
+        "motor_rpm": rpm,
+        "motor_vibration_rms": v
+    }
+
+
+# Filas de ingesta: (ts en ms, machine_id, actuator_id, ...) con los nombres
+# como texto; guardar_filas_* las pasan a ids antes de insertar.
+def fila_muestra(m: Muestra):
+    return (m.ts, m.machine_id, m.actuator_id, m.motor_temp_c, m.motor_rpm, m.motor_vibration_rms)
+
+
+def fila_diagnostico(d: Diagnostico):
+    razones = tuple(d.reasons)
 
     temp_mean = float(d.metrics.get("temp_mean", 0))
     temp_std  = float(d.metrics.get("temp_std", 0))
@@ -50,100 +309,643 @@ def guardar_diagnostico(d: Diagnostico):
     rpm_std   = float(d.metrics.get("rpm_std", 0))
     vib_rms   = float(d.metrics.get("vib_rms", 0))
 
-    con.execute(
-        "INSERT INTO diagnosticos (ts, machine_id, actuator_id, estado, razones, temp_mean, temp_std, rpm_mean, rpm_std, vib_rms) "
-        "VALUES (?,?,?,?,?,?,?,?,?,?)",
-        (d.ts, d.machine_id, d.actuator_id, d.state, razones, temp_mean, temp_std, rpm_mean, rpm_std, vib_rms)
+    return (d.ts, d.machine_id, d.actuator_id, d.state, razones, temp_mean, temp_std, rpm_mean, rpm_std, vib_rms)
+
+
+# El ts del formato binario ya viene en epoch ms: pasa directo, sin texto
+def filas_muestras_binario(textos: list, regs) -> list:
+    return list(zip(
+        regs["ts_ms"].tolist(),
+        [textos[i] for i in regs["maquina"].tolist()],
+        [textos[i] for i in regs["actuador"].tolist()],
+        *(regs[c].tolist() for c in binario.METRICAS_MUESTRA),
+    ))
+
+
+def filas_diagnosticos_binario(textos: list, regs) -> list:
+    bits = range(min(len(textos), binario.MAX_RAZONES))
+    razones = {}
+    for m in regs["razones"].tolist():
+        if m not in razones:
+            razones[m] = tuple(textos[i] for i in bits if m >> i & 1)
+    return list(zip(
+        regs["ts_ms"].tolist(),
+        [textos[i] for i in regs["maquina"].tolist()],
+        [textos[i] for i in regs["actuador"].tolist()],
+        [textos[i] for i in regs["estado"].tolist()],
+        [razones[m] for m in regs["razones"].tolist()],
+        *(regs[c].tolist() for c in binario.METRICAS_DIAGNOSTICO),
+    ))
+
+
+# Cómo se leen los cuerpos de ingesta: (tipo binario, lote) -> validador JSON
+ADAPTADORES = {
+    (binario.MUESTRAS, False): TypeAdapter(Muestra),
+    (binario.MUESTRAS, True): TypeAdapter(List[Muestra]),
+    (binario.DIAGNOSTICOS, False): TypeAdapter(Diagnostico),
+    (binario.DIAGNOSTICOS, True): TypeAdapter(List[Diagnostico]),
+}
+A_FILAS = {
+    binario.MUESTRAS: (fila_muestra, filas_muestras_binario),
+    binario.DIAGNOSTICOS: (fila_diagnostico, filas_diagnosticos_binario),
+}
+
+
+async def cuerpo_crudo(request: Request) -> tuple:
+    return await request.body(), request.headers.get("content-type")
+
+
+def filas_del_cuerpo(crudo: tuple, tipo: int, lote: bool) -> list:
+    """
+    Cuerpo de un POST de ingesta -> filas para insertar. JSON: validado con
+    los modelos Pydantic. Binario (application/x-actuadores, ver
+    app/binario.py): se valida por columnas al decodificar y las filas salen
+    de los arreglos, sin un modelo por fila.
+    """
+    cuerpo, content_type = crudo
+    desde_modelo, desde_binario = A_FILAS[tipo]
+    if binario.es_binario(content_type):
+        try:
+            filas = desde_binario(*binario.decodificar(cuerpo, tipo))
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        if not lote and len(filas) != 1:
+            raise HTTPException(status_code=422, detail=f"Se esperaba un registro, llegaron {len(filas)}")
+        return filas
+    try:
+        datos = ADAPTADORES[(tipo, lote)].validate_json(cuerpo)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
+    return [desde_modelo(d) for d in datos] if lote else [desde_modelo(datos)]
+
+
+def registrar_latidos(filas: list):
+    # Sólo datos que llegan de afuera (no los diagnósticos de silencio)
+    latidos.latidos.latido({(f[1], f[2]) for f in filas})
+
+
+def iniciar_latidos():
+    """
+    Los actuadores conocidos al arrancar cuentan como recién vistos: si no
+    vuelven a reportar pasan a stale/offline como cualquier otro.
+    """
+    registrar_latidos([
+        (d["ts"], d["machine_id"], d["actuator_id"])
+        for machine_id in list(ultimos.ultimos)
+        for d in ultimos.por_maquina(machine_id) if d.get("state") != latidos.OFFLINE
+    ])
+    return latidos.iniciar(emitir_silencios)
+
+
+def emitir_silencios(cambios: list):
+    """
+    Transiciones a stale/offline como diagnósticos (razón "sin_datos"):
+    quedan en el historial, en /latest, en la flota y en el stream.
+    """
+    ts = int(time.time()) * 1000
+    filas = []
+    for (machine_id, actuator_id), estado, _ in cambios:
+        previo = ultimos.obtener(machine_id, actuator_id)
+        if previo is not None and previo.get("state") == estado:
+            continue
+        filas.append((ts, machine_id, actuator_id, estado, ("sin_datos",), 0.0, 0.0, 0.0, 0.0, 0.0))
+    if filas:
+        print(f"[historial] Actuadores sin datos: {[(f[1], f[2], f[3]) for f in filas]}")
+        guardar_filas_diagnosticos(filas)
+
+
+def guardar_filas_muestras(filas: list):
+    # Los rollups se actualizan en la misma transacción que las filas crudas;
+    # los suscriptores del stream reciben las filas recién commiteadas
+    maquinas = internar("maquinas", (f[1] for f in filas))
+    actuadores = internar("actuadores", (f[2] for f in filas))
+    filas = [(f[0], maquinas[f[1]], actuadores[f[2]], *f[3:]) for f in filas]
+    insertar(
+        "muestras", SQL_INSERT_MUESTRA, filas,
+        lambda con_id: eventos.publicar("samples", [muestra_desde_fila(f) for f in con_id]),
+        derivadas=lambda con_id: [(SQL_UPSERT_ROLLUP_MUESTRAS, filas_rollup_muestras(con_id))],
+    )
+    C_FILAS["muestras"].inc(len(filas))
+
+
+def confirmar_diagnosticos(con_id: list):
+    items = [{"id": f[0], **diagnostico_desde_fila(f[1:])} for f in con_id]
+    ultimos.actualizar(items)
+    eventos.publicar("diagnostics", items)
+
+
+def guardar_filas_diagnosticos(filas: list):
+    maquinas = internar("maquinas", (f[1] for f in filas))
+    actuadores = internar("actuadores", (f[2] for f in filas))
+    estados = internar("estados", (f[3] for f in filas))
+    try:
+        internar("razones", (r for f in filas for r in f[4]))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    filas = [
+        (f[0], maquinas[f[1]], actuadores[f[2]], estados[f[3]], ids.razones.mascara(f[4]), *f[5:])
+        for f in filas
+    ]
+    insertar(
+        "diagnosticos", SQL_INSERT_DIAGNOSTICO, filas, confirmar_diagnosticos,
+        derivadas=lambda con_id: [(SQL_UPSERT_ROLLUP_DIAGNOSTICOS, filas_rollup_diagnosticos(con_id))],
     )
-    con.commit()
-    con.close()
+    C_FILAS["diagnosticos"].inc(len(filas))
+
+
+# Los POST de ingesta aceptan JSON (Muestra / Diagnostico) o el formato binario
+@app.post("/api/v1/samples")
+def guardar_muestra(crudo: tuple = Depends(cuerpo_crudo)):
+    filas = filas_del_cuerpo(crudo, binario.MUESTRAS, lote=False)
+    guardar_filas_muestras(filas)
+    registrar_latidos(filas)
+    return {"stored": True}
+
+@app.post("/api/v1/samples/batch")
+def guardar_muestras(crudo: tuple = Depends(cuerpo_crudo)):
+    filas = filas_del_cuerpo(crudo, binario.MUESTRAS, lote=True)
+    guardar_filas_muestras(filas)
+    registrar_latidos(filas)
+    return {"stored": len(filas)}
+
+@app.post("/api/v1/diagnostics")
+def guardar_diagnostico(crudo: tuple = Depends(cuerpo_crudo)):
+    filas = filas_del_cuerpo(crudo, binario.DIAGNOSTICOS, lote=False)
+    guardar_filas_diagnosticos(filas)
+    registrar_latidos(filas)
     return {"stored": True}
 
+@app.post("/api/v1/diagnostics/batch")
+def guardar_diagnosticos(crudo: tuple = Depends(cuerpo_crudo)):
+    filas = filas_del_cuerpo(crudo, binario.DIAGNOSTICOS, lote=True)
+    guardar_filas_diagnosticos(filas)
+    registrar_latidos(filas)
+    return {"stored": len(filas)}
+
 @app.get("/api/v1/latest")
 def latest(machine_id: str, actuator_id: str):
-    con = obtener_conexion()
-    cur = con.execute(
-        "SELECT ts, machine_id, actuator_id, estado, razones, temp_mean, temp_std, rpm_mean, rpm_std, vib_rms "
-        "FROM diagnosticos WHERE machine_id=? AND actuator_id=? ORDER BY id DESC LIMIT 1",
-        (machine_id, actuator_id)
-    )
-    row = cur.fetchone()
-    con.close()
+    # Servido desde memoria: el cache se precarga al arrancar y se actualiza en cada commit
+    return {"latest": ultimos.obtener(machine_id, actuator_id)}
 
-    if not row:
-        return {"latest": None}
+@app.get("/api/v1/latest/bulk")
+def latest_bulk(machine_id: str):
+    """
+    Último diagnóstico de todos los actuadores de una máquina en una sola respuesta.
+    """
+    return {"machine_id": machine_id, "items": ultimos.por_maquina(machine_id)}
 
-    ts, mid, aid, estado, razones, temp_mean, temp_std, rpm_mean, rpm_std, vib_rms = row
-    return {
-        "latest": {
-            "ts": ts,
-            "machine_id": mid,
-            "actuator_id": aid,
-            "state": estado,
-            "reasons": razones.split(",") if razones else [],
-            "metrics": {
-                "temp_mean": temp_mean,
-                "temp_std": temp_std,
-                "rpm_mean": rpm_mean,
-                "rpm_std": rpm_std,
-                "vib_rms": vib_rms
-            }
-        }
-    }
+@app.get("/api/v1/heartbeats")
+def heartbeats():
+    """
+    Actuadores en silencio (stale/offline) según el detector de latidos,
+    con los segundos desde su último dato recibido.
+    """
+    items = [
+        {"machine_id": mid, "actuator_id": aid, "state": estado, "silence_s": round(silencio, 1)}
+        for (mid, aid), estado, silencio in latidos.latidos.silenciosos()
+    ]
+    items.sort(key=lambda i: -i["silence_s"])
+    return {"counts": latidos.latidos.resumen(), "items": items}
+
+
+@app.get("/api/v1/fleet/status")
+def fleet_status(state: Optional[str] = None):
+    """
+    Estado de toda la flota desde memoria (vista mantenida en cada commit
+    de diagnósticos): peor estado, razones activas y antigüedad del último
+    dato por máquina y actuador. state=critical filtra máquinas por estado.
+    """
+    maquinas = ultimos.flota()
+    conteo = {}
+    for m in maquinas:
+        conteo[m["state"]] = conteo.get(m["state"], 0) + 1
+    if state:
+        maquinas = [m for m in maquinas if m["state"] == state]
+    return {"counts": conteo, "machines": maquinas}
 
 @app.get("/api/v1/diagnostics")
-def diagnostics(machine_id: str, actuator_id: str, limite: int = 50):
-    con = obtener_conexion()
-    cur = con.execute(
-        "SELECT ts, machine_id, actuator_id, estado, razones, temp_mean, temp_std, rpm_mean, rpm_std, vib_rms "
-        "FROM diagnosticos WHERE machine_id=? AND actuator_id=? ORDER BY id DESC LIMIT ?",
-        (machine_id, actuator_id, limite)
-    )
-    rows = cur.fetchall()
-    con.close()
+def diagnostics(
+    machine_id: str,
+    actuator_id: str,
+    limite: int = 50,
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    after_id: Optional[int] = None,
+    since_ts: Optional[str] = None,
+):
+    """
+    Los últimos `limite` diagnósticos; con after_id/since_ts, sólo los
+    nuevos (ver pagina_cursor). desde/hasta (ISO-8601): los últimos del
+    rango, por ts.
+    """
+    if after_id is not None or since_ts:
+        return pagina_cursor("diagnosticos", machine_id, actuator_id, limite, after_id, since_ts)
 
-    items = []
-    for ts, mid, aid, estado, razones, temp_mean, temp_std, rpm_mean, rpm_std, vib_rms in rows:
-        items.append({
-            "ts": ts,
-            "machine_id": mid,
-            "actuator_id": aid,
-            "state": estado,
-            "reasons": razones.split(",") if razones else [],
-            "metrics": {
-                "temp_mean": temp_mean,
-                "temp_std": temp_std,
-                "rpm_mean": rpm_mean,
-                "rpm_std": rpm_std,
-                "vib_rms": vib_rms
-            }
-        })
+    clave = claves(machine_id, actuator_id)
+    with lectura() as con:
+        if desde or hasta:
+            t0, t1 = rango_epoch(desde, hasta)
+            rows = particiones.ultimas_por_ts(
+                con, catalogo(), "diagnosticos", SQL_DIAGNOSTICOS_RANGO, (*clave, *rango_ms(t0, t1)), limite, t0, t1
+            )
+        else:
+            rows = particiones.ultimas(con, catalogo(), "diagnosticos", SQL_DIAGNOSTICOS, clave, limite)
+
+    items = [{"id": r[0], **diagnostico_desde_fila(r[1:])} for r in rows]
 
     items.reverse()
     return {"items": items}
 
+def rango_epoch(desde: Optional[str], hasta: Optional[str]):
+    try:
+        return (
+            ts_a_epoch(desde) if desde else EPOCH_MIN,
+            ts_a_epoch(hasta) if hasta else EPOCH_MAX,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"desde/hasta inválido: {e}")
+
+
 @app.get("/api/v1/samples")
-def samples(machine_id: str, actuator_id: str, limite: int = 200):
-    con = obtener_conexion()
-    cur = con.execute(
-        "SELECT ts, machine_id, actuator_id, motor_temp_c, motor_rpm, motor_vibration_rms "
-        "FROM muestras WHERE machine_id=? AND actuator_id=? ORDER BY id DESC LIMIT ?",
-        (machine_id, actuator_id, limite)
-    )
-    rows = cur.fetchall()
-    con.close()
+def samples(
+    machine_id: str,
+    actuator_id: str,
+    limite: int = 200,
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    bucket: Optional[str] = None,
+    lttb_puntos: Optional[int] = None,
+    after_id: Optional[int] = None,
+    since_ts: Optional[str] = None,
+):
+    """
+    Sin más parámetros: las últimas `limite` muestras crudas (como siempre).
+    after_id/since_ts: sólo las nuevas, con cursor (ver pagina_cursor).
+    desde/hasta (ISO-8601) acotan el rango: las últimas `limite` del rango
+    por ts (en orden de ts). Para rangos largos:
+    - bucket=1s|1m|1h: min/max/mean/std/last por bucket. Si el bucket es
+      múltiplo de 1 min sale de las tablas de rollup (O(buckets)), con
+      desde alineado al inicio de su bucket.
+    - lttb_puntos=N: N puntos por métrica elegidos con LTTB (forma visual).
+    """
+    if bucket and lttb_puntos:
+        raise HTTPException(status_code=422, detail="Usa bucket o lttb_puntos, no ambos")
+    if after_id is not None or since_ts:
+        return pagina_cursor("muestras", machine_id, actuator_id, limite, after_id, since_ts)
+    t0, t1 = rango_epoch(desde, hasta)
 
-    items = []
-    for ts, mid, aid, t, rpm, v in rows:
-        items.append({
-            "ts": ts,
-            "machine_id": mid,
-            "actuator_id": aid,
-            "motor_temp_c": t,
-            "motor_rpm": rpm,
-            "motor_vibration_rms": v
-        })
+    if bucket:
+        return muestras_por_bucket(machine_id, actuator_id, bucket, t0, t1)
+    if lttb_puntos:
+        return muestras_lttb(machine_id, actuator_id, lttb_puntos, t0, t1)
+
+    clave = claves(machine_id, actuator_id)
+    with lectura() as con:
+        if desde or hasta:
+            rows = particiones.ultimas_por_ts(
+                con, catalogo(), "muestras", SQL_MUESTRAS_RANGO, (*clave, *rango_ms(t0, t1)), limite, t0, t1
+            )
+        else:
+            rows = particiones.ultimas(con, catalogo(), "muestras", SQL_MUESTRAS, clave, limite)
+
+    items = [muestra_desde_fila(r) for r in rows]
 
     items.reverse()
     return {"items": items}
 
+
+CURSORES = {
+    "muestras": ("samples", SQL_MUESTRAS_CURSOR, muestra_desde_fila),
+    "diagnosticos": ("diagnostics", SQL_DIAGNOSTICOS_CURSOR, lambda r: {"id": r[0], **diagnostico_desde_fila(r[1:])}),
+}
+
+
+def pagina_cursor(base: str, machine_id: str, actuator_id: str, limite: int, after_id, since_ts) -> dict:
+    """
+    Filas con id > after_id (y ts >= since_ts), en orden ascendente, hasta
+    `limite`. cursor.after_id es lo que hay que mandar en la próxima
+    llamada; mas=true si quedaron filas pendientes (pedir de nuevo ya).
+    """
+    t0, t1 = rango_epoch(since_ts, None)
+    _, sql, desde_fila = CURSORES[base]
+    with lectura() as con:
+        rows, hasta = particiones.siguientes(
+            con, catalogo(), base, sql, (*claves(machine_id, actuator_id), rango_ms(t0, t1)[0]), after_id or 0, limite,
+            t0 if since_ts else None,
+        )
+    mas = len(rows) >= limite
+    siguiente = rows[-1][0] if mas else max(hasta, after_id or 0)
+    return {"items": [desde_fila(r) for r in rows], "cursor": {"after_id": siguiente}, "mas": mas}
+
+
+async def long_poll(base: str, machine_id: str, actuator_id: str, limite: int, after_id, since_ts, espera: float):
+    # Se suscribe antes de leer: un commit entre la lectura y la espera no se pierde
+    sub, _, _ = eventos.suscribir(machine_id, actuator_id, [CURSORES[base][0]])
+    try:
+        loop = asyncio.get_running_loop()
+        fin = loop.time() + min(max(espera, 0.0), POLL_MAX_SEG)
+        while True:
+            pagina = await asyncio.to_thread(pagina_cursor, base, machine_id, actuator_id, limite, after_id, since_ts)
+            restante = fin - loop.time()
+            if pagina["items"] or restante <= 0:
+                return pagina
+            after_id = pagina["cursor"]["after_id"]
+            try:
+                await asyncio.wait_for(sub.cola.get(), restante)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        eventos.desuscribir(sub)
+
+
+@app.get("/api/v1/samples/poll")
+async def samples_poll(
+    machine_id: str,
+    actuator_id: str,
+    after_id: Optional[int] = None,
+    since_ts: Optional[str] = None,
+    espera: float = 25,
+    limite: int = 200,
+):
+    """
+    Long-poll de /samples?after_id=: responde apenas hay muestras nuevas o
+    tras `espera` segundos (items vacío, mismo cursor).
+    """
+    return await long_poll("muestras", machine_id, actuator_id, limite, after_id, since_ts, espera)
+
+
+@app.get("/api/v1/diagnostics/poll")
+async def diagnostics_poll(
+    machine_id: str,
+    actuator_id: str,
+    after_id: Optional[int] = None,
+    since_ts: Optional[str] = None,
+    espera: float = 25,
+    limite: int = 50,
+):
+    """
+    Long-poll de /diagnostics?after_id= (ver /samples/poll).
+    """
+    return await long_poll("diagnosticos", machine_id, actuator_id, limite, after_id, since_ts, espera)
+
+
+def muestras_por_bucket(machine_id: str, actuator_id: str, bucket: str, t0: int, t1: int):
+    seg = bucket_seg(bucket)
+    res = resolucion_para(seg)
+    clave = claves(machine_id, actuator_id)
+
+    with lectura() as con:
+        agrupado = buckets_muestras(con, clave, seg, res, t0, t1)
+
+    items = []
+    for cubeta, n, resumen in agrupado:
+        item = {"ts": epoch_a_ts(cubeta), "machine_id": machine_id, "actuator_id": actuator_id, "n": n}
+        item.update(zip(METRICAS, resumen))
+        items.append(item)
+    return {"bucket_seg": seg, "items": items}
+
+
+def buckets_muestras(con, clave: tuple, seg: int, res, t0: int, t1: int) -> list:
+    """
+    [(cubeta, n, resumen por métrica)] de un actuador: de los rollups si el
+    bucket es múltiplo de una resolución mantenida (res), si no de las
+    particiones crudas. Las dos fuentes traen filas de la misma forma y se
+    combinan igual (un bucket que cruza el cambio de día viene de dos
+    particiones), así "last" y std no dependen de cuál responde.
+    """
+    if res is not None:
+        rows = con.execute(SQL_ROLLUP_MUESTRAS, (*clave, res, t0 // seg * seg, t1)).fetchall()
+    else:
+        rows = particiones.todas(
+            con, catalogo(), "muestras", SQL_MUESTRAS_BUCKET, (seg, *clave, *rango_ms(t0, t1)), t0, t1
+        )
+        rows = sorted((r[0] * seg, *r[1:]) for r in rows)
+    return reagrupar_muestras(rows, seg)
+
+
+def bucket_seg(bucket: str) -> int:
+    try:
+        return parsear_bucket(bucket)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+def muestras_lttb(machine_id: str, actuator_id: str, puntos: int, t0: int, t1: int):
+    if puntos < 3:
+        raise HTTPException(status_code=422, detail="lttb_puntos debe ser >= 3")
+
+    with lectura() as con:
+        rows = particiones.todas(
+            con, catalogo(), "muestras", SQL_MUESTRAS_SERIE, (*claves(machine_id, actuator_id), *rango_ms(t0, t1)), t0, t1
+        )
+    rows.sort(key=lambda r: (r[1], r[0]))
+
+    # x = ts en ms; sólo los puntos elegidos se pasan a texto
+    xs = [r[1] for r in rows]
+    series = {}
+    for k, metrica in enumerate(METRICAS):
+        ys = [r[2 + k] for r in rows]
+        series[metrica] = [{"ts": texto_ts(xs[i]), "valor": ys[i]} for i in lttb(xs, ys, puntos)]
+    return {"machine_id": machine_id, "actuator_id": actuator_id, "n": len(rows), "series": series}
+
+
+def bucket_frame(t0: int, t1: int, puntos: int) -> int:
+    """
+    Bucket (segundos) para no pasar de `puntos` filas en [t0, t1]. Desde
+    1 min se redondea a minutos, así sale de los rollups.
+    """
+    seg = max(-(-(t1 - t0 + 1) // puntos), 1)
+    return -(-seg // 60) * 60 if seg > 60 else seg
+
+
+@app.get("/api/v1/samples/frame")
+def samples_frame(
+    machine_id: str,
+    desde: str,
+    hasta: str,
+    actuator_ids: Optional[str] = None,
+    bucket: Optional[str] = None,
+    puntos: int = 500,
+):
+    """
+    Varios actuadores de una máquina en un solo frame alineado en el tiempo,
+    listo para graficarlos juntos: un ts por bucket y, por métrica y
+    actuador, el último valor del bucket (null si no hubo muestras).
+    actuator_ids: separados por comas (por defecto, los conocidos de la
+    máquina: con diagnósticos o que enviaron datos desde el arranque).
+    Sin bucket se elige uno para no pasar de `puntos` filas.
+    """
+    if puntos < 1:
+        raise HTTPException(status_code=422, detail="puntos debe ser >= 1")
+    t0, t1 = rango_epoch(desde, hasta)
+    if actuator_ids:
+        actuadores = [a for a in actuator_ids.split(",") if a]
+    else:
+        actuadores = sorted(
+            {d["actuator_id"] for d in ultimos.por_maquina(machine_id)} | set(latidos.latidos.actuadores(machine_id))
+        )
+    seg = bucket_seg(bucket) if bucket else bucket_frame(t0, t1, puntos)
+    res = resolucion_para(seg)
+
+    # actuador -> {cubeta: (último valor de cada métrica)}
+    por_actuador = {}
+    with lectura() as con:
+        for act in actuadores:
+            agrupado = buckets_muestras(con, claves(machine_id, act), seg, res, t0, t1)
+            por_actuador[act] = {c: tuple(m["last"] for m in resumen) for c, _, resumen in agrupado}
+
+    cubetas = sorted(set().union(*por_actuador.values()))
+    series = {
+        metrica: {
+            act: [fila[k] if fila else None for fila in map(valores.get, cubetas)]
+            for act, valores in por_actuador.items()
+        }
+        for k, metrica in enumerate(METRICAS)
+    }
+    return {
+        "machine_id": machine_id,
+        "actuator_ids": actuadores,
+        "bucket_seg": seg,
+        "ts": [epoch_a_ts(c) for c in cubetas],
+        "series": series,
+    }
+
+
+@app.get("/api/v1/diagnostics/rollup")
+def diagnostics_rollup(
+    machine_id: str,
+    actuator_id: str,
+    bucket: str = "1h",
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+):
+    """
+    Conteo de diagnósticos por estado y bucket (múltiplo de 1 min), leído
+    de las tablas de rollup.
+    """
+    seg = bucket_seg(bucket)
+    res = resolucion_para(seg)
+    if res is None:
+        raise HTTPException(status_code=422, detail="bucket debe ser múltiplo de 1m")
+    t0, t1 = rango_epoch(desde, hasta)
+
+    with lectura() as con:
+        rows = con.execute(SQL_ROLLUP_DIAGNOSTICOS, (*claves(machine_id, actuator_id), res, t0 // seg * seg, t1)).fetchall()
+
+    por_cubeta = {}
+    for cubeta, *conteos in rows:
+        acc = por_cubeta.setdefault(cubeta // seg * seg, [0, 0, 0, 0])
+        for k, v in enumerate(conteos):
+            acc[k] += v
+
+    items = [
+        {"ts": epoch_a_ts(c), "n": n, "normal": normal, "warning": warning, "critical": critical}
+        for c, (n, normal, warning, critical) in por_cubeta.items()
+    ]
+    return {"machine_id": machine_id, "actuator_id": actuator_id, "bucket_seg": seg, "items": items}
+
+
+def filtros_export(tabla: str, desde, hasta, machine_id, actuator_id) -> dict:
+    if not exportar.disponible():
+        raise HTTPException(status_code=501, detail="Exportar requiere instalar 'pyarrow'")
+    if tabla not in ("muestras", "diagnosticos"):
+        raise HTTPException(status_code=422, detail="tabla debe ser muestras o diagnosticos")
+    t0, t1 = rango_epoch(desde, hasta)
+    inicializar_db()
+    return {
+        "t0": t0, "t1": t1,
+        "machine_id": ids.maquinas.id(machine_id) if machine_id else None,
+        "actuator_id": ids.actuadores.id(actuator_id) if actuator_id else None,
+    }
+
+
+@app.get("/api/v1/export")
+def export(
+    tabla: str = "muestras",
+    formato: str = "arrow",
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    machine_id: Optional[str] = None,
+    actuator_id: Optional[str] = None,
+):
+    """
+    Descarga masiva columnar de un rango de muestras o diagnósticos.
+    formato=arrow (Arrow IPC stream) o parquet. Se escribe lote a lote
+    desde el cursor, con memoria constante. En pandas:
+    pd.read_parquet(io.BytesIO(r.content)) o pa.ipc.open_stream(r.content).read_pandas().
+    """
+    if formato not in exportar.FORMATOS:
+        raise HTTPException(status_code=422, detail=f"formato debe ser uno de {list(exportar.FORMATOS)}")
+    filtros = filtros_export(tabla, desde, hasta, machine_id, actuator_id)
+    extension = "arrows" if formato == "arrow" else "parquet"
+    return StreamingResponse(
+        exportar.stream(lectura, catalogo(), tabla, formato, filtros),
+        media_type=exportar.FORMATOS[formato],
+        headers={"Content-Disposition": f'attachment; filename="{tabla}.{extension}"'},
+    )
+
+
+@app.post("/api/v1/export/parquet")
+def export_parquet(
+    destino: str,
+    tabla: str = "muestras",
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    machine_id: Optional[str] = None,
+    actuator_id: Optional[str] = None,
+):
+    """
+    Escribe el rango como Parquet particionado por día dentro de
+    EXPORT_DIR/<destino> (un nombre simple, sin rutas).
+    """
+    if not re.fullmatch(r"[A-Za-z0-9_.-]+", destino) or destino.startswith("."):
+        raise HTTPException(status_code=422, detail="destino debe ser un nombre simple (letras, números, _ . -)")
+    filtros = filtros_export(tabla, desde, hasta, machine_id, actuator_id)
+    archivos = exportar.a_directorio(lectura, catalogo(), tabla, filtros, os.path.join(EXPORT_DIR, destino))
+    return {"ok": True, "archivos": archivos}
+
+
+@app.get("/api/v1/stream")
+async def stream_eventos(
+    request: Request,
+    machine_id: Optional[str] = None,
+    actuator_id: Optional[str] = None,
+    tipos: str = "samples,diagnostics",
+    last_event_id: Optional[str] = Header(None),
+):
+    """
+    Server-Sent Events con las muestras/diagnósticos apenas se commitean,
+    filtrables por máquina y actuador. Eventos:
+    - hola: al conectar; reanudado=false => recargar la ventana con /samples
+      y /diagnostics y seguir desde aquí.
+    - samples / diagnostics: {"items": [...]} (mismo formato que los GET, con id).
+    Al reconectar con Last-Event-ID se reenvía lo perdido si sigue en el buffer.
+    """
+    lista = [t for t in tipos.split(",") if t]
+    if not lista or any(t not in eventos.TIPOS for t in lista):
+        raise HTTPException(status_code=422, detail=f"tipos debe ser una lista de {list(eventos.TIPOS)}")
+
+    async def emitir():
+        sub, saludo, pendientes = eventos.suscribir(machine_id, actuator_id, lista, last_event_id)
+        try:
+            yield "retry: 3000\n" + saludo
+            for mensaje in pendientes:
+                yield eventos.formatear(*mensaje)
+            while True:
+                try:
+                    mensaje = await asyncio.wait_for(sub.cola.get(), SSE_LATIDO_SEG)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": latido\n\n"
+                    continue
+                if mensaje is None:
+                    break   # cliente atrasado: reconecta con Last-Event-ID
+                yield eventos.formatear(*mensaje)
+        finally:
+            eventos.desuscribir(sub)
+
+    return StreamingResponse(
+        emitir(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
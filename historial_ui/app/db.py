@@ -1,40 +1,659 @@
+import os
+import queue
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import reduce
+from operator import or_
 from pathlib import Path
 
-RUTA_DB = Path("/data/app.db")
-
-def obtener_conexion():
-    RUTA_DB.parent.mkdir(parents=True, exist_ok=True)
-    con = sqlite3.connect(RUTA_DB)
-
-    con.execute("""
-        CREATE TABLE IF NOT EXISTS muestras (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ts TEXT,
-            machine_id TEXT,
-            actuator_id TEXT,
-            motor_temp_c REAL,
-            motor_rpm REAL,
-            motor_vibration_rms REAL
-)
-""")
-
-    con.execute("""
-        CREATE TABLE IF NOT EXISTS diagnosticos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ts TEXT,
-            machine_id TEXT,
-            actuator_id TEXT,
-            estado TEXT,
-            razones TEXT,
-            temp_mean REAL,
-            temp_std REAL,
-            rpm_mean REAL,
-            rpm_std REAL,
-            vib_rms REAL
+from app import ids, metricas
+from app.particiones import Catalogo, COLUMNAS, DIA_SEG, ddl_particion
+from app.series import ts_a_ms
+
+RUTA_DB = Path(os.getenv("RUTA_DB", "/data/app.db"))
+
+LECTORES_POOL = int(os.getenv("LECTORES_POOL", "4"))             # conexiones de solo lectura
+ESCRITURA_LOTE_MAX = int(os.getenv("ESCRITURA_LOTE_MAX", "1000"))  # filas máx. por commit agrupado
+CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", "20000"))
+RETENCION_DIAS = int(os.getenv("RETENCION_DIAS", "0"))          # días de datos crudos a conservar; 0 = todos
+MANTENIMIENTO_SEG = float(os.getenv("MANTENIMIENTO_SEG", "300"))  # cada cuánto se aplica retención y vacuum
+VACUUM_PAGINAS = int(os.getenv("VACUUM_PAGINAS", "2000"))       # páginas liberadas por paso de vacuum
+
+# Ya los crean las migraciones (1, 4 y 5); se repiten por si la retención
+# borró las tablas originales (se recrean vacías, con el esquema de
+# las particiones, y sirven de referencia de planes)
+ESQUEMA = ddl_particion("muestras", "muestras") + ddl_particion("diagnosticos", "diagnosticos")
+
+# Migraciones incrementales sobre bases existentes; PRAGMA user_version
+# guarda cuántas ya se aplicaron. Sólo se agregan al final, nunca se editan.
+MIGRACIONES = [
+    # 1: índices compuestos para los filtros por (machine_id, actuator_id) ordenados por id
+    [
+        "CREATE INDEX IF NOT EXISTS idx_muestras_maq_act_id ON muestras (machine_id, actuator_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_diagnosticos_maq_act_id ON diagnosticos (machine_id, actuator_id, id)",
+    ],
+    # 2: rollups por (actuador, resolución, cubeta) mantenidos al insertar; se
+    # rellenan con lo que ya hubiera en las tablas crudas
+    [
+        """
+        CREATE TABLE IF NOT EXISTS rollup_muestras (
+            machine_id TEXT, actuator_id TEXT, resolucion INTEGER, cubeta INTEGER,
+            n INTEGER, t_ultimo INTEGER,
+            temp_suma REAL, temp_suma2 REAL, temp_min REAL, temp_max REAL, temp_ultimo REAL,
+            rpm_suma REAL, rpm_suma2 REAL, rpm_min REAL, rpm_max REAL, rpm_ultimo REAL,
+            vib_suma REAL, vib_suma2 REAL, vib_min REAL, vib_max REAL, vib_ultimo REAL,
+            PRIMARY KEY (machine_id, actuator_id, resolucion, cubeta)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS rollup_diagnosticos (
+            machine_id TEXT, actuator_id TEXT, resolucion INTEGER, cubeta INTEGER,
+            n INTEGER, n_normal INTEGER, n_warning INTEGER, n_critical INTEGER,
+            PRIMARY KEY (machine_id, actuator_id, resolucion, cubeta)
+        ) WITHOUT ROWID
+        """,
+        """
+        WITH r(res) AS (VALUES (60), (3600)),
+        b AS (
+            SELECT machine_id, actuator_id, res, CAST(strftime('%s', ts) AS INTEGER) / res * res AS cubeta,
+                   COUNT(*) AS n, MAX(id) AS ultimo,
+                   SUM(motor_temp_c) AS t_s, SUM(motor_temp_c * motor_temp_c) AS t_s2,
+                   MIN(motor_temp_c) AS t_min, MAX(motor_temp_c) AS t_max,
+                   SUM(motor_rpm) AS r_s, SUM(motor_rpm * motor_rpm) AS r_s2,
+                   MIN(motor_rpm) AS r_min, MAX(motor_rpm) AS r_max,
+                   SUM(motor_vibration_rms) AS v_s, SUM(motor_vibration_rms * motor_vibration_rms) AS v_s2,
+                   MIN(motor_vibration_rms) AS v_min, MAX(motor_vibration_rms) AS v_max
+            FROM muestras, r WHERE strftime('%s', ts) IS NOT NULL
+            GROUP BY machine_id, actuator_id, res, cubeta
+        )
+        INSERT INTO rollup_muestras
+        SELECT b.machine_id, b.actuator_id, b.res, b.cubeta, b.n, CAST(strftime('%s', m.ts) AS INTEGER),
+               b.t_s, b.t_s2, b.t_min, b.t_max, m.motor_temp_c,
+               b.r_s, b.r_s2, b.r_min, b.r_max, m.motor_rpm,
+               b.v_s, b.v_s2, b.v_min, b.v_max, m.motor_vibration_rms
+        FROM b JOIN muestras m ON m.id = b.ultimo
+        """,
+        """
+        WITH r(res) AS (VALUES (60), (3600))
+        INSERT INTO rollup_diagnosticos
+        SELECT machine_id, actuator_id, res, CAST(strftime('%s', ts) AS INTEGER) / res * res AS cubeta,
+               COUNT(*), SUM(estado = 'normal'), SUM(estado = 'warning'), SUM(estado = 'critical')
+        FROM diagnosticos, r WHERE strftime('%s', ts) IS NOT NULL
+        GROUP BY machine_id, actuator_id, res, cubeta
+        """,
+    ],
+    # 3: catálogo de particiones por día; las tablas originales quedan
+    # registradas como partición histórica (sin día)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS particiones (
+            nombre TEXT PRIMARY KEY,
+            base TEXT NOT NULL,
+            dia INTEGER,
+            id_max INTEGER
         )
-        """)
+        """,
+        "INSERT INTO particiones VALUES ('muestras', 'muestras', NULL, (SELECT MAX(id) FROM muestras))",
+        "INSERT INTO particiones VALUES ('diagnosticos', 'diagnosticos', NULL, (SELECT MAX(id) FROM diagnosticos))",
+    ],
+    # 4: tablas de búsqueda (app/ids.py) y filas enteras: ts en epoch ms,
+    # ids y estado como enteros, razones como máscara de bits
+    [
+        lambda con: _convertir_a_ids(con),
+    ],
+    # 5: índice (machine_id, actuator_id, ts) en cada partición, para los
+    # rangos de tiempo (ver ddl_particion)
+    [
+        lambda con: _indices_ts(con),
+    ],
+    # 6: rollup_muestras guarda m2 (desviaciones a la media) en vez de la suma
+    # de cuadrados, y el "último" pasa a ser el de mayor (ts en ms, id). Las
+    # filas viejas no tienen id: quedan con 0 y su segundo en ms. Su m2 sale
+    # de restar cuadrados: lo que queda por debajo del error de redondeo de
+    # esa resta es ruido y se toma como 0.
+    [
+        "ALTER TABLE rollup_muestras ADD COLUMN id_ultimo INTEGER NOT NULL DEFAULT 0",
+        "UPDATE rollup_muestras SET t_ultimo = t_ultimo * 1000",
+    ] + [
+        sql.format(p=p)
+        for p in ("temp", "rpm", "vib")
+        for sql in (
+            "ALTER TABLE rollup_muestras RENAME COLUMN {p}_suma2 TO {p}_m2",
+            "UPDATE rollup_muestras SET {p}_m2 = CASE WHEN {p}_m2 - {p}_suma * {p}_suma / n <= {p}_m2 * n * 1e-15 "
+            "THEN 0.0 ELSE {p}_m2 - {p}_suma * {p}_suma / n END",
+        )
+    ],
+]
+
+# Expresiones para pasar cada tabla cruda de texto a enteros (migración 4)
+CONVERSION_IDS = {
+    "muestras": "_ts_ms(ts), _id('maquinas', machine_id), _id('actuadores', actuator_id), "
+                "motor_temp_c, motor_rpm, motor_vibration_rms",
+    "diagnosticos": "_ts_ms(ts), _id('maquinas', machine_id), _id('actuadores', actuator_id), "
+                    "_id('estados', estado), _mascara(razones), "
+                    "temp_mean, temp_std, rpm_mean, rpm_std, vib_rms",
+}
+
+ROLLUPS_IDS = {
+    "rollup_muestras": """
+        CREATE TABLE rollup_muestras_ids (
+            machine_id INTEGER, actuator_id INTEGER, resolucion INTEGER, cubeta INTEGER,
+            n INTEGER, t_ultimo INTEGER,
+            temp_suma REAL, temp_suma2 REAL, temp_min REAL, temp_max REAL, temp_ultimo REAL,
+            rpm_suma REAL, rpm_suma2 REAL, rpm_min REAL, rpm_max REAL, rpm_ultimo REAL,
+            vib_suma REAL, vib_suma2 REAL, vib_min REAL, vib_max REAL, vib_ultimo REAL,
+            PRIMARY KEY (machine_id, actuator_id, resolucion, cubeta)
+        ) WITHOUT ROWID
+    """,
+    "rollup_diagnosticos": """
+        CREATE TABLE rollup_diagnosticos_ids (
+            machine_id INTEGER, actuator_id INTEGER, resolucion INTEGER, cubeta INTEGER,
+            n INTEGER, n_normal INTEGER, n_warning INTEGER, n_critical INTEGER,
+            PRIMARY KEY (machine_id, actuator_id, resolucion, cubeta)
+        ) WITHOUT ROWID
+    """,
+}
+
+
+def _tipo_columna(con: sqlite3.Connection, tabla: str, columna: str):
+    fila = con.execute("SELECT type FROM pragma_table_info(?) WHERE name=?", (tabla, columna)).fetchone()
+    return fila[0] if fila else None
 
 
-    con.commit()
+def _convertir_a_ids(con: sqlite3.Connection):
+    """
+    Migración 4. Llena las tablas de búsqueda con los valores que ya hay y
+    reescribe cada tabla con columnas de texto (CREATE nueva, INSERT SELECT,
+    DROP, RENAME). Las que ya son enteras (base nueva) quedan como están.
+    Un ts que no parsea queda NULL (antes tampoco entraba en los rangos).
+    """
+    for tabla in ids.TABLAS:
+        con.execute(ids.SQL_CREAR.format(tabla=tabla))
+    nuevos = {d.tabla: {} for d in ids.DICCIONARIOS.values()}
+
+    def id_de(tabla, nombre):
+        if nombre is None:
+            return None
+        d, vistos = ids.DICCIONARIOS[tabla], nuevos[tabla]
+        if nombre not in vistos:
+            vistos[nombre] = d.primero + len(vistos)
+            if d.maximo is not None and vistos[nombre] > d.maximo:
+                raise ValueError(f"{tabla}: más de {d.maximo - d.primero + 1} valores distintos")
+        return vistos[nombre]
+
+    def ms(texto):
+        try:
+            return ts_a_ms(texto)
+        except (TypeError, ValueError):
+            return None
+
+    con.create_function("_id", 2, id_de)
+    con.create_function("_ts_ms", 1, ms)
+    con.create_function("_mascara", 1, lambda razones: reduce(
+        or_, (1 << id_de("razones", r) for r in (razones or "").split(",") if r), 0
+    ))
+
+    for nombre, base in con.execute("SELECT nombre, base FROM particiones").fetchall():
+        if _tipo_columna(con, nombre, "ts") != "TEXT":
+            continue
+        print(f"[historial] Migración 4: convirtiendo {nombre}")
+        con.execute(f"CREATE TABLE {nombre}_ids (id INTEGER PRIMARY KEY, {COLUMNAS[base]})")
+        con.execute(f"INSERT INTO {nombre}_ids SELECT id, {CONVERSION_IDS[base]} FROM {nombre} ORDER BY id")
+        con.execute(f"DROP TABLE {nombre}")
+        con.execute(f"ALTER TABLE {nombre}_ids RENAME TO {nombre}")
+        con.execute(f"CREATE INDEX idx_{nombre}_maq_act_id ON {nombre} (machine_id, actuator_id, id)")
+
+    for tabla, ddl in ROLLUPS_IDS.items():
+        if _tipo_columna(con, tabla, "machine_id") != "TEXT":
+            continue
+        columnas = [c for (c,) in con.execute("SELECT name FROM pragma_table_info(?)", (tabla,))]
+        seleccion = ["_id('maquinas', machine_id)", "_id('actuadores', actuator_id)"] + columnas[2:]
+        con.execute(ddl)
+        con.execute(f"INSERT INTO {tabla}_ids SELECT {', '.join(seleccion)} FROM {tabla}")
+        con.execute(f"DROP TABLE {tabla}")
+        con.execute(f"ALTER TABLE {tabla}_ids RENAME TO {tabla}")
+
+    for tabla, vistos in nuevos.items():
+        con.executemany(ids.SQL_INSERTAR.format(tabla=tabla), [(i, n) for n, i in vistos.items()])
+
+
+def _conectar() -> sqlite3.Connection:
+    con = sqlite3.connect(RUTA_DB, timeout=10, check_same_thread=False)
+    # WAL: los lectores no bloquean al escritor ni viceversa.
+    # synchronous=NORMAL en WAL sólo arriesga el último commit ante corte de energía.
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.execute(f"PRAGMA cache_size=-{CACHE_KB}")
+    con.execute("PRAGMA temp_store=MEMORY")
+    con.execute("PRAGMA busy_timeout=10000")
     return con
+
+
+H_INSERT = metricas.histograma("historial_sqlite_insert_seconds", "executemany de un commit agrupado (todas las sentencias)")
+H_COMMIT = metricas.histograma("historial_sqlite_commit_seconds", "COMMIT de un commit agrupado")
+H_ESPERA = metricas.histograma("historial_escritura_seconds", "Desde que se encola un pedido hasta que queda confirmado")
+H_FILAS = metricas.histograma(
+    "historial_commit_filas", "Filas por commit agrupado", limites=(1, 10, 50, 100, 500, 1000, 5000, 10000)
+)
+C_ERRORES = metricas.contador("historial_escritura_errores_total", "Pedidos de escritura rechazados por la base")
+
+
+class PoolLectura:
+    """
+    Conjunto fijo de conexiones de lectura reutilizables entre requests.
+    """
+
+    def __init__(self, tamano: int):
+        self._libres = queue.Queue()
+        self._todas = []
+        self.tamano = tamano
+        for _ in range(tamano):
+            con = _conectar()
+            con.execute("PRAGMA query_only=ON")
+            self._libres.put(con)
+            self._todas.append(con)
+
+    @contextmanager
+    def conexion(self):
+        con = self._libres.get()
+        try:
+            yield con
+        finally:
+            self._libres.put(con)
+
+    def libres(self) -> int:
+        return self._libres.qsize()
+
+    def cerrar(self):
+        for con in self._todas:
+            con.close()
+
+
+class ColaEscritura:
+    """
+    Único escritor de la base. Los requests encolan (sql, filas) y esperan;
+    el hilo escritor junta todo lo pendiente en un solo commit (group commit)
+    con un executemany por sentencia distinta (en orden de primera aparición,
+    así las filas de cada tabla conservan su orden). Un pedido puede traer
+    sentencias derivadas (p. ej. rollups) que van en la misma transacción,
+    y DDL/PRAGMA que se ejecutan antes (particiones nuevas, vacuum).
+    El callback opcional al_confirmar corre en el hilo escritor, después del
+    commit y en el mismo orden en que las filas quedaron en la base.
+    """
+
+    def __init__(self, lote_max: int):
+        self._lote_max = lote_max
+        self._cola = queue.Queue()
+        self._con = _conectar()
+        self._hilo = threading.Thread(target=self._bucle, name="escritor-sqlite", daemon=True)
+        self._hilo.start()
+
+    def escribir(self, sql: str, filas: list, al_confirmar=None, derivadas=()):
+        self.esperar(self.encolar([(sql, filas), *derivadas], al_confirmar))
+
+    def encolar(self, sentencias: list, al_confirmar=None, ddl=()) -> dict:
+        pedido = {
+            "ddl": list(ddl),
+            "sentencias": sentencias,
+            "al_confirmar": al_confirmar,
+            "listo": threading.Event(),
+            "error": None,
+            "t0": time.perf_counter(),
+        }
+        self._cola.put(pedido)
+        return pedido
+
+    def pendientes(self) -> int:
+        return self._cola.qsize()
+
+    def esperar(self, pedido: dict):
+        pedido["listo"].wait()
+        if pedido["error"] is not None:
+            raise pedido["error"]
+
+    def cerrar(self):
+        self._cola.put(None)
+        self._hilo.join()
+        self._con.close()
+
+    def _bucle(self):
+        while True:
+            pedido = self._cola.get()
+            if pedido is None:
+                return
+
+            pedidos = [pedido]
+            n_filas = _contar_filas(pedido)
+            while n_filas < self._lote_max:
+                try:
+                    siguiente = self._cola.get_nowait()
+                except queue.Empty:
+                    break
+                if siguiente is None:
+                    self._cola.put(None)
+                    break
+                pedidos.append(siguiente)
+                n_filas += _contar_filas(siguiente)
+
+            self._aplicar(pedidos)
+
+    def _aplicar(self, pedidos: list):
+        try:
+            for p in pedidos:
+                for sql in p["ddl"]:
+                    self._con.execute(sql).fetchall()
+            por_sentencia = {}
+            for p in pedidos:
+                for sql, filas in p["sentencias"]:
+                    por_sentencia.setdefault(sql, []).extend(filas)
+            t0 = time.perf_counter()
+            for sql, filas in por_sentencia.items():
+                self._con.executemany(sql, filas)
+            t1 = time.perf_counter()
+            self._con.commit()
+            H_INSERT.observar(t1 - t0)
+            H_COMMIT.observar(time.perf_counter() - t1)
+            H_FILAS.observar(sum(len(filas) for filas in por_sentencia.values()))
+        except Exception:
+            self._con.rollback()
+            # Reintento uno a uno para que un pedido malo no arrastre al resto
+            for p in pedidos:
+                try:
+                    for sql in p["ddl"]:
+                        self._con.execute(sql).fetchall()
+                    for sql, filas in p["sentencias"]:
+                        self._con.executemany(sql, filas)
+                    self._con.commit()
+                except Exception as e:
+                    self._con.rollback()
+                    p["error"] = e
+                    C_ERRORES.inc()
+        for p in pedidos:
+            if p["error"] is None and p["al_confirmar"] is not None:
+                try:
+                    p["al_confirmar"]()
+                except Exception as e:
+                    print(f"[historial] Error en callback post-commit: {e}")
+            H_ESPERA.observar(time.perf_counter() - p["t0"])
+            p["listo"].set()
+
+
+def _contar_filas(pedido: dict) -> int:
+    return sum(len(filas) for _, filas in pedido["sentencias"]) + len(pedido["ddl"])
+
+
+def _indices_ts(con: sqlite3.Connection):
+    nombres = {nombre for (nombre,) in con.execute("SELECT nombre FROM particiones")} | set(COLUMNAS)
+    for nombre in sorted(nombres):
+        if _tipo_columna(con, nombre, "ts") is None:
+            continue
+        print(f"[historial] Migración 5: índice por ts en {nombre}")
+        con.execute(f"CREATE INDEX IF NOT EXISTS idx_{nombre}_maq_act_ts ON {nombre} (machine_id, actuator_id, ts)")
+
+
+def migrar(con: sqlite3.Connection):
+    """
+    Aplica las migraciones pendientes, cada una en su propia transacción.
+    Cada paso es SQL o una función que recibe la conexión.
+    """
+    version = con.execute("PRAGMA user_version").fetchone()[0]
+    for n, sentencias in enumerate(MIGRACIONES[version:], start=version + 1):
+        print(f"[historial] Aplicando migración {n}")
+        con.execute("BEGIN")
+        try:
+            for sql in sentencias:
+                if callable(sql):
+                    sql(con)
+                else:
+                    con.execute(sql)
+            con.execute(f"PRAGMA user_version={n}")
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+    if version < len(MIGRACIONES):
+        con.execute("ANALYZE")
+        con.commit()
+
+
+def plan_consulta(sql: str, params=()) -> list:
+    """
+    Detalle de EXPLAIN QUERY PLAN para una consulta (una línea por paso).
+    """
+    with lectura() as con:
+        return [fila[3] for fila in con.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def usa_indice(sql: str, params=()) -> bool:
+    """
+    True si ningún paso del plan recorre una tabla completa. Recorrer el
+    resultado de un CTE o subconsulta (MATERIALIZE x / CO-ROUTINE x ...
+    SCAN x) no cuenta.
+    """
+    plan = plan_consulta(sql, params)
+    materializados = {paso.split()[1] for paso in plan if paso.startswith(("MATERIALIZE", "CO-ROUTINE"))}
+    return not any(
+        paso.startswith("SCAN") and paso.split()[1] not in materializados
+        for paso in plan
+    )
+
+
+_estado = {"pool": None, "escritor": None, "catalogo": None, "detener": None}
+_lock_inicio = threading.Lock()
+
+# Se calculan al exportar; sin base inicializada no se exportan
+metricas.medidor("historial_escritor_cola", "Pedidos esperando al escritor", lambda: _estado["escritor"].pendientes())
+metricas.medidor("historial_lectores_libres", "Conexiones de lectura libres", lambda: _estado["pool"].libres())
+metricas.medidor("historial_lectores", "Conexiones de lectura del pool", lambda: _estado["pool"].tamano)
+
+
+def inicializar_db():
+    """
+    Crea el esquema una sola vez y levanta el pool de lectura y el escritor.
+    Idempotente: se llama al arrancar la API.
+    """
+    with _lock_inicio:
+        if _estado["escritor"] is not None:
+            return
+
+        RUTA_DB.parent.mkdir(parents=True, exist_ok=True)
+        con = _conectar()
+        activar_auto_vacuum(con)
+        for ddl in ESQUEMA:
+            con.execute(ddl)
+        con.commit()
+        migrar(con)
+        _estado["catalogo"] = Catalogo(con)
+        ids.cargar(con)
+        con.close()
+
+        _estado["escritor"] = ColaEscritura(ESCRITURA_LOTE_MAX)
+        _estado["pool"] = PoolLectura(LECTORES_POOL)
+        _estado["detener"] = threading.Event()
+        threading.Thread(
+            target=_bucle_mantenimiento, args=(_estado["detener"],), name="mantenimiento-sqlite", daemon=True
+        ).start()
+
+
+def cerrar_db():
+    with _lock_inicio:
+        if _estado["escritor"] is None:
+            return
+        _estado["detener"].set()
+        _estado["escritor"].cerrar()
+        _estado["pool"].cerrar()
+        _estado["escritor"] = None
+        _estado["pool"] = None
+
+
+@contextmanager
+def lectura():
+    inicializar_db()
+    with _estado["pool"].conexion() as con:
+        yield con
+
+
+def catalogo() -> Catalogo:
+    inicializar_db()
+    return _estado["catalogo"]
+
+
+def escribir(sql: str, filas: list, al_confirmar=None, derivadas=()):
+    """
+    Inserta filas con la sentencia dada (más las derivadas [(sql, filas)],
+    en la misma transacción); retorna cuando ya están commiteadas.
+    """
+    inicializar_db()
+    _estado["escritor"].escribir(sql, filas, al_confirmar, derivadas)
+
+
+def insertar(base: str, sql: str, filas: list, al_confirmar=None, derivadas=()):
+    """
+    Como escribir(), pero para una tabla particionada: `sql` lleva {tabla} e
+    id como primera columna; cada fila (sin id) va a la partición de su día.
+    al_confirmar recibe las filas ya con su id global en la posición 0, y
+    derivadas puede ser una función de esas mismas filas.
+    """
+    inicializar_db()
+    cat, escritor = _estado["catalogo"], _estado["escritor"]
+
+    with cat.lock_ids:
+        ddl, sentencias, maximos, con_id = cat.preparar(base, filas, sql)
+        if callable(derivadas):
+            derivadas = derivadas(con_id)
+
+        def confirmar():
+            cat.registrar(maximos)
+            if al_confirmar is not None:
+                al_confirmar(con_id)
+
+        pedido = escritor.encolar(sentencias + list(derivadas), confirmar, ddl)
+    escritor.esperar(pedido)
+
+
+def internar(tabla: str, nombres) -> dict:
+    """
+    nombre -> id de una tabla de búsqueda (ver app/ids.py). Los nombres
+    nuevos se commitean en un pedido propio antes de volver: ninguna fila
+    llega a la base con un id que no esté guardado. Lanza ValueError si la
+    tabla se llena (razones). Los ids nuevos siguen el orden de `nombres`.
+    """
+    d = ids.DICCIONARIOS[tabla]
+    nombres = dict.fromkeys(nombres)
+    if nombres.keys() <= d.ids.keys():
+        return d.ids
+    inicializar_db()
+    with d.lock:
+        nuevos = d.reservar(nombres)
+        if nuevos:
+            _estado["escritor"].escribir(ids.SQL_INSERTAR.format(tabla=tabla), nuevos)
+            d.agregar(nuevos)
+    return d.ids
+
+
+def activar_auto_vacuum(con: sqlite3.Connection):
+    """
+    auto_vacuum=INCREMENTAL permite devolver al disco de a poco lo que
+    liberan los DROP de particiones. Cambiarlo requiere un VACUUM completo:
+    en una base nueva (sin tablas) es instantáneo y se hace al arrancar; en
+    una existente bloquea la base y necesita ~2x su tamaño en disco, así que
+    sólo se avisa (ver convertir_auto_vacuum).
+    """
+    if con.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return
+    if not con.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0]:
+        con.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        con.execute("VACUUM")
+        return
+    print(
+        f"[historial] La base no tiene auto_vacuum incremental: el espacio de las particiones borradas "
+        f"no vuelve al disco. Para activarlo, con el servicio detenido: python -m app.db auto-vacuum "
+        f"(VACUUM completo sobre {_tamano_mb(RUTA_DB):.0f} MB)"
+    )
+
+
+def _tamano_mb(ruta: Path) -> float:
+    return sum(p.stat().st_size for p in (ruta, Path(f"{ruta}-wal")) if p.exists()) / (1 << 20)
+
+
+def convertir_auto_vacuum():
+    """
+    Mantenimiento de una sola vez: activa auto_vacuum incremental en una
+    base existente con un VACUUM completo. Correr con el servicio detenido;
+    reescribe la base entera y usa hasta ~2x su tamaño en disco.
+    """
+    con = _conectar()
+    if con.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        print("[historial] auto_vacuum incremental ya estaba activo")
+        con.close()
+        return
+    mb = _tamano_mb(RUTA_DB)
+    print(f"[historial] VACUUM completo de {RUTA_DB} ({mb:.0f} MB; hace falta hasta {2 * mb:.0f} MB libres)")
+    t0 = time.perf_counter()
+    con.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    con.execute("VACUUM")
+    con.close()
+    print(f"[historial] auto_vacuum incremental activo en {time.perf_counter() - t0:.1f} s ({_tamano_mb(RUTA_DB):.0f} MB)")
+
+
+def aplicar_retencion() -> list:
+    """
+    Borra (DROP) las particiones con datos anteriores a los últimos
+    RETENCION_DIAS días. La referencia es el día más reciente con datos (sin
+    pasar de hoy), para que un replay de datos viejos no se borre solo.
+    Los rollups no se tocan: sobreviven a la retención de los crudos.
+    """
+    cat = _estado["catalogo"]
+    dias = cat.dias()
+    if RETENCION_DIAS <= 0 or not dias:
+        return []
+    hoy = int(time.time()) // DIA_SEG * DIA_SEG
+    corte = min(max(dias), hoy) + DIA_SEG - RETENCION_DIAS * DIA_SEG
+
+    with lectura() as con:
+        vencidas = [(base, nombre) for base in COLUMNAS for nombre in cat.vencidas(con, base, corte)]
+    for base, nombre in vencidas:
+        # Primero se saca del catálogo para que ninguna lectura nueva la use
+        cat.quitar(base, nombre)
+        _estado["escritor"].esperar(_estado["escritor"].encolar(
+            [("DELETE FROM particiones WHERE nombre=?", [(nombre,)])],
+            ddl=[f"DROP TABLE IF EXISTS {nombre}"],
+        ))
+        print(f"[historial] Retención: partición {nombre} eliminada")
+    return [nombre for _, nombre in vencidas]
+
+
+def vacuum_incremental():
+    """
+    Devuelve al disco las páginas libres en pasos de VACUUM_PAGINAS, cada
+    uno como un pedido más del escritor (no lo bloquea por mucho rato).
+    """
+    antes = None
+    while True:
+        with lectura() as con:
+            libres = con.execute("PRAGMA freelist_count").fetchone()[0]
+        if not libres or libres == antes:
+            return
+        antes = libres
+        _estado["escritor"].esperar(_estado["escritor"].encolar(
+            [], ddl=[f"PRAGMA incremental_vacuum({VACUUM_PAGINAS})"]
+        ))
+
+
+def _bucle_mantenimiento(detener: threading.Event):
+    while not detener.wait(MANTENIMIENTO_SEG):
+        try:
+            aplicar_retencion()
+            vacuum_incremental()
+        except Exception as e:
+            print(f"[historial] Error en mantenimiento: {e}")
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] != ["auto-vacuum"]:
+        sys.exit("uso: python -m app.db auto-vacuum")
+    convertir_auto_vacuum()
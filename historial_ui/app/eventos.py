@@ -0,0 +1,125 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+
+EVENTOS_BUFFER = int(os.getenv("EVENTOS_BUFFER", "1024"))   # publicaciones recientes, para reanudar con Last-Event-ID
+EVENTOS_COLA = int(os.getenv("EVENTOS_COLA", "256"))        # mensajes pendientes por suscriptor antes de cortarlo
+
+TIPOS = ("samples", "diagnostics")
+
+# Identifica este proceso en los ids de evento: tras un reinicio la
+# secuencia vuelve a 1 y un Last-Event-ID viejo no debe confundirse.
+_INSTANCIA = format(int(time.time()), "x")
+
+_lock = threading.Lock()
+_recientes = deque(maxlen=EVENTOS_BUFFER)   # (seq, tipo, items)
+_suscriptores = set()
+_seq = 0
+
+
+class Suscripcion:
+    """
+    Un cliente del stream: filtros + cola asyncio en el loop del servidor.
+    Si el cliente no consume y la cola se llena, se corta la suscripción
+    (el cliente reconecta con Last-Event-ID y recupera lo perdido).
+    """
+
+    def __init__(self, loop, machine_id, actuator_id, tipos):
+        self.loop = loop
+        self.cola = asyncio.Queue(EVENTOS_COLA)
+        self.machine_id = machine_id
+        self.actuator_id = actuator_id
+        self.tipos = set(tipos)
+        self.cortada = False
+
+    def filtrar(self, tipo: str, items: list) -> list:
+        if tipo not in self.tipos:
+            return []
+        return [
+            i for i in items
+            if (self.machine_id is None or i["machine_id"] == self.machine_id)
+            and (self.actuator_id is None or i["actuator_id"] == self.actuator_id)
+        ]
+
+    def _entregar(self, mensaje):
+        # Corre en el loop del servidor (call_soon_threadsafe)
+        if self.cortada:
+            return
+        try:
+            self.cola.put_nowait(mensaje)
+        except asyncio.QueueFull:
+            self.cortada = True
+            while not self.cola.empty():
+                self.cola.get_nowait()
+            self.cola.put_nowait(None)
+
+
+def publicar(tipo: str, items: list):
+    """
+    Post-commit (hilo escritor): reparte los items recién confirmados a las
+    suscripciones cuyo filtro coincide. Nunca bloquea al escritor.
+    """
+    global _seq
+    if not items:
+        return
+    with _lock:
+        _seq += 1
+        seq = _seq
+        _recientes.append((seq, tipo, items))
+        suscriptores = list(_suscriptores)
+    for s in suscriptores:
+        propios = s.filtrar(tipo, items)
+        if not propios:
+            continue
+        try:
+            s.loop.call_soon_threadsafe(s._entregar, (seq, tipo, propios))
+        except RuntimeError:
+            pass   # loop cerrado (apagando)
+
+
+def suscribir(machine_id, actuator_id, tipos, ultimo_id=None):
+    """
+    Registra una suscripción (llamar desde el loop). Retorna
+    (suscripción, saludo, mensajes a reenviar). El saludo (evento "hola")
+    dice si se reanudó: si no hay Last-Event-ID o ya no está en el buffer,
+    el cliente debe recargar su ventana completa antes de seguir.
+    """
+    s = Suscripcion(asyncio.get_running_loop(), machine_id, actuator_id, tipos)
+    with _lock:
+        _suscriptores.add(s)
+        seq = _seq_de(ultimo_id)
+        reanudado = seq is not None and seq <= _seq and (
+            seq == _seq or (bool(_recientes) and seq >= _recientes[0][0] - 1)
+        )
+        if not reanudado:
+            seq = _seq
+        pendientes = [(q, t, items) for q, t, items in _recientes if q > seq]
+    # El id del saludo es el punto de reanudación: lo que sigue llega después
+    saludo = f"id: {_INSTANCIA}-{seq}\nevent: hola\ndata: {json.dumps({'reanudado': reanudado})}\n\n"
+    pendientes = [(q, t, s.filtrar(t, items)) for q, t, items in pendientes]
+    return s, saludo, [p for p in pendientes if p[2]]
+
+
+def desuscribir(s: Suscripcion):
+    with _lock:
+        _suscriptores.discard(s)
+
+
+def _seq_de(ultimo_id):
+    instancia, _, seq = (ultimo_id or "").partition("-")
+    if instancia != _INSTANCIA or not seq.isdigit():
+        return None
+    return int(seq)
+
+
+def formatear(seq: int, tipo: str, items: list) -> str:
+    datos = json.dumps({"items": items}, separators=(",", ":"))
+    return f"id: {_INSTANCIA}-{seq}\nevent: {tipo}\ndata: {datos}\n\n"
+
+
+def estado() -> dict:
+    with _lock:
+        return {"suscriptores": len(_suscriptores), "seq": _seq}
@@ -0,0 +1,164 @@
+import os
+import time
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # opcional: sólo hace falta para /api/v1/export
+    pa = pq = None
+
+from app import ids
+from app.series import rango_ms
+
+EXPORT_LOTE = int(os.getenv("EXPORT_LOTE", "65536"))   # filas por RecordBatch / row group
+
+# ts sale como timestamp (ms, UTC) directo del entero guardado; ids, estado
+# y razones se traducen a texto con los diccionarios de app/ids.py
+if pa is not None:
+    ESQUEMAS = {
+        "muestras": pa.schema([
+            ("id", pa.int64()), ("ts", pa.timestamp("ms", tz="UTC")), ("machine_id", pa.string()), ("actuator_id", pa.string()),
+            ("motor_temp_c", pa.float64()), ("motor_rpm", pa.float64()), ("motor_vibration_rms", pa.float64()),
+        ]),
+        "diagnosticos": pa.schema([
+            ("id", pa.int64()), ("ts", pa.timestamp("ms", tz="UTC")),
+            ("machine_id", pa.string()), ("actuator_id", pa.string()), ("estado", pa.string()), ("razones", pa.string()),
+            ("temp_mean", pa.float64()), ("temp_std", pa.float64()), ("rpm_mean", pa.float64()),
+            ("rpm_std", pa.float64()), ("vib_rms", pa.float64()),
+        ]),
+    }
+
+TRADUCIR = {"machine_id": ids.maquinas, "actuator_id": ids.actuadores, "estado": ids.estados}
+
+FORMATOS = {"arrow": "application/vnd.apache.arrow.stream", "parquet": "application/vnd.apache.parquet"}
+
+
+def disponible() -> bool:
+    return pa is not None
+
+
+def _sql(base: str, filtros: dict) -> tuple:
+    columnas = ", ".join(ESQUEMAS[base].names)
+    donde = ["ts BETWEEN ? AND ?"]
+    params = list(rango_ms(filtros["t0"], filtros["t1"]))
+    for campo in ("machine_id", "actuator_id"):
+        if filtros.get(campo) is not None:
+            donde.append(f"{campo}=?")
+            params.append(filtros[campo])
+    return f"SELECT {columnas} FROM {{tabla}} WHERE {' AND '.join(donde)} ORDER BY id", tuple(params)
+
+
+def _traducir(campo: str, valores: tuple):
+    if campo in TRADUCIR:
+        nombres = TRADUCIR[campo].nombres
+        return [nombres.get(v) for v in valores]
+    if campo == "razones":
+        return [",".join(ids.razones.lista(m)) if m is not None else None for m in valores]
+    return valores
+
+
+def _particiones_en_orden(catalogo, base: str, t0: int, t1: int) -> list:
+    # (nombre, dia) cronológico: primero la histórica (sin día), después día a día
+    return sorted(catalogo.dias_para_rango(base, t0, t1), key=lambda x: (x[1] is not None, x[1] or 0))
+
+
+def _lotes(con, catalogo, base: str, filtros: dict):
+    """
+    RecordBatches de a EXPORT_LOTE filas, leídos con fetchmany (memoria
+    constante), partición por partición. Rinde ((nombre, dia), batch).
+    """
+    sql, params = _sql(base, filtros)
+    esquema = ESQUEMAS[base]
+    for nombre, dia in _particiones_en_orden(catalogo, base, filtros["t0"], filtros["t1"]):
+        cur = con.execute(sql.format(tabla=nombre), params)
+        while True:
+            filas = cur.fetchmany(EXPORT_LOTE)
+            if not filas:
+                break
+            columnas = zip(*filas)
+            yield (nombre, dia), pa.record_batch(
+                [pa.array(_traducir(campo.name, col), type=campo.type) for col, campo in zip(columnas, esquema)],
+                schema=esquema,
+            )
+
+
+class _Trozos:
+    """
+    Archivo de sólo escritura que acumula lo escrito hasta que se vacía;
+    permite mandar al cliente cada lote apenas pyarrow lo serializa.
+    """
+
+    closed = False
+
+    def __init__(self):
+        self._partes = []
+        self._pos = 0
+
+    def write(self, datos):
+        datos = bytes(datos)
+        self._partes.append(datos)
+        self._pos += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def vaciar(self) -> bytes:
+        datos, self._partes = b"".join(self._partes), []
+        return datos
+
+
+def stream(lectura, catalogo, base: str, formato: str, filtros: dict):
+    """
+    Generador de bytes en formato Arrow IPC (stream) o Parquet (un row
+    group por lote). Mantiene una conexión de lectura mientras dura.
+    """
+    esquema = ESQUEMAS[base]
+    sumidero = _Trozos()
+    with lectura() as con:
+        if formato == "arrow":
+            escritor = pa.ipc.new_stream(sumidero, esquema)
+        else:
+            escritor = pq.ParquetWriter(sumidero, esquema, compression="zstd")
+        yield sumidero.vaciar()
+        for _, lote in _lotes(con, catalogo, base, filtros):
+            if formato == "arrow":
+                escritor.write_batch(lote)
+            else:
+                escritor.write_table(pa.Table.from_batches([lote]))
+            yield sumidero.vaciar()
+        escritor.close()
+    yield sumidero.vaciar()
+
+
+def a_directorio(lectura, catalogo, base: str, filtros: dict, destino: str) -> list:
+    """
+    Escribe el rango como Parquet particionado estilo Hive, un archivo por
+    partición diaria: destino/base/dia=AAAA-MM-DD/part-0.parquet. Se lee
+    directo con pyarrow.dataset o pandas.read_parquet(destino/base).
+    """
+    esquema = ESQUEMAS[base]
+    archivos = []
+    actual, escritor = None, None
+    with lectura() as con:
+        for (nombre, dia), lote in _lotes(con, catalogo, base, filtros):
+            if nombre != actual:
+                if escritor is not None:
+                    escritor.close()
+                etiqueta = time.strftime("%Y-%m-%d", time.gmtime(dia)) if dia is not None else "historico"
+                carpeta = os.path.join(destino, base, f"dia={etiqueta}")
+                os.makedirs(carpeta, exist_ok=True)
+                ruta = os.path.join(carpeta, "part-0.parquet")
+                escritor = pq.ParquetWriter(ruta, esquema, compression="zstd")
+                archivos.append(ruta)
+                actual = nombre
+            escritor.write_table(pa.Table.from_batches([lote]))
+    if escritor is not None:
+        escritor.close()
+    return archivos
@@ -0,0 +1,99 @@
+import threading
+from functools import reduce
+from operator import or_
+
+# Tablas de búsqueda: las filas guardan enteros y la API traduce con estos
+# diccionarios en memoria. En razones el id es el número de bit de la
+# máscara que guarda cada diagnóstico.
+TABLAS = ("maquinas", "actuadores", "estados", "razones")
+
+NINGUNO = -1          # id de un nombre nunca visto: no coincide con ninguna fila
+MAX_RAZONES = 63      # bits de un INTEGER de SQLite sin tocar el signo
+
+SQL_CREAR = "CREATE TABLE IF NOT EXISTS {tabla} (id INTEGER PRIMARY KEY, nombre TEXT NOT NULL UNIQUE)"
+SQL_INSERTAR = "INSERT INTO {tabla} (id, nombre) VALUES (?,?)"
+
+
+class Diccionario:
+    """
+    nombre <-> id de una tabla de búsqueda. Las lecturas (id, nombre) no
+    toman lock: sólo se agregan entradas ya commiteadas, nunca se cambian.
+    Asignar ids nuevos se serializa con `lock` (ver db.internar).
+    """
+
+    def __init__(self, tabla: str, primero: int = 1, maximo: int = None):
+        self.tabla = tabla
+        self.primero = primero
+        self.maximo = maximo
+        self.ids = {}         # nombre -> id
+        self.nombres = {}     # id -> nombre
+        self.lock = threading.Lock()
+
+    def cargar(self, con):
+        filas = con.execute(f"SELECT id, nombre FROM {self.tabla}").fetchall()
+        self.agregar(filas)
+
+    def agregar(self, filas):
+        for id, nombre in filas:
+            self.nombres[id] = nombre
+            self.ids[nombre] = id
+
+    def id(self, nombre: str) -> int:
+        return self.ids.get(nombre, NINGUNO)
+
+    def nombre(self, id: int) -> str:
+        return self.nombres.get(id)
+
+    def reservar(self, nombres) -> list:
+        """
+        [(id, nombre)] para los nombres que aún no tienen id, en orden de
+        primera aparición (igual que la migración 4). Llamar con lock; los ids
+        quedan visibles recién con agregar(), tras el commit.
+        """
+        siguiente = max(self.nombres, default=self.primero - 1) + 1
+        nuevos = []
+        for nombre in dict.fromkeys(nombres):
+            if nombre in self.ids:
+                continue
+            if self.maximo is not None and siguiente > self.maximo:
+                raise ValueError(f"{self.tabla}: no caben más de {self.maximo - self.primero + 1} valores")
+            nuevos.append((siguiente, nombre))
+            siguiente += 1
+        return nuevos
+
+
+class Razones(Diccionario):
+    """
+    Razones como bits: máscara <-> lista de nombres. Una máscara no guarda
+    orden ni repetidos: la lista sale sin duplicados y en orden de bit, que
+    es el orden en que cada razón apareció por primera vez en la base (no
+    necesariamente el orden en que llegó en cada diagnóstico).
+    """
+
+    def __init__(self):
+        super().__init__("razones", primero=0, maximo=MAX_RAZONES - 1)
+        self._listas = {0: []}
+
+    def mascara(self, razones) -> int:
+        ids = self.ids
+        return reduce(or_, (1 << ids[r] for r in razones), 0)
+
+    def lista(self, mascara: int) -> list:
+        lista = self._listas.get(mascara)
+        if lista is None:
+            lista = [self.nombres[b] for b in sorted(self.nombres) if mascara >> b & 1]
+            self._listas[mascara] = lista
+        return list(lista)
+
+
+maquinas = Diccionario("maquinas")
+actuadores = Diccionario("actuadores")
+estados = Diccionario("estados")
+razones = Razones()
+
+DICCIONARIOS = {d.tabla: d for d in (maquinas, actuadores, estados, razones)}
+
+
+def cargar(con):
+    for d in DICCIONARIOS.values():
+        d.cargar(con)
@@ -0,0 +1,159 @@
+import math
+import os
+import threading
+import time
+
+LATIDO_STALE_SEG = float(os.getenv("LATIDO_STALE_SEG", "10"))       # silencio para pasar a "stale" (0 = desactivado)
+LATIDO_OFFLINE_SEG = float(os.getenv("LATIDO_OFFLINE_SEG", "60"))   # silencio para pasar a "offline"
+LATIDO_TICK_SEG = float(os.getenv("LATIDO_TICK_SEG", "1"))          # resolución de la rueda
+
+VIVO, STALE, OFFLINE = "vivo", "stale", "offline"
+
+
+class RuedaTemporizadores:
+    """
+    Rueda de temporizadores (hashed timing wheel): programar es O(1) y
+    avanzar un tick revisa sólo su ranura. Los vencimientos más allá de una
+    vuelta quedan en su ranura hasta la vuelta que corresponde.
+    """
+
+    def __init__(self, ranuras: int = 512, tick: float = 1.0):
+        self._ranuras = [[] for _ in range(ranuras)]
+        self._tick = tick
+        self._actual = math.floor(time.monotonic() / tick)
+
+    def programar(self, clave, cuando: float):
+        t = max(math.ceil(cuando / self._tick), self._actual + 1)
+        self._ranuras[t % len(self._ranuras)].append((t, clave, cuando))
+
+    def avanzar(self, ahora: float) -> list:
+        """
+        [(clave, cuando)] vencidos hasta `ahora` (monotonic).
+        """
+        hasta = math.floor(ahora / self._tick)
+        vencidas = []
+        n = len(self._ranuras)
+        # Tras un atraso de más de una vuelta basta recorrer cada ranura una vez
+        desde = max(self._actual + 1, hasta - n + 1)
+        for t in range(desde, hasta + 1):
+            ranura = self._ranuras[t % n]
+            if not ranura:
+                continue
+            quedan = []
+            for tv, clave, cuando in ranura:
+                if tv <= hasta:
+                    vencidas.append((clave, cuando))
+                else:
+                    quedan.append((tv, clave, cuando))
+            self._ranuras[t % n] = quedan
+        self._actual = max(self._actual, hasta)
+        return vencidas
+
+
+class Latidos:
+    """
+    Último dato recibido por (machine_id, actuator_id) y su estado de
+    silencio. Un latido cuesta O(1): guarda la hora y, si el actuador no
+    tenía temporizador pendiente, lo programa. El temporizador se revisa al
+    vencer (perezoso): si hubo datos después, se reprograma; si no, el
+    actuador pasa a stale y luego a offline. Cada actuador tiene un solo
+    temporizador válido (_vence); los reemplazados se ignoran al vencer.
+    """
+
+    def __init__(self, stale_seg: float, offline_seg: float, tick: float):
+        self.stale_seg = stale_seg
+        self.offline_seg = max(offline_seg, stale_seg)
+        self._rueda = RuedaTemporizadores(tick=tick)
+        self._ultimo = {}        # clave -> monotonic del último dato
+        self._estado = {}        # clave -> VIVO | STALE | OFFLINE
+        self._vence = {}         # clave -> vencimiento del temporizador vigente
+        self._lock = threading.Lock()
+
+    def _programar(self, clave, cuando: float):
+        self._vence[clave] = cuando
+        self._rueda.programar(clave, cuando)
+
+    def latido(self, claves, ahora: float = None):
+        if self.stale_seg <= 0:
+            return
+        ahora = time.monotonic() if ahora is None else ahora
+        with self._lock:
+            for clave in claves:
+                self._ultimo[clave] = ahora
+                # Vivo con temporizador pendiente: nada más que hacer
+                if self._estado.get(clave) != VIVO or clave not in self._vence:
+                    self._estado[clave] = VIVO
+                    self._programar(clave, ahora + self.stale_seg)
+
+    def revisar(self, ahora: float = None) -> list:
+        """
+        Avanza la rueda. Retorna las transiciones [(clave, estado, silencio_seg)].
+        """
+        ahora = time.monotonic() if ahora is None else ahora
+        cambios = []
+        with self._lock:
+            for clave, cuando in self._rueda.avanzar(ahora):
+                if self._vence.get(clave) != cuando:
+                    continue   # reemplazado por uno más nuevo
+                silencio = ahora - self._ultimo[clave]
+                estado = self._estado[clave]
+                if silencio < self.stale_seg:
+                    # Llegaron datos después de programarlo
+                    self._programar(clave, self._ultimo[clave] + self.stale_seg)
+                    continue
+                if estado == VIVO:
+                    estado = self._estado[clave] = STALE
+                    cambios.append((clave, STALE, silencio))
+                if estado == STALE and silencio >= self.offline_seg:
+                    self._estado[clave] = OFFLINE
+                    cambios.append((clave, OFFLINE, silencio))
+                if self._estado[clave] == OFFLINE:
+                    del self._vence[clave]   # hasta el próximo latido
+                else:
+                    self._programar(clave, self._ultimo[clave] + self.offline_seg)
+        return cambios
+
+    def silenciosos(self, ahora: float = None) -> list:
+        ahora = time.monotonic() if ahora is None else ahora
+        with self._lock:
+            return [
+                (clave, estado, ahora - self._ultimo[clave])
+                for clave, estado in self._estado.items() if estado != VIVO
+            ]
+
+    def actuadores(self, machine_id: str) -> list:
+        with self._lock:
+            return [a for m, a in self._estado if m == machine_id]
+
+    def resumen(self) -> dict:
+        with self._lock:
+            conteo = {VIVO: 0, STALE: 0, OFFLINE: 0}
+            for estado in self._estado.values():
+                conteo[estado] += 1
+        return conteo
+
+
+latidos = Latidos(LATIDO_STALE_SEG, LATIDO_OFFLINE_SEG, LATIDO_TICK_SEG)
+
+
+def iniciar(al_cambiar) -> threading.Event:
+    """
+    Hilo que avanza la rueda cada tick y pasa las transiciones a
+    al_cambiar(cambios). Retorna el Event para detenerlo.
+    """
+    detener = threading.Event()
+    if LATIDO_STALE_SEG <= 0:
+        return detener
+
+    def bucle():
+        while not detener.wait(LATIDO_TICK_SEG):
+            cambios = latidos.revisar()
+            if not cambios:
+                continue
+            try:
+                al_cambiar(cambios)
+            except Exception as e:
+                print(f"[historial] Error emitiendo cambios de latido: {e}")
+
+    threading.Thread(target=bucle, name="latidos", daemon=True).start()
+    return detener
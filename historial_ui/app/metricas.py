@@ -0,0 +1,123 @@
+# Copia idéntica en adquisicion, analisis e historial_ui (app/metricas.py): cada servicio es su
+# propio contexto de build. Se edita en todas a la vez;
+# analisis/tests/test_copias.py falla si difieren.
+
+import bisect
+import threading
+
+# Límites fijos (segundos) de los histogramas de latencia: 0,5 ms a 10 s
+LIMITES_SEG = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Métricas registradas, en orden de creación: nombre -> (tipo, ayuda, [series])
+_familias = {}
+
+
+def _etiquetas(etiquetas: dict, extra: str = "") -> str:
+    partes = [f'{k}="{v}"' for k, v in (etiquetas or {}).items()]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def _registrar(nombre: str, tipo: str, ayuda: str, serie):
+    familia = _familias.setdefault(nombre, (tipo, ayuda, []))
+    familia[2].append(serie)
+    return serie
+
+
+class Contador:
+    __slots__ = ("etiquetas", "valor", "_lock")
+
+    def __init__(self, etiquetas: dict):
+        self.etiquetas = etiquetas
+        self.valor = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self._lock:
+            self.valor += n
+
+    def _lineas(self, nombre: str) -> list:
+        return [f"{nombre}{_etiquetas(self.etiquetas)} {self.valor}"]
+
+
+class Histograma:
+    """
+    Histograma de límites fijos: observar() incrementa un casillero de una
+    lista preasignada (bisect sobre la tupla de límites), sin crear objetos.
+    Se exporta acumulado, como espera Prometheus.
+    """
+
+    __slots__ = ("etiquetas", "limites", "conteos", "suma", "_lock")
+
+    def __init__(self, etiquetas: dict, limites: tuple):
+        self.etiquetas = etiquetas
+        self.limites = limites
+        self.conteos = [0] * (len(limites) + 1)   # el último es +Inf
+        self.suma = 0.0
+        self._lock = threading.Lock()
+
+    def observar(self, valor: float):
+        i = bisect.bisect_left(self.limites, valor)
+        with self._lock:
+            self.conteos[i] += 1
+            self.suma += valor
+
+    def _lineas(self, nombre: str) -> list:
+        with self._lock:
+            conteos, suma = list(self.conteos), self.suma
+        lineas, acumulado = [], 0
+        for limite, n in zip(self.limites + (float("inf"),), conteos):
+            acumulado += n
+            le = "+Inf" if limite == float("inf") else repr(limite)
+            extra = f'le="{le}"'
+            lineas.append(f"{nombre}_bucket{_etiquetas(self.etiquetas, extra)} {acumulado}")
+        lineas.append(f"{nombre}_sum{_etiquetas(self.etiquetas)} {suma}")
+        lineas.append(f"{nombre}_count{_etiquetas(self.etiquetas)} {acumulado}")
+        return lineas
+
+
+class Medidor:
+    """
+    Valor calculado al exportar (profundidad de colas, en vuelo, o totales
+    que ya lleva otro componente): no cuesta nada en el camino caliente.
+    """
+
+    __slots__ = ("etiquetas", "funcion")
+
+    def __init__(self, etiquetas: dict, funcion):
+        self.etiquetas = etiquetas
+        self.funcion = funcion
+
+    def _lineas(self, nombre: str) -> list:
+        try:
+            valor = float(self.funcion())
+        except Exception:
+            return []
+        return [f"{nombre}{_etiquetas(self.etiquetas)} {valor}"]
+
+
+def contador(nombre: str, ayuda: str, etiquetas: dict = None) -> Contador:
+    return _registrar(nombre, "counter", ayuda, Contador(etiquetas))
+
+
+def histograma(nombre: str, ayuda: str, etiquetas: dict = None, limites: tuple = LIMITES_SEG) -> Histograma:
+    return _registrar(nombre, "histogram", ayuda, Histograma(etiquetas, limites))
+
+
+def medidor(nombre: str, ayuda: str, funcion, etiquetas: dict = None, tipo: str = "gauge") -> Medidor:
+    # tipo="counter" para totales calculados (p. ej. los contadores del spool)
+    return _registrar(nombre, tipo, ayuda, Medidor(etiquetas, funcion))
+
+
+def exponer() -> str:
+    """
+    Formato de texto de Prometheus (0.0.4) para /metrics.
+    """
+    lineas = []
+    for nombre, (tipo, ayuda, series) in list(_familias.items()):
+        lineas.append(f"# HELP {nombre} {ayuda}")
+        lineas.append(f"# TYPE {nombre} {tipo}")
+        for serie in series:
+            lineas.extend(serie._lineas(nombre))
+    return "\n".join(lineas) + "\n"
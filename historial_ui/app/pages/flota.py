@@ -0,0 +1,90 @@
+import time
+import requests
+import pandas as pd
+import streamlit as st
+
+# =========================
+# Configuración fija
+# =========================
+API_URL = "http://historial_ui:8003"   # API historial (FastAPI)
+
+INTERVALO_UI_SEG = 2
+CACHE_SEG = 1   # una sola consulta por refresco para todas las sesiones
+
+ESTADOS = ["Todos", "critical", "offline", "warning", "stale", "normal"]
+
+EMOJI = {"critical": "🔴", "offline": "⚫", "warning": "🟠", "stale": "⏳", "normal": "🟢"}
+COLOR = {"critical": "#e53935", "offline": "#616161", "warning": "#fb8c00", "stale": "#8d6e63", "normal": "#43a047"}
+
+
+@st.cache_data(ttl=CACHE_SEG, show_spinner=False)
+def leer_flota(state=None):
+    try:
+        r = requests.get(f"{API_URL}/api/v1/fleet/status", params={"state": state} if state else None, timeout=6)
+        r.raise_for_status()
+        return r.json(), None
+    except Exception as e:
+        return None, str(e)
+
+
+def chip(texto: str, color: str):
+    st.markdown(
+        f"""
+        <span style="
+            display:inline-block;
+            padding:6px 10px;
+            margin:2px 8px 6px 0;
+            border-radius:999px;
+            background:{color};
+            color:white;
+            font-size:13px;
+            font-weight:700;">
+            {texto}
+        </span>
+        """,
+        unsafe_allow_html=True
+    )
+
+
+def fmt_edad(seg):
+    if seg is None:
+        return "-"
+    if seg < 120:
+        return f"{seg:.0f} s"
+    if seg < 7200:
+        return f"{seg / 60:.0f} min"
+    return f"{seg / 3600:.1f} h"
+
+
+st.set_page_config(page_title="Flota", layout="wide")
+st.title("Flota de brazos robóticos")
+st.caption("Peor estado por máquina y actuador, desde la vista en memoria del historial (una sola consulta).")
+
+filtro = st.selectbox("Estado", ESTADOS, index=0)
+j, err = leer_flota(None if filtro == "Todos" else filtro)
+
+if err:
+    chip("Historial: NO conectado", COLOR["critical"])
+    st.write(f"⚠️ {err}")
+else:
+    conteo = j.get("counts", {})
+    for estado in ESTADOS[1:]:
+        chip(f"{EMOJI[estado]} {estado.upper()}: {conteo.get(estado, 0)}", COLOR[estado])
+
+    maquinas = j.get("machines", [])
+    if not maquinas:
+        st.info("Aún no hay diagnósticos en la flota.")
+    else:
+        filas = []
+        for m in maquinas:
+            filas.append({
+                "estado": f"{EMOJI.get(m['state'], '⚪')} {m['state']}",
+                "machine_id": m["machine_id"],
+                "actuadores": "  ".join(f"{EMOJI.get(a['state'], '⚪')} {a['actuator_id']}" for a in m["actuators"]),
+                "razones": ", ".join(m["reasons"]) or "-",
+                "último dato": fmt_edad(m["age_s"]),
+            })
+        st.dataframe(pd.DataFrame(filas), width="stretch", hide_index=True, height=min(40 + 35 * len(filas), 700))
+
+time.sleep(INTERVALO_UI_SEG)
+st.rerun()
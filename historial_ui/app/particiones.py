@@ -0,0 +1,235 @@
+import threading
+import time
+
+DIA_SEG = 86400
+
+# Columnas de cada tabla particionada (sin id). El id es global por tabla
+# base y lo asigna el catálogo, así el orden por id sigue valiendo entre
+# particiones. Todo entero: ts en epoch ms, ids y estado de las tablas de
+# búsqueda y razones como máscara de bits (ver app/ids.py).
+COLUMNAS = {
+    "muestras": "ts INTEGER, machine_id INTEGER, actuator_id INTEGER, "
+                "motor_temp_c REAL, motor_rpm REAL, motor_vibration_rms REAL",
+    "diagnosticos": "ts INTEGER, machine_id INTEGER, actuator_id INTEGER, estado INTEGER, razones INTEGER, "
+                    "temp_mean REAL, temp_std REAL, rpm_mean REAL, rpm_std REAL, vib_rms REAL",
+}
+
+SQL_REGISTRAR = (
+    "INSERT INTO particiones (nombre, base, dia, id_max) VALUES (?,?,?,?) "
+    "ON CONFLICT (nombre) DO UPDATE SET id_max = MAX(COALESCE(id_max, 0), excluded.id_max)"
+)
+
+
+def nombre_particion(base: str, dia: int) -> str:
+    return f"{base}_p{time.strftime('%Y%m%d', time.gmtime(dia))}"
+
+
+def ddl_particion(base: str, nombre: str) -> list:
+    # (maq, act, id): últimas filas y cursores. (maq, act, ts): rangos de tiempo.
+    return [
+        f"CREATE TABLE IF NOT EXISTS {nombre} (id INTEGER PRIMARY KEY, {COLUMNAS[base]})",
+        f"CREATE INDEX IF NOT EXISTS idx_{nombre}_maq_act_id ON {nombre} (machine_id, actuator_id, id)",
+        f"CREATE INDEX IF NOT EXISTS idx_{nombre}_maq_act_ts ON {nombre} (machine_id, actuator_id, ts)",
+    ]
+
+
+class Catalogo:
+    """
+    Particiones por día (según el ts de cada fila) de muestras y diagnósticos.
+
+    Cada partición es una tabla propia ({base}_pAAAAMMDD) registrada en la
+    tabla `particiones` con su día y el mayor id que contiene. Las tablas
+    originales quedan como partición "histórica" sin día (dia NULL). Borrar
+    datos viejos es un DROP TABLE de la partición, no un DELETE fila a fila.
+    """
+
+    def __init__(self, con):
+        # base -> {nombre: {"dia": int | None, "id_max": int}}
+        self.particiones = {base: {} for base in COLUMNAS}
+        for nombre, base, dia, id_max in con.execute("SELECT nombre, base, dia, id_max FROM particiones"):
+            self.particiones[base][nombre] = {"dia": dia, "id_max": id_max or 0}
+        self._siguiente_id = {
+            base: max((p["id_max"] for p in ps.values()), default=0) + 1
+            for base, ps in self.particiones.items()
+        }
+        # Mayor id ya commiteado y registrado: las lecturas por cursor no
+        # pasan de aquí (una partición recién creada aún no es visible)
+        self._confirmado = {base: s - 1 for base, s in self._siguiente_id.items()}
+        self._lock = threading.Lock()
+        # Serializa asignación de ids y encolado: el orden de la cola del
+        # escritor es el orden de los ids, así nunca se commitea un id menor
+        # después de uno mayor.
+        self.lock_ids = threading.Lock()
+
+    def preparar(self, base: str, filas: list, sql_insert: str):
+        """
+        Asigna ids a las filas (ts en ms en la posición 0) y las reparte por día.
+        Retorna (ddl, sentencias, id_max por partición, filas con id en el
+        orden recibido). Llamar con lock_ids.
+        """
+        por_particion = {}
+        con_id = []
+        for f in filas:
+            dia = f[0] // 1000 // DIA_SEG * DIA_SEG
+            nombre = nombre_particion(base, dia)
+            id = self._siguiente_id[base]
+            self._siguiente_id[base] = id + 1
+            fila = (id, *f)
+            por_particion.setdefault((nombre, dia), []).append(fila)
+            con_id.append(fila)
+
+        ddl, sentencias, maximos = [], [], []
+        with self._lock:
+            existentes = self.particiones[base]
+            for (nombre, dia), filas_p in por_particion.items():
+                if nombre not in existentes:
+                    ddl.extend(ddl_particion(base, nombre))
+                sentencias.append((sql_insert.format(tabla=nombre), filas_p))
+                maximos.append((nombre, base, dia, filas_p[-1][0]))
+        sentencias.append((SQL_REGISTRAR, maximos))
+        return ddl, sentencias, maximos, con_id
+
+    def registrar(self, maximos: list):
+        """
+        Post-commit: las particiones nuevas pasan a ser visibles para lectura.
+        """
+        with self._lock:
+            for nombre, base, dia, id_max in maximos:
+                p = self.particiones[base].setdefault(nombre, {"dia": dia, "id_max": 0})
+                p["id_max"] = max(p["id_max"], id_max)
+                self._confirmado[base] = max(self._confirmado[base], id_max)
+
+    def confirmado(self, base: str) -> int:
+        with self._lock:
+            return self._confirmado[base]
+
+    def quitar(self, base: str, nombre: str):
+        with self._lock:
+            self.particiones[base].pop(nombre, None)
+
+    def para_rango(self, base: str, t0: int = None, t1: int = None) -> list:
+        """
+        Nombres de las particiones que pueden tener filas con ts en [t0, t1],
+        de mayor a menor id_max (las más recientes primero).
+        """
+        elegidas = [(nombre, p["id_max"]) for nombre, p in self._en_rango(base, t0, t1)]
+        elegidas.sort(key=lambda x: x[1], reverse=True)
+        return elegidas
+
+    def dias_para_rango(self, base: str, t0: int = None, t1: int = None) -> list:
+        """
+        (nombre, dia) de las particiones que pueden tener filas con ts en
+        [t0, t1]: la histórica (dia None) primero y después de la más nueva
+        a la más vieja.
+        """
+        elegidas = [(nombre, p["dia"]) for nombre, p in self._en_rango(base, t0, t1)]
+        elegidas.sort(key=lambda x: (x[1] is not None, -(x[1] or 0)))
+        return elegidas
+
+    def _en_rango(self, base: str, t0, t1) -> list:
+        with self._lock:
+            items = [(nombre, dict(p)) for nombre, p in self.particiones[base].items()]
+        return [
+            (nombre, p) for nombre, p in items
+            if p["dia"] is None or (
+                (t1 is None or p["dia"] <= t1) and (t0 is None or p["dia"] + DIA_SEG > t0)
+            )
+        ]
+
+    def vencidas(self, con, base: str, corte: int) -> list:
+        """
+        Particiones cuyo día completo es anterior a `corte` (epoch). La
+        histórica vence cuando su fila más nueva (por id) es anterior al corte.
+        """
+        with self._lock:
+            items = list(self.particiones[base].items())
+        vencidas = []
+        for nombre, p in items:
+            if p["dia"] is not None:
+                if p["dia"] + DIA_SEG <= corte:
+                    vencidas.append(nombre)
+                continue
+            fila = con.execute(f"SELECT ts FROM {nombre} ORDER BY id DESC LIMIT 1").fetchone()
+            if fila is None:
+                continue
+            if fila[0] is not None and fila[0] // 1000 < corte:
+                vencidas.append(nombre)
+        return vencidas
+
+    def dias(self) -> list:
+        """
+        Días (epoch) de todas las particiones diarias, de todas las tablas.
+        """
+        with self._lock:
+            return [p["dia"] for ps in self.particiones.values() for p in ps.values() if p["dia"] is not None]
+
+    def resumen(self) -> dict:
+        with self._lock:
+            return {base: len(ps) for base, ps in self.particiones.items()}
+
+
+def ultimas(con, catalogo: Catalogo, base: str, sql: str, params: tuple, limite: int, t0=None, t1=None) -> list:
+    """
+    Ejecuta `sql` (con {tabla}, id como primera columna, ORDER BY id DESC
+    LIMIT ?) sobre las particiones del rango, de la más reciente hacia atrás,
+    y se detiene cuando ninguna partición restante puede aportar ids mayores.
+    Retorna las `limite` filas de mayor id, en orden descendente.
+    """
+    filas = []
+    if limite <= 0:
+        return filas
+    for nombre, id_max in catalogo.para_rango(base, t0, t1):
+        if len(filas) >= limite and filas[limite - 1][0] > id_max:
+            break
+        filas.extend(con.execute(sql.format(tabla=nombre), (*params, limite)).fetchall())
+        filas.sort(key=lambda f: f[0], reverse=True)
+    return filas[:limite]
+
+
+def ultimas_por_ts(con, catalogo: Catalogo, base: str, sql: str, params: tuple, limite: int, t0=None, t1=None) -> list:
+    """
+    Como ultimas(), pero por tiempo: `sql` (con {tabla}, id y ts primero,
+    ORDER BY ts DESC, id DESC LIMIT ?) sobre las particiones del rango. La
+    histórica va primero y después día a día hacia atrás; se detiene cuando
+    ningún día restante puede tener ts mayores. Retorna las `limite` filas
+    de mayor (ts, id), en orden descendente.
+    """
+    filas = []
+    if limite <= 0:
+        return filas
+    for nombre, dia in catalogo.dias_para_rango(base, t0, t1):
+        if dia is not None and len(filas) >= limite and filas[limite - 1][1] >= (dia + DIA_SEG) * 1000:
+            break
+        filas.extend(con.execute(sql.format(tabla=nombre), (*params, limite)).fetchall())
+        filas.sort(key=lambda f: (f[1], f[0]), reverse=True)
+    return filas[:limite]
+
+
+def siguientes(con, catalogo: Catalogo, base: str, sql: str, params: tuple, despues_de: int, limite: int, t0=None):
+    """
+    Lectura por cursor: `sql` (con {tabla}, id primero, que termina en
+    "id > ? AND id <= ? ORDER BY id LIMIT ?") sobre las particiones con ids
+    nuevos. Retorna (filas en orden ascendente, hasta), con hasta = último id
+    confirmado al empezar: si no se llenó el límite, ya no quedan filas
+    <= hasta y el cursor puede avanzar hasta ahí.
+    """
+    hasta = catalogo.confirmado(base)
+    filas = []
+    if limite <= 0:
+        return filas, despues_de
+    for nombre, id_max in catalogo.para_rango(base, t0, None):
+        if id_max <= despues_de:
+            continue
+        filas.extend(con.execute(sql.format(tabla=nombre), (*params, despues_de, hasta, limite)).fetchall())
+    filas.sort(key=lambda f: f[0])
+    return filas[:limite], hasta
+
+
+def todas(con, catalogo: Catalogo, base: str, sql: str, params: tuple, t0=None, t1=None) -> list:
+    """
+    Concatena el resultado de `sql` (con {tabla}) en cada partición del rango.
+    """
+    filas = []
+    for nombre, _ in catalogo.para_rango(base, t0, t1):
+        filas.extend(con.execute(sql.format(tabla=nombre), params).fetchall())
+    return filas
@@ -0,0 +1,162 @@
+import math
+
+from app import ids
+
+# Resoluciones mantenidas (segundos): 1 min y 1 h
+RESOLUCIONES = (60, 3600)
+
+# Prefijo de columnas en rollup_muestras -> índice de la métrica en la fila
+# de muestras con id: (id, ts, machine_id, actuator_id, temp, rpm, vib)
+PREFIJOS = (("temp", 4), ("rpm", 5), ("vib", 6))
+
+ESTADOS = ("normal", "warning", "critical")
+
+# Por métrica: suma, m2 (suma de cuadrados de las desviaciones a la media,
+# como en Welford), min, max y último. "Último" es la fila de mayor (ts en
+# ms, id), igual que en las consultas sobre las tablas crudas.
+_COLUMNAS_MUESTRAS = ["machine_id", "actuator_id", "resolucion", "cubeta", "n", "t_ultimo", "id_ultimo"] + [
+    f"{p}_{c}" for p, _ in PREFIJOS for c in ("suma", "m2", "min", "max", "ultimo")
+]
+
+# m2 se combina con la fórmula de Chan (ver combinar_m2). En el SET todas
+# las expresiones ven los valores previos de la fila.
+_MAS_NUEVO = "(excluded.t_ultimo, excluded.id_ultimo) > (t_ultimo, id_ultimo)"
+SQL_UPSERT_ROLLUP_MUESTRAS = (
+    f"INSERT INTO rollup_muestras ({', '.join(_COLUMNAS_MUESTRAS)}) "
+    f"VALUES ({', '.join('?' * len(_COLUMNAS_MUESTRAS))}) "
+    f"ON CONFLICT (machine_id, actuator_id, resolucion, cubeta) DO UPDATE SET "
+    f"n = n + excluded.n, "
+    f"t_ultimo = CASE WHEN {_MAS_NUEVO} THEN excluded.t_ultimo ELSE t_ultimo END, "
+    f"id_ultimo = CASE WHEN {_MAS_NUEVO} THEN excluded.id_ultimo ELSE id_ultimo END, "
+    + ", ".join(
+        f"{p}_suma = {p}_suma + excluded.{p}_suma, "
+        f"{p}_m2 = {p}_m2 + excluded.{p}_m2 + ({p}_suma / n - excluded.{p}_suma / excluded.n) "
+        f"* ({p}_suma / n - excluded.{p}_suma / excluded.n) * n * excluded.n / (n + excluded.n), "
+        f"{p}_min = MIN({p}_min, excluded.{p}_min), "
+        f"{p}_max = MAX({p}_max, excluded.{p}_max), "
+        f"{p}_ultimo = CASE WHEN {_MAS_NUEVO} THEN excluded.{p}_ultimo ELSE {p}_ultimo END"
+        for p, _ in PREFIJOS
+    )
+)
+
+SQL_UPSERT_ROLLUP_DIAGNOSTICOS = (
+    "INSERT INTO rollup_diagnosticos (machine_id, actuator_id, resolucion, cubeta, n, n_normal, n_warning, n_critical) "
+    "VALUES (?,?,?,?,?,?,?,?) "
+    "ON CONFLICT (machine_id, actuator_id, resolucion, cubeta) DO UPDATE SET "
+    "n = n + excluded.n, n_normal = n_normal + excluded.n_normal, "
+    "n_warning = n_warning + excluded.n_warning, n_critical = n_critical + excluded.n_critical"
+)
+
+SQL_ROLLUP_MUESTRAS = (
+    f"SELECT {', '.join(_COLUMNAS_MUESTRAS[3:])} FROM rollup_muestras "
+    f"WHERE machine_id=? AND actuator_id=? AND resolucion=? AND cubeta BETWEEN ? AND ? ORDER BY cubeta"
+)
+
+SQL_ROLLUP_DIAGNOSTICOS = (
+    "SELECT cubeta, n, n_normal, n_warning, n_critical FROM rollup_diagnosticos "
+    "WHERE machine_id=? AND actuator_id=? AND resolucion=? AND cubeta BETWEEN ? AND ? ORDER BY cubeta"
+)
+
+
+def combinar_m2(n1: int, suma1: float, m2_1: float, n2: int, suma2: float, m2_2: float) -> float:
+    """
+    m2 de la unión de dos grupos (Chan et al.): no resta cuadrados grandes,
+    así una serie constante da m2 = 0 y no ruido de redondeo.
+    """
+    delta = suma2 / n2 - suma1 / n1
+    return m2_1 + m2_2 + delta * delta * n1 * n2 / (n1 + n2)
+
+
+def resumir(n: int, metricas: list) -> list:
+    """
+    [(suma, m2, min, max, último)] por métrica -> [{min,max,mean,std,last}].
+    """
+    return [
+        {"min": mn, "max": mx, "mean": suma / n, "std": math.sqrt(max(m2, 0.0) / n), "last": ultimo}
+        for suma, m2, mn, mx, ultimo in metricas
+    ]
+
+
+def filas_rollup_muestras(filas: list) -> list:
+    """
+    Agrega en memoria un lote de filas de muestras tal como se guardan (con
+    id, ts en ms, ids enteros) a una fila de upsert por (actuador,
+    resolución, cubeta). m2 en dos pasadas: primero la media, después las
+    desviaciones.
+    """
+    grupos = {}
+    for f in filas:
+        t = f[1] // 1000
+        for res in RESOLUCIONES:
+            grupos.setdefault((f[2], f[3], res, t // res * res), []).append(f)
+
+    salida = []
+    for clave, fs in grupos.items():
+        ultima = max(fs, key=lambda f: (f[1], f[0]))
+        fila = [*clave, len(fs), ultima[1], ultima[0]]
+        for _, i in PREFIJOS:
+            xs = [f[i] for f in fs]
+            suma = math.fsum(xs)
+            media = suma / len(xs)
+            fila += [suma, math.fsum((x - media) * (x - media) for x in xs), min(xs), max(xs), ultima[i]]
+        salida.append(tuple(fila))
+    return salida
+
+
+def filas_rollup_diagnosticos(filas: list) -> list:
+    """
+    Ídem para diagnósticos (filas con id): conteo total y por estado.
+    """
+    acc = {}
+    for f in filas:
+        t = f[1] // 1000
+        estado = ids.estados.nombre(f[4])
+        for res in RESOLUCIONES:
+            a = acc.setdefault((f[2], f[3], res, t // res * res), [0, 0, 0, 0])
+            a[0] += 1
+            if estado in ESTADOS:
+                a[1 + ESTADOS.index(estado)] += 1
+    return [(*clave, *a) for clave, a in acc.items()]
+
+
+def resolucion_para(bucket_seg: int):
+    """
+    Mayor resolución mantenida que divide al bucket, o None si no hay
+    (entonces hay que agregar desde las tablas crudas).
+    """
+    for res in sorted(RESOLUCIONES, reverse=True):
+        if bucket_seg % res == 0:
+            return res
+    return None
+
+
+def reagrupar_muestras(rows: list, bucket_seg: int) -> list:
+    """
+    Filas de SQL_ROLLUP_MUESTRAS -> [(cubeta, n, [{min,max,mean,std,last} por
+    métrica, en el orden de PREFIJOS])] re-agregadas al bucket pedido. O(filas de rollup), no O(muestras).
+    """
+    salida = []
+    actual = None
+    for r in rows:
+        c = r[0] // bucket_seg * bucket_seg
+        if actual is None or actual[0] != c:
+            actual = [c, 0, None, [None] * len(PREFIJOS)]
+            salida.append(actual)
+        n, ultimo = r[1], (r[2], r[3])
+        nuevo = actual[2] is None or ultimo > actual[2]
+        for k, m in enumerate(actual[3]):
+            suma, m2, mn, mx, valor = r[4 + 5 * k: 9 + 5 * k]
+            if m is None:
+                actual[3][k] = [suma, m2, mn, mx, valor]
+                continue
+            m[1] = combinar_m2(actual[1], m[0], m[1], n, suma, m2)
+            m[0] += suma
+            m[2] = min(m[2], mn)
+            m[3] = max(m[3], mx)
+            if nuevo:
+                m[4] = valor
+        actual[1] += n
+        if nuevo:
+            actual[2] = ultimo
+
+    return [(c, n, resumir(n, metricas)) for c, n, _, metricas in salida]
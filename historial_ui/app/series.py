@@ -0,0 +1,109 @@
+from datetime import datetime, timezone
+from functools import lru_cache
+
+# Sufijos aceptados en el parámetro bucket (1s, 10s, 1m, 5m, 1h, 1d)
+UNIDADES_SEG = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+METRICAS = ("motor_temp_c", "motor_rpm", "motor_vibration_rms")
+
+# ts se guarda como epoch en ms (INTEGER); segundos epoch dentro de SQLite
+EPOCH_TS = "(ts / 1000)"
+
+# Sin desde/hasta el rango queda abierto
+EPOCH_MIN, EPOCH_MAX = -(1 << 62), 1 << 62
+
+
+def parsear_bucket(texto: str) -> int:
+    """
+    "1s" / "5m" / "1h" / "1d" (o segundos a secas) -> segundos del bucket.
+    Lanza ValueError si no es válido.
+    """
+    t = (texto or "").strip().lower()
+    if t.isdigit():
+        seg = int(t)
+    elif t[:-1].isdigit() and t[-1:] in UNIDADES_SEG:
+        seg = int(t[:-1]) * UNIDADES_SEG[t[-1]]
+    else:
+        raise ValueError(f"bucket inválido: {texto!r} (ej. 1s, 1m, 1h)")
+    if seg < 1:
+        raise ValueError("bucket debe ser de al menos 1s")
+    return seg
+
+
+def ts_a_epoch(texto: str) -> int:
+    """
+    ts ISO-8601 -> segundos epoch (sin zona se asume UTC). Lanza ValueError.
+    """
+    t = datetime.fromisoformat(texto)
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=timezone.utc)
+    return int(t.timestamp())
+
+
+def epoch_a_ts(seg: int) -> str:
+    return datetime.fromtimestamp(seg, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+# Las conversiones de ts se cachean: todos los actuadores de un mismo
+# instante comparten ts, así que se repiten mucho dentro de cada lote
+@lru_cache(maxsize=1 << 16)
+def ts_a_ms(texto: str) -> int:
+    """
+    ts ISO-8601 -> epoch en ms, como se guarda en la base. Lanza ValueError.
+    """
+    t = datetime.fromisoformat(texto)
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=timezone.utc)
+    return round(t.timestamp() * 1000)
+
+
+@lru_cache(maxsize=1 << 16)
+def ms_a_ts(ms: int) -> str:
+    # Milisegundos en el texto sólo si los hay
+    t = datetime.fromtimestamp(ms / 1000, timezone.utc)
+    if ms % 1000:
+        return t.strftime("%Y-%m-%dT%H:%M:%S.") + f"{ms % 1000:03d}Z"
+    return t.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def rango_ms(t0: int, t1: int) -> tuple:
+    """
+    Rango en segundos epoch [t0, t1] -> rango de ts en ms (hasta el último
+    ms del segundo t1), sin salirse de EPOCH_MIN/EPOCH_MAX.
+    """
+    return max(t0 * 1000, EPOCH_MIN), min(t1 * 1000 + 999, EPOCH_MAX)
+
+
+def lttb(xs: list, ys: list, puntos: int) -> list:
+    """
+    Largest-Triangle-Three-Buckets: índices de `puntos` filas que conservan
+    la forma visual de la serie (siempre incluye la primera y la última).
+    """
+    n = len(xs)
+    if puntos >= n or puntos < 3:
+        return list(range(n))
+
+    elegidos = [0]
+    paso = (n - 2) / (puntos - 2)
+    a = 0
+    for i in range(puntos - 2):
+        # Promedio del bucket siguiente (el tercer vértice del triángulo)
+        ini_sig = int((i + 1) * paso) + 1
+        fin_sig = min(int((i + 2) * paso) + 1, n)
+        cnt = fin_sig - ini_sig
+        x_med = sum(xs[ini_sig:fin_sig]) / cnt
+        y_med = sum(ys[ini_sig:fin_sig]) / cnt
+
+        # En el bucket actual, el punto que forma el triángulo de mayor área
+        ini, fin = int(i * paso) + 1, int((i + 1) * paso) + 1
+        xa, ya = xs[a], ys[a]
+        mejor, area_max = ini, -1.0
+        for j in range(ini, fin):
+            area = abs((xa - x_med) * (ys[j] - ya) - (xa - xs[j]) * (y_med - ya))
+            if area > area_max:
+                mejor, area_max = j, area
+        elegidos.append(mejor)
+        a = mejor
+
+    elegidos.append(n - 1)
+    return elegidos
@@ -1,7 +1,15 @@
+import json
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 import pandas as pd
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from app.ultimos import SEVERIDAD
 
 # =========================
 # Configuración fija
@@ -14,15 +22,39 @@ INTERVALO_UI_SEG = 1  # fijo 1s
 
 LIMITE_SAMPLES = 120
 LIMITE_DIAG = 80
+PUNTOS_RANGO = 400  # filas del frame de señales en rangos largos
+SSE_SESION_SEG = 30  # sin refrescos de la página por este tiempo, se cierra el stream
+
+HTTP_POOL = 8        # conexiones keep-alive e hilos para pedir en paralelo
+CACHE_SEG = 1        # respuestas compartidas entre sesiones (una por refresco)
+CACHE_RANGO_SEG = 60 # rangos largos: la clave ya cambia cuando hay un punto nuevo
+
+# Rango de los gráficos: None = últimas LIMITE_SAMPLES muestras crudas
+RANGOS_SENALES = {"Últimas muestras": None, "Última hora": 3600, "Últimas 24 h": 86400}
 
 ACTUADORES = ["base", "hombro", "codo"]
 
 # =========================
 # Helpers HTTP
 # =========================
+@st.cache_resource
+def sesion_http():
+    # Una sola sesión (pool keep-alive) para todas las pestañas del servidor
+    s = requests.Session()
+    adaptador = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL)
+    s.mount("http://", adaptador)
+    return s
+
+@st.cache_resource
+def ejecutor_http():
+    return ThreadPoolExecutor(max_workers=HTTP_POOL, thread_name_prefix="ui-http")
+
+HTTP = sesion_http()
+POOL = ejecutor_http()
+
 def safe_get(url, params=None, timeout=6):
     try:
-        r = requests.get(url, params=params, timeout=timeout)
+        r = HTTP.get(url, params=params, timeout=timeout)
         r.raise_for_status()
         return r.json(), None
     except Exception as e:
@@ -30,24 +62,173 @@ def safe_get(url, params=None, timeout=6):
 
 def safe_post(url, params=None, json=None, timeout=6):
     try:
-        r = requests.post(url, params=params, json=json, timeout=timeout)
+        r = HTTP.post(url, params=params, json=json, timeout=timeout)
         r.raise_for_status()
         return r.json(), None
     except Exception as e:
         return None, str(e)
 
+@st.cache_data(ttl=CACHE_SEG, show_spinner=False)
+def get_cacheado(url, params=None, timeout=6):
+    # Con N operadores mirando la misma máquina, un solo GET por refresco
+    return safe_get(url, params=params, timeout=timeout)
+
+@st.cache_data(ttl=CACHE_RANGO_SEG, show_spinner=False)
+def get_rango(url, params=None, timeout=8):
+    return safe_get(url, params=params, timeout=timeout)
+
+def en_paralelo(tareas: dict) -> dict:
+    """
+    {clave: (función, *args)} -> {clave: resultado}, todas a la vez en el
+    pool. Los hilos heredan el contexto de la sesión (para st.cache_data).
+    """
+    ctx = get_script_run_ctx()
+
+    def correr(f, args):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return f(*args)
+
+    futuros = {k: POOL.submit(correr, f, args) for k, (f, *args) in tareas.items()}
+    return {k: fut.result() for k, fut in futuros.items()}
+
+# =========================
+# Stream en vivo (SSE)
+# =========================
+class EnVivo:
+    """
+    Suscripción a /api/v1/stream de una sesión del dashboard. Un hilo
+    mantiene en memoria las últimas muestras y diagnósticos de la máquina;
+    cada refresco dibuja desde aquí en vez de volver a pedir las ventanas.
+    Si el stream se corta, listo=False y la página vuelve a leer por HTTP.
+    """
+
+    def __init__(self, machine_id):
+        self.machine_id = machine_id
+        self.listo = False       # ventana inicial cargada y stream al día
+        self.error = None
+        self.activo = True
+        self.visto = time.time()  # último refresco de la página (sesión viva)
+        self._lock = threading.Lock()
+        self._muestras = {}      # actuador -> deque de items
+        self._diagnosticos = {}  # actuador -> deque de items
+        self._ultimos = {}       # actuador -> último diagnóstico
+        self._id_max = {}        # (tipo, actuador) -> mayor id aplicado
+        self._resp = None
+        threading.Thread(target=self._bucle, daemon=True).start()
+
+    def cerrar(self):
+        self.activo = False
+        if self._resp is not None:
+            self._resp.close()
+
+    def muestras(self, act) -> list:
+        with self._lock:
+            return list(self._muestras.get(act, ()))
+
+    def diagnosticos(self, act) -> list:
+        with self._lock:
+            return list(self._diagnosticos.get(act, ()))
+
+    def ultimos(self) -> dict:
+        with self._lock:
+            return dict(self._ultimos)
+
+    def _recargar(self):
+        # Al conectar sin poder reanudar el stream. De lo que ya hay en
+        # memoria se piden sólo las filas nuevas (after_id); si faltan más
+        # que la ventana, o no hay nada, se trae la ventana completa.
+        with self._lock:
+            id_max = dict(self._id_max)
+        pedidos = {"bulk": POOL.submit(safe_get, f"{API_URL}/api/v1/latest/bulk", {"machine_id": self.machine_id})}
+        for act in ACTUADORES:
+            for tipo, limite in (("samples", LIMITE_SAMPLES), ("diagnostics", LIMITE_DIAG)):
+                params = {"machine_id": self.machine_id, "actuator_id": act, "limite": limite}
+                if (tipo, act) in id_max:
+                    params["after_id"] = id_max[(tipo, act)]
+                pedidos[(tipo, act)] = POOL.submit(safe_get, f"{API_URL}/api/v1/{tipo}", params, 8)
+        respuestas = {k: f.result() for k, f in pedidos.items()}
+        errores = [err for _, err in respuestas.values() if err]
+        if errores:
+            raise RuntimeError(errores[0])
+
+        for (tipo, act), (j, _) in list(respuestas.items())[1:]:
+            if j.get("mas"):
+                j, err = safe_get(
+                    f"{API_URL}/api/v1/{tipo}", {"machine_id": self.machine_id, "actuator_id": act,
+                                                 "limite": LIMITE_SAMPLES if tipo == "samples" else LIMITE_DIAG}, 8,
+                )
+                if err:
+                    raise RuntimeError(err)
+            if "cursor" not in j:
+                # Ventana completa: reemplaza lo que hubiera
+                with self._lock:
+                    self._id_max.pop((tipo, act), None)
+                    (self._muestras if tipo == "samples" else self._diagnosticos).pop(act, None)
+            self._aplicar(tipo, j.get("items", []))
+        with self._lock:
+            self._ultimos.update({d.get("actuator_id"): d for d in respuestas["bulk"][0].get("items", [])})
+
+    def _aplicar(self, tipo, items):
+        # Los ids evitan duplicar lo que llegó a la vez por la recarga y el stream
+        with self._lock:
+            for it in items:
+                act = it.get("actuator_id")
+                clave = (tipo, act)
+                if it.get("id") is not None and it["id"] <= self._id_max.get(clave, 0):
+                    continue
+                self._id_max[clave] = it.get("id") or self._id_max.get(clave, 0)
+                if tipo == "samples":
+                    self._muestras.setdefault(act, deque(maxlen=LIMITE_SAMPLES)).append(it)
+                else:
+                    self._diagnosticos.setdefault(act, deque(maxlen=LIMITE_DIAG)).append(it)
+                    self._ultimos[act] = it
+
+    def _bucle(self):
+        ultimo_id = None
+        while self.activo:
+            try:
+                headers = {"Last-Event-ID": ultimo_id} if ultimo_id else {}
+                with requests.get(
+                    f"{API_URL}/api/v1/stream", params={"machine_id": self.machine_id},
+                    headers=headers, stream=True, timeout=(5, 60),
+                ) as r:
+                    r.raise_for_status()
+                    self._resp = r
+                    evento = {}
+                    for linea in r.iter_lines(decode_unicode=True):
+                        # Sesión cerrada en el navegador: no quedan refrescos
+                        if not self.activo or time.time() - self.visto > SSE_SESION_SEG:
+                            self.activo = False
+                            break
+                        if linea:
+                            campo, _, valor = linea.partition(":")
+                            if campo:
+                                evento[campo] = valor.lstrip(" ")
+                            continue
+                        datos = json.loads(evento.get("data") or "{}")
+                        if evento.get("event") == "hola":
+                            if not datos.get("reanudado"):
+                                self._recargar()
+                            self.listo, self.error = True, None
+                        elif evento.get("event") in ("samples", "diagnostics"):
+                            self._aplicar(evento["event"], datos.get("items", []))
+                        # Recién aplicado el evento se avanza el punto de reanudación
+                        if "id" in evento:
+                            ultimo_id = evento["id"]
+                        evento = {}
+            except Exception as e:
+                self.error = str(e)
+            self.listo = False
+            if self.activo:
+                time.sleep(2)
+
+
 # =========================
 # Helpers UI (chips / colores)
 # =========================
 def severidad_estado(state: str) -> int:
-    s = (state or "").lower()
-    if s == "critical":
-        return 3
-    if s == "warning":
-        return 2
-    if s == "normal":
-        return 1
-    return 0
+    # La misma tabla que ordena la vista de flota de la API
+    return SEVERIDAD.get((state or "").lower(), 0)
 
 def color_estado(state: str) -> str:
     s = (state or "").lower()
@@ -57,7 +238,9 @@ def color_estado(state: str) -> str:
         return "#fb8c00"   # naranjo
     if s == "normal":
         return "#43a047"   # verde
-    return "#616161"       # gris
+    if s == "stale":
+        return "#8d6e63"   # café (sin datos recientes)
+    return "#616161"       # gris (offline / desconocido)
 
 def emoji_estado(state: str) -> str:
     s = (state or "").lower()
@@ -67,6 +250,10 @@ def emoji_estado(state: str) -> str:
         return "🟠"
     if s == "normal":
         return "🟢"
+    if s == "stale":
+        return "⏳"
+    if s == "offline":
+        return "⚫"
     return "⚪"
 
 def chip(texto: str, color: str):
@@ -171,6 +358,33 @@ st.caption("Actualización fija: adquisición = 1s, UI = 1s. Actuadores: base /
 
 machine_id = st.text_input("ID del brazo (machine_id)", value="arm_01")
 
+# Una suscripción al stream por sesión (se rehace si cambia la máquina)
+vivo = st.session_state.get("en_vivo")
+if vivo is None or vivo.machine_id != machine_id or not vivo.activo:
+    if vivo is not None:
+        vivo.cerrar()
+    vivo = st.session_state["en_vivo"] = EnVivo(machine_id)
+vivo.visto = time.time()
+
+# Todo lo que la página necesita se pide en paralelo al principio. Los
+# selectores más abajo tienen key: su valor ya está en session_state al
+# empezar el refresco, así sus datos entran en el mismo lote.
+rango_seg = RANGOS_SENALES[st.session_state.get("rango", next(iter(RANGOS_SENALES)))]
+act_diag = st.session_state.get("act_diag", ACTUADORES[1])
+
+tareas = {
+    "adq": (get_cacheado, f"{ADQ_URL}/api/v1/health"),
+    "hist": (get_cacheado, f"{API_URL}/api/v1/health"),
+}
+if not vivo.listo:
+    # Sin stream: lo que normalmente llega por eventos se lee por HTTP
+    tareas["bulk"] = (get_cacheado, f"{API_URL}/api/v1/latest/bulk", {"machine_id": machine_id})
+    tareas["diag"] = (
+        get_cacheado, f"{API_URL}/api/v1/diagnostics",
+        {"machine_id": machine_id, "actuator_id": act_diag, "limite": LIMITE_DIAG}, 8,
+    )
+respuestas = en_paralelo(tareas)
+
 # =========================
 # Control de adquisición (solo 2 botones)
 # =========================
@@ -179,7 +393,7 @@ st.subheader("Control de adquisición")
 cA, cB = st.columns([1.2, 3.0])
 
 with cA:
-    j_adq, err_adq = safe_get(f"{ADQ_URL}/api/v1/health")
+    j_adq, err_adq = respuestas["adq"]
     if err_adq:
         chip("Adquisición: NO conectada", color_estado("critical"))
         st.write(f"⚠️ {err_adq}")
@@ -198,7 +412,7 @@ with cA:
 
         st.caption(f"Enviados: {j_adq.get('enviado_total', 0)}")
 
-    j_hist, err_hist = safe_get(f"{API_URL}/api/v1/health")
+    j_hist, err_hist = respuestas["hist"]
     if err_hist:
         chip("Historial: NO conectado", color_estado("critical"))
         st.write(f"⚠️ {err_hist}")
@@ -242,16 +456,24 @@ latest_por_actuador = {}
 estado_global = "normal"
 act_criticos = []
 sin_datos = []
+act_silencio = []   # stale/offline según el detector de latidos del historial
+
+# Con el stream al día sale de memoria; si no, una sola llamada trae el
+# último diagnóstico de todos los actuadores
+if vivo.listo:
+    latest_bulk, err_bulk = vivo.ultimos(), None
+else:
+    j_bulk, err_bulk = respuestas["bulk"]
+    latest_bulk = {d.get("actuator_id"): d for d in (j_bulk or {}).get("items", [])}
 
 for act in ACTUADORES:
-    j, err = safe_get(f"{API_URL}/api/v1/latest", params={"machine_id": machine_id, "actuator_id": act})
-    if err:
-        latest_por_actuador[act] = {"state": "unknown", "error": err}
+    if err_bulk:
+        latest_por_actuador[act] = {"state": "unknown", "error": err_bulk}
         sin_datos.append(act)
         estado_global = max_estado(estado_global, "warning")
         continue
 
-    latest = j.get("latest") if isinstance(j, dict) and "latest" in j else j
+    latest = latest_bulk.get(act)
     if not isinstance(latest, dict):
         latest_por_actuador[act] = {"state": "unknown", "ts": "-", "reasons": [], "metrics": {}, "actuator_id": act}
         sin_datos.append(act)
@@ -263,6 +485,8 @@ for act in ACTUADORES:
     estado_global = max_estado(estado_global, st_act)
     if (st_act or "").lower() == "critical":
         act_criticos.append(act)
+    elif (st_act or "").lower() in ("stale", "offline"):
+        act_silencio.append(f"{act} ({st_act})")
 
 colG1, colG2 = st.columns([1.2, 3.0])
 with colG1:
@@ -271,6 +495,8 @@ with colG1:
 with colG2:
     if act_criticos:
         st.error(f"🚨 Recomendación: DETENER ROBOT. Actuadores críticos: {', '.join(act_criticos)}")
+    elif act_silencio:
+        st.warning(f"📡 Actuadores sin reportar: {', '.join(act_silencio)}. Revisa la adquisición.")
     elif sin_datos:
         st.info(f"⏳ Aún sin datos para: {', '.join(sin_datos)}. Presiona Iniciar demo y espera unos segundos.")
     else:
@@ -337,67 +563,68 @@ st.divider()
 # =========================
 st.subheader("Señales (muestras) — gráficos sobrepuestos")
 
-def cargar_samples_por_actuador(act):
-    j, err = safe_get(
-        f"{API_URL}/api/v1/samples",
-        params={"machine_id": machine_id, "actuator_id": act, "limite": LIMITE_SAMPLES},
-        timeout=8
-    )
-    if err:
-        return None, err
-    items = (j or {}).get("items", [])
-    df = pd.DataFrame(items)
-    if df.empty:
-        return pd.DataFrame(), None
-    df["ts"] = pd.to_datetime(df["ts"])
-    df = df.sort_values("ts")
-    return df, None
+rango_sel = st.radio("Rango", list(RANGOS_SENALES), horizontal=True, key="rango")
+rango_seg = RANGOS_SENALES[rango_sel]
 
-dfs = {}
-errores = []
+# El rango se mide hacia atrás desde el último ts recibido (no desde el reloj)
+ts_ref = max((d.get("ts") for d in latest_bulk.values() if d.get("ts")), default=None)
 
-for act in ACTUADORES:
-    df, err = cargar_samples_por_actuador(act)
-    if err:
-        errores.append(f"{act}: {err}")
-        continue
-    dfs[act] = df
+def marco_en_vivo() -> dict:
+    """
+    Las muestras del stream en la misma forma que /api/v1/samples/frame:
+    ts comunes y, por métrica y actuador, el valor en cada ts (o None).
+    """
+    por_actuador = {act: {m["ts"]: m for m in vivo.muestras(act)} for act in ACTUADORES}
+    ts = sorted(set().union(*por_actuador.values()))
+    return {
+        "ts": ts,
+        "series": {
+            metrica: {act: [filas[t][metrica] if t in filas else None for t in ts] for act, filas in por_actuador.items()}
+            for metrica in ("motor_temp_c", "motor_rpm", "motor_vibration_rms")
+        },
+    }
+
+# Un solo frame alineado para los tres actuadores. Rango largo: la API
+# reduce a PUNTOS_RANGO filas; "hasta" se redondea al ancho de una fila:
+# antes de eso el gráfico no cambia, y la respuesta cacheada sirve a todas
+# las sesiones. Sin rango: las últimas LIMITE_SAMPLES s, del stream si está.
+marco, err_marco = None, None
+if not rango_seg and vivo.listo:
+    marco = marco_en_vivo()
+elif ts_ref:
+    ventana = rango_seg or LIMITE_SAMPLES
+    paso = max(ventana // PUNTOS_RANGO, 1) if rango_seg else 1
+    hasta = -(-int(pd.Timestamp(ts_ref).timestamp()) // paso) * paso
+    params = {
+        "machine_id": machine_id,
+        "actuator_ids": ",".join(ACTUADORES),
+        "desde": pd.Timestamp(hasta - ventana, unit="s", tz="UTC").isoformat(),
+        "hasta": pd.Timestamp(hasta, unit="s", tz="UTC").isoformat(),
+    }
+    if rango_seg:
+        marco, err_marco = get_rango(f"{API_URL}/api/v1/samples/frame", {**params, "puntos": PUNTOS_RANGO})
+    else:
+        marco, err_marco = get_cacheado(f"{API_URL}/api/v1/samples/frame", {**params, "bucket": "1s"}, 8)
 
-if errores:
-    st.warning("Algunos actuadores no pudieron cargar samples:\n\n" + "\n".join(errores))
+if err_marco:
+    st.warning(f"No se pudieron cargar las señales: {err_marco}")
 
-def build_overlay(metric_col: str):
-    frames = []
-    for act, df in dfs.items():
-        if df is None or df.empty:
-            continue
-        tmp = df[["ts", metric_col]].copy()
-        tmp["actuator_id"] = act
-        frames.append(tmp)
-    if not frames:
-        return pd.DataFrame()
-    return pd.concat(frames, ignore_index=True)
-
-overlay_temp = build_overlay("motor_temp_c")
-overlay_rpm = build_overlay("motor_rpm")
-overlay_vib = build_overlay("motor_vibration_rms")
-
-def plot_overlay(df_long, title, height=260):
-    if df_long.empty:
+def graficar(metrica, title, height=260):
+    valores = (marco or {}).get("series", {}).get(metrica)
+    if not valores or not marco.get("ts"):
         st.info(f"No hay datos para {title}.")
         return
-    dfp = df_long.pivot_table(index="ts", columns="actuator_id", values=df_long.columns[1], aggfunc="last")
-    dfp = dfp.sort_index()
+    df = pd.DataFrame(valores, index=pd.to_datetime(marco["ts"]), dtype=float)
     st.write(f"**{title}**")
-    st.line_chart(dfp, height=height)
+    st.line_chart(df.interpolate(method="time", limit_area="inside"), height=height)
 
 c1, c2, c3 = st.columns(3)
 with c1:
-    plot_overlay(overlay_temp, "Temperatura (°C)", height=250)
+    graficar("motor_temp_c", "Temperatura (°C)", height=250)
 with c2:
-    plot_overlay(overlay_rpm, "RPM", height=250)
+    graficar("motor_rpm", "RPM", height=250)
 with c3:
-    plot_overlay(overlay_vib, "Vibración RMS", height=250)
+    graficar("motor_vibration_rms", "Vibración RMS", height=250)
 
 st.divider()
 
@@ -405,13 +632,18 @@ st.divider()
 # Diagnósticos
 # =========================
 st.subheader("Historial de diagnósticos (por actuador)")
-act_diag = st.selectbox("Actuador", ACTUADORES, index=1)
+act_diag = st.selectbox("Actuador", ACTUADORES, index=1, key="act_diag")
 
-j, err = safe_get(
-    f"{API_URL}/api/v1/diagnostics",
-    params={"machine_id": machine_id, "actuator_id": act_diag, "limite": LIMITE_DIAG},
-    timeout=8
-)
+if vivo.listo:
+    j, err = {"items": vivo.diagnosticos(act_diag)}, None
+elif "diag" in respuestas:
+    j, err = respuestas["diag"]
+else:
+    j, err = safe_get(
+        f"{API_URL}/api/v1/diagnostics",
+        params={"machine_id": machine_id, "actuator_id": act_diag, "limite": LIMITE_DIAG},
+        timeout=8
+    )
 
 if err:
     st.error(f"No pude leer diagnostics: {err}")
@@ -428,7 +660,7 @@ else:
         st.dataframe(dfd[["ts", "machine_id", "actuator_id", "state", "reasons"]], width="stretch", height=320)
 
 # =========================
-# Auto-refresh fijo 1s
+# Auto-refresh fijo 1s (redibuja desde el stream en memoria)
 # =========================
 if AUTO_UI:
     time.sleep(INTERVALO_UI_SEG)
@@ -0,0 +1,110 @@
+import threading
+import time
+
+from app.series import ts_a_epoch
+
+# Último diagnóstico por actuador, ya en la forma JSON que devuelve la API.
+# ultimos[machine_id][actuator_id] = {"ts": ..., "state": ..., ...}
+ultimos = {}
+
+# Vista de flota: resumen por máquina, recalculado sólo para las máquinas
+# que tocó cada commit. maquinas[machine_id] = {"state", "reasons", "ts_epoch", ...}
+maquinas = {}
+
+# stale/offline los emite el detector de silencio (app/latidos.py)
+SEVERIDAD = {"normal": 1, "stale": 2, "warning": 3, "offline": 4, "critical": 5}
+
+_lock = threading.Lock()
+
+
+def actualizar(diagnosticos: list):
+    """
+    Registra diagnósticos recién commiteados (en orden de inserción).
+    """
+    with _lock:
+        tocadas = set()
+        for d in diagnosticos:
+            ultimos.setdefault(d["machine_id"], {})[d["actuator_id"]] = d
+            tocadas.add(d["machine_id"])
+        for machine_id in tocadas:
+            maquinas[machine_id] = _resumir(machine_id, ultimos[machine_id])
+
+
+def _epoch(ts):
+    try:
+        return ts_a_epoch(ts)
+    except (TypeError, ValueError):
+        return None
+
+
+def _resumir(machine_id: str, actuadores: dict) -> dict:
+    """
+    Peor estado de la máquina, razones activas (de los actuadores que no
+    están normales) y el estado de cada actuador. O(actuadores de la máquina).
+    """
+    peor, razones, items = "normal", [], []
+    for actuator_id in sorted(actuadores):
+        d = actuadores[actuator_id]
+        estado = d.get("state") or "unknown"
+        if SEVERIDAD.get(estado, 0) > SEVERIDAD.get(peor, 0):
+            peor = estado
+        if estado != "normal":
+            razones.extend(r for r in d.get("reasons", []) if r not in razones)
+        items.append({
+            "actuator_id": actuator_id, "state": estado, "reasons": d.get("reasons", []),
+            "ts": d.get("ts"), "ts_epoch": _epoch(d.get("ts")),
+        })
+    vistos = [a["ts_epoch"] for a in items if a["ts_epoch"] is not None]
+    return {
+        "machine_id": machine_id, "state": peor, "reasons": razones,
+        "ts_epoch": max(vistos, default=None), "actuators": items,
+    }
+
+
+def reemplazar(diagnosticos: list):
+    """
+    Recarga completa desde la base (al arrancar).
+    """
+    with _lock:
+        ultimos.clear()
+        maquinas.clear()
+    actualizar(diagnosticos)
+
+
+def obtener(machine_id: str, actuator_id: str):
+    return ultimos.get(machine_id, {}).get(actuator_id)
+
+
+def por_maquina(machine_id: str) -> list:
+    with _lock:
+        actuadores = dict(ultimos.get(machine_id, {}))
+    return [actuadores[a] for a in sorted(actuadores)]
+
+
+def flota(ahora: float = None) -> list:
+    """
+    Todas las máquinas, la peor primero, con la antigüedad (segundos desde
+    el último diagnóstico) calculada al momento de la consulta.
+    """
+    ahora = time.time() if ahora is None else ahora
+    with _lock:
+        resumenes = list(maquinas.values())
+
+    def edad(t):
+        return None if t is None else round(ahora - t, 1)
+
+    salida = []
+    for m in resumenes:
+        salida.append({
+            "machine_id": m["machine_id"],
+            "state": m["state"],
+            "reasons": m["reasons"],
+            "age_s": edad(m["ts_epoch"]),
+            "actuators": [
+                {"actuator_id": a["actuator_id"], "state": a["state"], "reasons": a["reasons"],
+                 "ts": a["ts"], "age_s": edad(a["ts_epoch"])}
+                for a in m["actuators"]
+            ],
+        })
+    salida.sort(key=lambda m: (-SEVERIDAD.get(m["state"], 0), m["machine_id"]))
+    return salida
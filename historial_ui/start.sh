@@ -1,4 +1,5 @@
 #!/bin/sh
 uvicorn app.api:app --host 0.0.0.0 --port 8003 &
-streamlit run app/ui.py --server.port 8501 --server.address 0.0.0.0
+# PYTHONPATH: la UI importa app.ultimos (streamlit sólo agrega app/ al path)
+PYTHONPATH=. streamlit run app/ui.py --server.port 8501 --server.address 0.0.0.0
 
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# Base descartable para toda la sesión; app.db lee RUTA_DB al importarse
+os.environ.setdefault("RUTA_DB", os.path.join(tempfile.mkdtemp(prefix="historial-"), "app.db"))
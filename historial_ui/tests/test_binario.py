@@ -0,0 +1,83 @@
+import math
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from app import api, binario
+
+MAQUINA = "arm_binario"
+CABECERA = {"content-type": binario.TIPO_CONTENIDO}
+
+MUESTRAS = [
+    {"ts": f"2026-02-02T00:00:0{i}.250Z" if i % 2 else f"2026-02-02T00:00:0{i}Z",
+     "machine_id": MAQUINA, "actuator_id": "base" if i < 3 else "codo",
+     "motor_temp_c": 40.5 + i, "motor_rpm": 1000.0 - i, "motor_vibration_rms": 0.125 * i}
+    for i in range(5)
+]
+DIAGNOSTICOS = [
+    {"ts": "2026-02-02T00:00:00Z", "machine_id": MAQUINA, "actuator_id": "base", "state": "warning",
+     "reasons": ["temp_alta", "vib_alta"],
+     "metrics": {"temp_mean": 56.0, "temp_std": 1.5, "rpm_mean": 1000.0, "rpm_std": 2.0, "vib_rms": 0.4}},
+    {"ts": "2026-02-02T00:00:01Z", "machine_id": MAQUINA, "actuator_id": "codo", "state": "normal",
+     "reasons": [],
+     "metrics": {"temp_mean": 40.0, "temp_std": 0.0, "rpm_mean": 900.0, "rpm_std": 0.0, "vib_rms": 0.1}},
+]
+
+
+def test_ida_y_vuelta_muestras():
+    textos, regs = binario.decodificar(binario.codificar_muestras(MUESTRAS), binario.MUESTRAS)
+    assert binario.muestras(textos, regs) == MUESTRAS
+    columnas = {k: [m[k] for m in MUESTRAS] for k in MUESTRAS[0]}
+    assert binario.codificar_columnas_muestras(columnas) == binario.codificar_muestras(MUESTRAS)
+
+
+def test_ida_y_vuelta_diagnosticos():
+    textos, regs = binario.decodificar(binario.codificar_diagnosticos(DIAGNOSTICOS), binario.DIAGNOSTICOS)
+    c = binario.columnas_diagnosticos(textos, regs)
+    for i, d in enumerate(DIAGNOSTICOS):
+        assert (c["ts"][i], c["machine_id"][i], c["actuator_id"][i], c["state"][i]) == \
+            (d["ts"], d["machine_id"], d["actuator_id"], d["state"])
+        assert c["reasons"][i] == d["reasons"]
+        assert {k: c[k][i] for k in binario.METRICAS_DIAGNOSTICO} == d["metrics"]
+
+
+def con_registros(cuerpo: bytes, cambiar) -> bytes:
+    # Rearma el cuerpo tras modificar los registros (la tabla de textos queda igual)
+    _, _, largo, n = binario.CABECERA.unpack_from(cuerpo)
+    inicio = binario.CABECERA.size + largo
+    regs = np.frombuffer(cuerpo, dtype=binario.DTYPES[binario.MUESTRAS], count=n, offset=inicio).copy()
+    cambiar(regs)
+    return cuerpo[:inicio] + regs.tobytes()
+
+
+VALIDO = binario.codificar_muestras(MUESTRAS)
+INVALIDOS = {
+    "truncado": VALIDO[:-1],
+    "cabecera_truncada": VALIDO[:5],
+    "magia": b"XXXX" + VALIDO[4:],
+    "tipo": binario.codificar_diagnosticos(DIAGNOSTICOS),
+    "indice_fuera_de_tabla": con_registros(VALIDO, lambda r: r["actuador"].__setitem__(0, 99)),
+    "no_finito": con_registros(VALIDO, lambda r: r["motor_rpm"].__setitem__(2, math.inf)),
+    "nan": con_registros(VALIDO, lambda r: r["motor_temp_c"].__setitem__(1, math.nan)),
+}
+
+
+@pytest.mark.parametrize("caso", sorted(INVALIDOS))
+def test_cuerpos_invalidos(caso):
+    with pytest.raises(ValueError):
+        binario.decodificar(INVALIDOS[caso], binario.MUESTRAS)
+    with TestClient(api.app) as cliente:
+        r = cliente.post("/api/v1/samples/batch", content=INVALIDOS[caso], headers=CABECERA)
+    assert r.status_code == 422, r.text
+
+
+def test_samples_batch_acepta_binario():
+    with TestClient(api.app) as cliente:
+        r = cliente.post("/api/v1/samples/batch", content=VALIDO, headers=CABECERA)
+        assert r.json() == {"stored": len(MUESTRAS)}
+        r = cliente.post("/api/v1/diagnostics/batch", content=binario.codificar_diagnosticos(DIAGNOSTICOS), headers=CABECERA)
+        assert r.json() == {"stored": len(DIAGNOSTICOS)}
+        items = cliente.get("/api/v1/samples", params={"machine_id": MAQUINA, "actuator_id": "base"}).json()["items"]
+    assert sorted((m["ts"], m["motor_temp_c"]) for m in items) == \
+        [(m["ts"], m["motor_temp_c"]) for m in MUESTRAS if m["actuator_id"] == "base"]
@@ -0,0 +1,48 @@
+from fastapi.testclient import TestClient
+
+from app import api, db
+
+MAQUINA, ACTUADOR = "arm_buckets", "base"
+T0 = 1769904000   # 2026-02-01T00:00:00Z, un día sin otros datos de prueba
+
+
+def muestra(seg: float, temp: float):
+    ts = api.ms_a_ts(round((T0 + seg) * 1000))
+    return {"ts": ts, "machine_id": MAQUINA, "actuator_id": ACTUADOR,
+            "motor_temp_c": temp, "motor_rpm": 1000.1, "motor_vibration_rms": 0.1}
+
+
+def test_crudo_y_rollup_coinciden():
+    lotes = [
+        # el minuto 0 llega desordenado: lo más nuevo por ts viene primero
+        [muestra(59, 5.0)] + [muestra(s, 1.0 + s) for s in range(0, 30)],
+        # mismo ts que la última: gana la de mayor id (la que llega después)
+        [muestra(59, 7.0)],
+        # el minuto 1 queda repartido en dos lotes
+        [muestra(60 + s, 2.0) for s in range(30)],
+        [muestra(90 + s, 3.0) for s in range(30)],
+    ]
+    with TestClient(api.app) as cliente:
+        for lote in lotes:
+            assert cliente.post("/api/v1/samples/batch", json=lote).status_code == 200
+        clave = api.claves(MAQUINA, ACTUADOR)
+        with db.lectura() as con:
+            crudo = api.buckets_muestras(con, clave, 60, None, T0, T0 + 119)
+            rollup = api.buckets_muestras(con, clave, 60, 60, T0, T0 + 119)
+
+    assert [(c, n) for c, n, _ in crudo] == [(c, n) for c, n, _ in rollup] == [(T0, 32), (T0 + 60, 60)]
+    for (_, _, a), (_, _, b) in zip(crudo, rollup):
+        for ma, mb in zip(a, b):
+            assert ma["last"] == mb["last"]
+            assert ma["min"] == mb["min"] and ma["max"] == mb["max"]
+            assert abs(ma["mean"] - mb["mean"]) < 1e-9
+            assert abs(ma["std"] - mb["std"]) < 1e-9
+
+    temp0, rpm0, _ = crudo[0][2]
+    assert temp0["last"] == 7.0
+    # Serie constante: std exactamente 0 por las dos vías
+    assert rpm0["std"] == 0.0 and rollup[0][2][1]["std"] == 0.0
+    assert rollup[1][2][1]["std"] == 0.0
+    # Minuto 1: mitad 2.0, mitad 3.0 -> std 0.5 al combinar los dos lotes
+    assert abs(rollup[1][2][0]["std"] - 0.5) < 1e-12
+    assert crudo[1][2][0]["last"] == rollup[1][2][0]["last"] == 3.0
@@ -0,0 +1,22 @@
+from app import ids
+
+
+def test_mascara_con_razon_repetida():
+    r = ids.Razones()
+    r.agregar(r.reservar(["a", "b"]))
+    assert r.mascara(["a", "a"]) == 1
+    assert r.lista(r.mascara(["a", "a", "b"])) == ["a", "b"]
+
+
+def test_ids_en_orden_de_primera_aparicion():
+    r = ids.Razones()
+    r.agregar(r.reservar(["vib_alta", "temp_alta", "vib_alta"]))
+    assert r.ids == {"vib_alta": 0, "temp_alta": 1}
+    # El orden de la lista es el de bit, no el de cada diagnóstico
+    assert r.lista(r.mascara(["temp_alta", "vib_alta"])) == ["vib_alta", "temp_alta"]
+
+
+def test_reservar_sigue_desde_el_ultimo_id():
+    d = ids.Diccionario("maquinas")
+    d.agregar(d.reservar(["arm_02", "arm_01"]))
+    assert d.reservar(["arm_01", "arm_03"]) == [(3, "arm_03")]
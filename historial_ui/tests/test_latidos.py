@@ -0,0 +1,73 @@
+import math
+import time
+
+from app.latidos import Latidos, RuedaTemporizadores, OFFLINE, STALE, VIVO
+
+A = ("arm_01", "base")
+B = ("arm_01", "codo")
+
+
+def reloj() -> float:
+    # Segundo entero por delante del reloj de la rueda: los vencimientos
+    # caen justo en un tick y el test no depende del redondeo
+    return math.floor(time.monotonic()) + 1.0
+
+
+def test_vivo_stale_offline():
+    t = reloj()
+    lat = Latidos(stale_seg=10, offline_seg=60, tick=1)
+    lat.latido([A, B], t)
+    lat.latido([B], t + 5)
+
+    assert lat.revisar(t + 9) == []
+    assert lat.revisar(t + 10) == [(A, STALE, 10)]
+    assert lat.revisar(t + 15) == [(B, STALE, 10)]
+    assert lat.revisar(t + 59) == []
+    assert lat.revisar(t + 60) == [(A, OFFLINE, 60)]
+    assert lat.revisar(t + 65) == [(B, OFFLINE, 60)]
+    assert lat.resumen() == {VIVO: 0, STALE: 0, OFFLINE: 2}
+    # Offline sin datos nuevos: no hay más transiciones
+    assert lat.revisar(t + 500) == []
+
+
+def test_latido_en_stale_reemplaza_el_temporizador():
+    t = reloj()
+    lat = Latidos(stale_seg=10, offline_seg=60, tick=1)
+    lat.latido([A], t)
+    assert lat.revisar(t + 10) == [(A, STALE, 10)]
+
+    lat.latido([A], t + 15)
+    assert lat.resumen()[VIVO] == 1
+    assert lat.revisar(t + 24) == []
+    assert lat.revisar(t + 25) == [(A, STALE, 10)]
+    # El temporizador de offline de antes del latido (t + 60) ya no vale
+    assert lat.revisar(t + 60) == []
+    assert lat.revisar(t + 75) == [(A, OFFLINE, 60)]
+
+
+def test_latidos_seguidos_no_cambian_de_estado():
+    t = reloj()
+    lat = Latidos(stale_seg=10, offline_seg=60, tick=1)
+    for s in range(0, 100, 3):
+        lat.latido([A], t + s)
+        assert lat.revisar(t + s) == []
+    assert lat.revisar(t + 108) == []
+    assert lat.revisar(t + 109) == [(A, STALE, 10)]
+
+
+def test_atraso_de_mas_de_una_vuelta():
+    t = reloj()
+    lat = Latidos(stale_seg=10, offline_seg=60, tick=1)
+    lat.latido([A], t)
+    # 512 ranuras de 1 s: un atraso de 2000 s da las dos transiciones juntas
+    assert lat.revisar(t + 2000) == [(A, STALE, 2000), (A, OFFLINE, 2000)]
+
+
+def test_vencimiento_mas_alla_de_una_vuelta_no_se_adelanta():
+    t = reloj()
+    rueda = RuedaTemporizadores(ranuras=8, tick=1)
+    rueda.programar("x", t + 20)
+    for s in range(1, 20):
+        assert rueda.avanzar(t + s) == []
+    assert rueda.avanzar(t + 20) == [("x", t + 20)]
+    assert rueda.avanzar(t + 100) == []
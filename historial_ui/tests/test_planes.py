@@ -0,0 +1,60 @@
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import api, db
+
+T0 = datetime(2026, 1, 10, tzinfo=timezone.utc)
+MAQUINAS = [f"arm_{i:02d}" for i in range(3)]
+ACTUADORES = ["base", "codo", "hombro"]
+SEGUNDOS = 600
+
+
+def _filas():
+    for s in range(SEGUNDOS):
+        ts = (T0 + timedelta(seconds=s)).isoformat().replace("+00:00", "Z")
+        for m in MAQUINAS:
+            for a in ACTUADORES:
+                yield ts, m, a
+
+
+@pytest.fixture(scope="module")
+def particiones():
+    """
+    Partición diaria con datos (y estadísticas de ANALYZE), como las que
+    sirven las consultas en producción: {base: nombre de la partición}.
+    """
+    with TestClient(api.app) as cliente:
+        filas = list(_filas())
+        muestras = [
+            {"ts": ts, "machine_id": m, "actuator_id": a, "motor_temp_c": 40.0, "motor_rpm": 1000.0, "motor_vibration_rms": 0.1}
+            for ts, m, a in filas
+        ]
+        diagnosticos = [
+            {"ts": ts, "machine_id": m, "actuator_id": a, "state": "normal", "reasons": [], "metrics": {}}
+            for ts, m, a in filas
+        ]
+        for i in range(0, len(filas), 1000):
+            assert cliente.post("/api/v1/samples/batch", json=muestras[i:i + 1000]).status_code == 200
+            assert cliente.post("/api/v1/diagnostics/batch", json=diagnosticos[i:i + 1000]).status_code == 200
+
+        con = sqlite3.connect(db.RUTA_DB)
+        con.execute("ANALYZE")
+        con.close()
+
+        dia = int(T0.timestamp())
+        yield {
+            base: next(nombre for nombre, p in db.catalogo().particiones[base].items() if p["dia"] == dia)
+            for base in ("muestras", "diagnosticos")
+        }
+
+
+@pytest.mark.parametrize("nombre", list(api.CONSULTAS_INDEXADAS))
+def test_consulta_usa_indice(particiones, nombre):
+    base, sql, params = api.CONSULTAS_INDEXADAS[nombre]
+    if base is not None:
+        assert particiones[base].startswith(f"{base}_p")
+        sql = sql.format(tabla=particiones[base])
+    assert db.usa_indice(sql, params), db.plan_consulta(sql, params)